@@ -6,7 +6,7 @@
 import operator
 
 __version__ = '2.60.7'
-DATABASE_VERSION = 12
+DATABASE_VERSION = 14
 
 # Add here by hand the languages supported!
 # copy paste format from 'grunt makeTranslations'
@@ -59,6 +59,9 @@ def create_tables(create_node=True):
     """
     Override transactor for testing.
     """
+    # the database may have been replaced by a migration or a test
+    transact.reset_stores()
+
     if GLSetting.db_type == 'sqlite' and os.path.exists(GLSetting.db_uri.replace('sqlite:', '').split('?')[0]):
         # Here we instance every model so that __storm_table__ gets set via
         # __new__
@@ -59,6 +59,11 @@ def variableToSQL(var_type, db_type):
             "sqlite": "BLOB",
             "mysql": "BLOB"
         }
+    elif isinstance(var_type, models.LazyJSONVariable):
+        sqlite_type = {
+            "sqlite": "BLOB",
+            "mysql": "BLOB"
+        }
     else:
         raise AssertionError("Invalid var_type: %s" % var_type)
 
@@ -134,6 +139,9 @@ class TableReplacer:
             Receiver_version_9, User_version_9
         from globaleaks.db.update_10_11 import InternalTip_version_10, InternalFile_version_10
         from globaleaks.db.update_11_12 import Node_version_11, ApplicationData_version_11, Context_version_11
+        from globaleaks.db.update_13_14 import Node_version_13, Context_version_13, Receiver_version_13, \
+            Notification_version_13, Comment_version_13, InternalTip_version_13, ApplicationData_version_13, \
+            Stats_version_13
 
         self.old_db_file = old_db_file
         self.new_db_file = new_db_file
@@ -143,22 +151,22 @@ class TableReplacer:
         self.debug_info = "   [%d => %d] " % (start_ver, start_ver + 1)
 
         self.table_history = {
-            'Node' : [ Node_version_5, Node_version_6, Node_version_7, Node_version_9, None, Node_version_11, None, models.Node],
-            'User' : [ User_version_5, User_version_9, None, None, None, models.User, None, None],
-            'Context' : [ Context_version_6, None, Context_version_7, Context_version_8, Context_version_11, None, None, models.Context],
-            'Receiver': [ Receiver_version_7, None, None, Receiver_version_8, Receiver_version_9, models.Receiver, None, None],
-            'ReceiverFile' : [ models.ReceiverFile, None, None, None, None, None, None, None],
-            'Notification': [ Notification_version_7, None, None, Notification_version_8, models.Notification, None, None, None],
-            'Comment': [ Comment_version_5, models.Comment, None, None, None, None, None, None],
-            'InternalTip' : [ InternalTip_version_10, None, None, None, None, None, models.InternalTip, None],
-            'InternalFile' : [ InternalFile_version_7, None, None, InternalFile_version_10, None, None, models.InternalFile, None],
-            'WhistleblowerTip' : [ models.WhistleblowerTip, None, None, None, None, None, None, None],
-            'ReceiverTip' : [ models.ReceiverTip, None, None, None, None, None, None , None],
-            'ReceiverInternalTip' : [ models.ReceiverInternalTip, None, None, None, None, None, None, None],
-            'ReceiverContext' : [ models.ReceiverContext, None, None, None, None, None, None, None],
-            'Message' : [ models.Message, None, None, None, None, None, None, None],
-            'Stats' : [models.Stats, None, None, None, None, None, None, None],
-            'ApplicationData' : [ApplicationData_version_10, None, None, None, None, None, None, models.ApplicationData],
+            'Node' : [ Node_version_5, Node_version_6, Node_version_7, Node_version_9, None, Node_version_11, None, Node_version_13, None, models.Node],
+            'User' : [ User_version_5, User_version_9, None, None, None, models.User, None, None, None, None],
+            'Context' : [ Context_version_6, None, Context_version_7, Context_version_8, Context_version_11, None, None, Context_version_13, None, models.Context],
+            'Receiver': [ Receiver_version_7, None, None, Receiver_version_8, Receiver_version_9, Receiver_version_13, None, None, None, models.Receiver],
+            'ReceiverFile' : [ models.ReceiverFile, None, None, None, None, None, None, None, None, None],
+            'Notification': [ Notification_version_7, None, None, Notification_version_8, Notification_version_13, None, None, None, None, models.Notification],
+            'Comment': [ Comment_version_5, Comment_version_13, None, None, None, None, None, None, None, models.Comment],
+            'InternalTip' : [ InternalTip_version_10, None, None, None, None, None, InternalTip_version_13, None, None, models.InternalTip],
+            'InternalFile' : [ InternalFile_version_7, None, None, InternalFile_version_10, None, None, models.InternalFile, None, None, None],
+            'WhistleblowerTip' : [ models.WhistleblowerTip, None, None, None, None, None, None, None, None, None],
+            'ReceiverTip' : [ models.ReceiverTip, None, None, None, None, None, None , None, None, None],
+            'ReceiverInternalTip' : [ models.ReceiverInternalTip, None, None, None, None, None, None, None, None, None],
+            'ReceiverContext' : [ models.ReceiverContext, None, None, None, None, None, None, None, None, None],
+            'Message' : [ models.Message, None, None, None, None, None, None, None, None, None],
+            'Stats' : [Stats_version_13, None, None, None, None, None, None, None, None, models.Stats],
+            'ApplicationData' : [ApplicationData_version_10, None, None, None, None, None, None, ApplicationData_version_13, None, models.ApplicationData],
         }
 
         for k, v in self.table_history.iteritems():
@@ -179,6 +179,7 @@ def import_memory_variables(store):
 
         GLSetting.memory_copy.exception_email = node.exception_email
         GLSetting.memory_copy.default_language = node.default_language
+        GLSetting.memory_copy.languages_enabled = list(node.languages_enabled)
 
         # Email settings are copyed because they are used when an exception raises
         # and we can't go to check in the DB, because that's shall be exception source
@@ -246,7 +247,6 @@ def apply_cli_options(store):
         node = store.find(Node).one()
         for k, v, in accepted.iteritems():
             setattr(node, k, v)
-        store.commit()
 
     # return configured URL for the log/console output
     node = store.find(Node).one()
@@ -278,3 +278,25 @@ CREATE TABLE stats (
     content BLOB,
     PRIMARY KEY (id)
 );
+
+CREATE INDEX idx_message_receivertip_id ON message (receivertip_id);
+CREATE INDEX idx_message_mark ON message (mark);
+CREATE INDEX idx_comment_internaltip_id ON comment (internaltip_id);
+CREATE INDEX idx_comment_mark ON comment (mark);
+CREATE INDEX idx_internalfile_internaltip_id ON internalfile (internaltip_id);
+CREATE INDEX idx_internalfile_mark ON internalfile (mark);
+CREATE INDEX idx_receiverfile_internaltip_id ON receiverfile (internaltip_id);
+CREATE INDEX idx_receiverfile_internalfile_id ON receiverfile (internalfile_id);
+CREATE INDEX idx_receiverfile_receiver_id ON receiverfile (receiver_id);
+CREATE INDEX idx_receiverfile_receiver_tip_id ON receiverfile (receiver_tip_id);
+CREATE INDEX idx_receiverfile_mark ON receiverfile (mark);
+CREATE INDEX idx_internaltip_context_id ON internaltip (context_id);
+CREATE INDEX idx_internaltip_mark ON internaltip (mark);
+CREATE INDEX idx_receiver_user_id ON receiver (user_id);
+CREATE INDEX idx_receiver_context_receiver_id ON receiver_context (receiver_id);
+CREATE INDEX idx_receiver_internaltip_internaltip_id ON receiver_internaltip (internaltip_id);
+CREATE INDEX idx_receivertip_internaltip_id ON receivertip (internaltip_id);
+CREATE INDEX idx_receivertip_receiver_id ON receivertip (receiver_id);
+CREATE INDEX idx_receivertip_mark ON receivertip (mark);
+CREATE INDEX idx_whistleblowertip_internaltip_id ON whistleblowertip (internaltip_id);
+CREATE INDEX idx_whistleblowertip_receipt_hash ON whistleblowertip (receipt_hash);
@@ -0,0 +1,10 @@
+# -*- encoding: utf-8 -*-
+
+from globaleaks.db.base_updater import TableReplacer
+
+# The 13 release does not change the tables: the schema adds the indexes
+# of the columns looked up by the handlers and the jobs, created with the
+# new database by the TableReplacer, and the data is copied as is.
+
+class Replacer1213(TableReplacer):
+    pass
@@ -0,0 +1,151 @@
+# -*- encoding: utf-8 -*-
+
+from storm.locals import Pickle, Int, Bool, Unicode, DateTime
+
+from globaleaks.db.base_updater import TableReplacer
+from globaleaks.models import Model
+
+# In the 14 release the Pickle columns are replaced by LazyJSON ones: the
+# tables do not change, and the values are converted by copying them from
+# the following models to the current ones.
+
+class Node_version_13(Model):
+    __storm_table__ = 'node'
+    name = Unicode()
+    public_site = Unicode()
+    hidden_service = Unicode()
+    email = Unicode()
+    receipt_salt = Unicode()
+    last_update = DateTime()
+    receipt_regexp = Unicode()
+    languages_enabled = Pickle()
+    default_language = Unicode()
+    description = Pickle()
+    presentation = Pickle()
+    footer = Pickle()
+    subtitle = Pickle()
+    stats_update_time = Int()
+    maximum_namesize = Int()
+    maximum_textsize = Int()
+    maximum_filesize = Int()
+    tor2web_admin = Bool()
+    tor2web_submission = Bool()
+    tor2web_receiver = Bool()
+    tor2web_unauth = Bool()
+    allow_unencrypted = Bool()
+    postpone_superpower = Bool()
+    can_delete_submission = Bool()
+    ahmia = Bool()
+    wizard_done = Bool(default=False)
+    anomaly_checks = Bool(default=False)
+    exception_email = Unicode()
+
+class Context_version_13(Model):
+    __storm_table__ = 'context'
+    unique_fields = Pickle()
+    localized_fields = Pickle()
+    selectable_receiver = Bool()
+    escalation_threshold = Int()
+    tip_max_access = Int()
+    file_max_download = Int()
+    file_required = Bool()
+    tip_timetolive = Int()
+    submission_timetolive = Int()
+    last_update = DateTime()
+    tags = Pickle()
+    name = Pickle()
+    description = Pickle()
+    receiver_introduction = Pickle()
+    fields_introduction = Pickle()
+    select_all_receivers = Bool()
+    postpone_superpower = Bool()
+    can_delete_submission = Bool()
+    maximum_selectable_receivers = Int()
+    require_file_description = Bool()
+    delete_consensus_percentage = Int()
+    require_pgp = Bool()
+    show_small_cards = Bool()
+    presentation_order = Int()
+
+class Receiver_version_13(Model):
+    __storm_table__ = 'receiver'
+    user_id = Unicode()
+    name = Unicode()
+    description = Pickle()
+    gpg_key_info = Unicode()
+    gpg_key_fingerprint = Unicode()
+    gpg_key_status = Unicode()
+    gpg_key_armor = Unicode()
+    gpg_enable_notification = Bool()
+    mail_address = Unicode()
+    can_delete_submission = Bool()
+    postpone_superpower = Bool()
+    receiver_level = Int()
+    last_update = DateTime()
+    tags = Pickle()
+    tip_notification = Bool()
+    comment_notification = Bool()
+    file_notification = Bool()
+    message_notification = Bool()
+    presentation_order = Int()
+
+class Notification_version_13(Model):
+    __storm_table__ = 'notification'
+    server = Unicode()
+    port = Int()
+    username = Unicode()
+    password = Unicode()
+    source_name = Unicode()
+    source_email = Unicode()
+    security = Unicode()
+    encrypted_tip_template = Pickle()
+    encrypted_tip_mail_title = Pickle()
+    plaintext_tip_template = Pickle()
+    plaintext_tip_mail_title = Pickle()
+    encrypted_file_template = Pickle()
+    encrypted_file_mail_title = Pickle()
+    plaintext_file_template = Pickle()
+    plaintext_file_mail_title = Pickle()
+    encrypted_comment_template = Pickle()
+    encrypted_comment_mail_title = Pickle()
+    plaintext_comment_template = Pickle()
+    plaintext_comment_mail_title = Pickle()
+    encrypted_message_template = Pickle()
+    encrypted_message_mail_title = Pickle()
+    plaintext_message_template = Pickle()
+    plaintext_message_mail_title = Pickle()
+    zip_description = Pickle()
+
+class Comment_version_13(Model):
+    __storm_table__ = 'comment'
+    internaltip_id = Unicode()
+    author = Unicode()
+    content = Unicode()
+    system_content = Pickle()
+    type = Unicode()
+    mark = Unicode()
+
+class InternalTip_version_13(Model):
+    __storm_table__ = 'internaltip'
+    context_id = Unicode()
+    wb_fields = Pickle()
+    pertinence_counter = Int()
+    expiration_date = DateTime()
+    last_activity = DateTime()
+    escalation_threshold = Int()
+    access_limit = Int()
+    download_limit = Int()
+    mark = Unicode()
+
+class ApplicationData_version_13(Model):
+    __storm_table__ = 'applicationdata'
+    version = Int()
+    fields = Pickle()
+
+class Stats_version_13(Model):
+    __storm_table__ = 'stats'
+    content = Pickle()
+
+
+class Replacer1314(TableReplacer):
+    pass
@@ -11,6 +11,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.settings import transact, transact_ro, GLSetting
 from globaleaks.handlers.base import BaseHandler
+from globaleaks.utils.apicache import GLApiCache
 from globaleaks.handlers.authentication import authenticated, transport_security_check
 from globaleaks.rest import errors, requests
 from globaleaks.models import Receiver, Context, Node, Notification, User, ApplicationData
@@ -725,6 +726,8 @@ class NodeInstance(BaseHandler):
         # align the memory variables with the new updated data
         yield import_memory_variables()
 
+        GLApiCache.invalidate()
+
         node_description = yield admin_serialize_node(self.request.language)
 
         self.set_status(202) # Updated
@@ -763,6 +766,8 @@ class ContextsCollection(BaseHandler):
 
         response = yield create_context(request, self.request.language)
 
+        GLApiCache.invalidate()
+
         self.set_status(201) # Created
         self.finish(response)
 
@@ -800,6 +805,8 @@ class ContextInstance(BaseHandler):
 
         response = yield update_context(context_id, request, self.request.language)
 
+        GLApiCache.invalidate()
+
         self.set_status(202) # Updated
         self.finish(response)
 
@@ -813,6 +820,8 @@ class ContextInstance(BaseHandler):
         Errors: InvalidInputFormat, ContextIdNotFound
         """
         yield delete_context(context_id)
+
+        GLApiCache.invalidate()
         self.set_status(200)
 
 class ReceiversCollection(BaseHandler):
@@ -852,6 +861,8 @@ class ReceiversCollection(BaseHandler):
 
         response = yield create_receiver(request, self.request.language)
 
+        GLApiCache.invalidate()
+
         self.set_status(201) # Created
         self.finish(response)
 
@@ -896,6 +907,8 @@ class ReceiverInstance(BaseHandler):
 
         response = yield update_receiver(receiver_id, request, self.request.language)
 
+        GLApiCache.invalidate()
+
         self.set_status(201)
         self.finish(response)
 
@@ -911,6 +924,8 @@ class ReceiverInstance(BaseHandler):
         """
         yield delete_receiver(receiver_id)
 
+        GLApiCache.invalidate()
+
         self.set_status(200)
         self.finish()
 
@@ -14,11 +14,12 @@ import time
 
 from twisted.internet import threads
 from twisted.internet.defer import inlineCallbacks
-from cyclone.web import StaticFileHandler
+from cyclone.web import HTTPError
 
 from globaleaks.settings import GLSetting
 from globaleaks.handlers.admstaticfiles import dump_static_file
 from globaleaks.handlers.base import BaseStaticFileHandler
+from globaleaks.handlers.static import file_etag
 from globaleaks.handlers.authentication import transport_security_check, authenticated, unauthenticated
 from globaleaks.utils.utility import log
 from globaleaks.rest import errors
@@ -65,6 +66,9 @@ class LanguageFileHandler(BaseStaticFileHandler):
         self.set_status(201) # Created
         self.finish(dumped_file)
 
+    def langfile_etag(self, path):
+        return file_etag(path, os.stat(path))
+
     @transport_security_check('unauth')
     @unauthenticated
     def get(self, lang):
@@ -73,16 +77,20 @@ class LanguageFileHandler(BaseStaticFileHandler):
         path = self.custom_langfile_path(lang)
         directory_traversal_check(GLSetting.static_path_l10n, path)
 
-        if os.path.exists(path):
-            StaticFileHandler.get(self, path, True)
-        else:
+        if not os.path.exists(path):
             path = self.langfile_path(lang)
             directory_traversal_check(GLSetting.glclient_path, path)
 
             # to reuse use the StaticFile handler we need to change the root path
             self.root = os.path.abspath(os.path.join(GLSetting.glclient_path, 'l10n'))
 
-            StaticFileHandler.get(self, path, True)
+            if not os.path.exists(path):
+                raise HTTPError(404)
+
+        if self.check_etag(self.langfile_etag(path)):
+            return
+
+        return BaseStaticFileHandler.get(self, path)
 
     @transport_security_check('admin')
     @authenticated('admin')
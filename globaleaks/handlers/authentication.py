@@ -5,12 +5,12 @@
 #
 # Files collection handlers and utils
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 from storm.exceptions import NotOneError
 from cyclone.util import ObjectDict as OD
 
 from globaleaks.models import Node, User
-from globaleaks.settings import transact_ro, GLSetting
+from globaleaks.settings import transact, transact_ro, GLSetting
 from globaleaks.models import Receiver, WhistleblowerTip
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.rest import errors, requests
@@ -195,75 +195,212 @@ def transport_security_check(wrapped_handler_role):
     return wrapper
 
 
-@transact_ro # read only transact; manual commit on success needed
-def login_wb(store, receipt):
+@transact_ro
+def get_receipt_salt(store):
+    return store.find(Node).one().receipt_salt
+
+@transact_ro
+def load_receipt_parameters(store):
     """
-    Login wb return the WhistleblowerTip.id
+    @return: a dict with the number of the stored receipt hashes computed
+        with each of the scrypt parameters different from the configured ones
+    """
+    receipt_parameters = {}
+    for receipt_hash in store.find(WhistleblowerTip).values(WhistleblowerTip.receipt_hash):
+        parameters = security.scrypt_parameters(receipt_hash)
+        if parameters != GLSetting.scrypt_parameters:
+            receipt_parameters[parameters] = receipt_parameters.get(parameters, 0) + 1
+
+    return receipt_parameters
+
+@inlineCallbacks
+def get_legacy_receipt_parameters():
+    """
+    @return: the list of the scrypt parameters of the stored receipt hashes
+        different from the configured ones, the most used first, and at
+        most GLSetting.receipt_legacy_parameters_maximum of them. The
+        counters are read from the database only once and then kept in
+        GLSetting.
+    """
+    if GLSetting.receipt_parameters is None:
+        receipt_parameters = yield load_receipt_parameters()
+        if GLSetting.receipt_parameters is None:
+            GLSetting.receipt_parameters = receipt_parameters
+
+    legacy_parameters = sorted(GLSetting.receipt_parameters,
+                               key=GLSetting.receipt_parameters.get, reverse=True)
+
+    returnValue(legacy_parameters[:GLSetting.receipt_legacy_parameters_maximum])
+
+def receipt_rehashed(hashed_receipt):
+    """
+    Accounts a legacy receipt hash replaced by a committed wb_access.
+    """
+    parameters = security.scrypt_parameters(hashed_receipt)
+
+    if GLSetting.receipt_parameters and parameters in GLSetting.receipt_parameters:
+        GLSetting.receipt_parameters[parameters] -= 1
+        if not GLSetting.receipt_parameters[parameters]:
+            del GLSetting.receipt_parameters[parameters]
+
+@transact
+def wb_access(store, hashed_receipts, rehashed_receipt=None):
+    """
+    @param hashed_receipts: the hashes of the receipt computed with each
+        of the scrypt parameters looked up
+
+    @param rehashed_receipt: the receipt hashed with the configured scrypt
+        parameters, replacing the matching hash on success
+
+    @return: the (WhistleblowerTip.id, matching hash) of the receipt,
+        or (False, None)
     """
     try:
-        node = store.find(Node).one()
-        hashed_receipt = security.hash_password(receipt, node.receipt_salt)
         wb_tip = store.find(WhistleblowerTip,
-                            WhistleblowerTip.receipt_hash == unicode(hashed_receipt)).one()
+                            WhistleblowerTip.receipt_hash.is_in(
+                                [unicode(hashed_receipt) for hashed_receipt in hashed_receipts])).one()
     except NotOneError, e:
         # This is one of the fatal error that never need to happen
-        log.err("Expected unique fields (receipt) not unique when hashed %s" % receipt)
-        return False
+        log.err("Expected unique fields (receipt) not unique when hashed %s" % hashed_receipts)
+        return False, None
 
     if not wb_tip:
         log.debug("Whistleblower: Invalid receipt")
-        return False
+        return False, None
 
     log.debug("Whistleblower: Valid receipt")
     wb_tip.last_access = utility.datetime_now()
-    store.commit() # the transact was read only! on success we apply the commit()
-    return unicode(wb_tip.id)
+    hashed_receipt = wb_tip.receipt_hash
+
+    if rehashed_receipt is not None:
+        wb_tip.receipt_hash = unicode(rehashed_receipt)
+
+    return unicode(wb_tip.id), hashed_receipt
+
+@transact_ro
+def get_user_credentials(store, username, role):
+    """
+    @return: the (id, password hash, salt) of the user, or None
+             if the username does not exist with the role
+    """
+    user = store.find(User, User.username == username).one()
+
+    if not user or user.role != role:
+        return None
+
+    return user.id, user.password, user.salt
+
+@transact
+def update_last_login(store, user_id, rehashed_password=None):
+    """
+    @param rehashed_password: the password hashed with the configured
+        scrypt parameters, replacing the stored one
 
+    @return: the id of the receiver of the user, if any
+    """
+    user = store.find(User, User.id == user_id).one()
+    user.last_login = utility.datetime_now()
+
+    if rehashed_password is not None:
+        user.password = unicode(rehashed_password)
+
+    receiver = store.find(Receiver, Receiver.user_id == user_id).one()
+    return receiver.id if receiver else None
+
+# The logins are split in short transactions around the scrypt hashing,
+# that is computed by the crypto thread pool and does not hold a DB thread.
+# The credentials hashed with scrypt parameters different from the
+# configured ones are rehashed on a successful login.
+
+@inlineCallbacks
+def rehash_password(password, hashed_password, salt):
+    """
+    @return: the password hashed with the configured scrypt parameters,
+        or None if hashed_password has already been computed with them
+    """
+    if not security.needs_rehash(hashed_password):
+        returnValue(None)
+
+    rehashed_password = yield security.deferred_hash_password(password, salt)
+    returnValue(rehashed_password)
+
+@inlineCallbacks
+def login_wb(receipt):
+    """
+    Login wb return the WhistleblowerTip.id
+    """
+    receipt_salt = yield get_receipt_salt()
+    hashed_receipt = yield security.deferred_hash_password(receipt, receipt_salt)
+
+    wbtip_id, _ = yield wb_access([hashed_receipt])
+    if wbtip_id:
+        returnValue(wbtip_id)
+
+    # the receipt can belong to a tip hashed with other scrypt parameters:
+    # it is hashed with the ones still in use by a single computation,
+    # queued with the other ones of the crypto pool, and looked up at once.
+    legacy_parameters = yield get_legacy_receipt_parameters()
+    if not legacy_parameters:
+        returnValue(False)
 
-@transact_ro  # read only transact; manual commit on success needed
-def login_receiver(store, username, password):
+    legacy_hashed_receipts = yield security.deferred_hash_password_parameters(
+        receipt, receipt_salt, legacy_parameters)
+
+    wbtip_id, legacy_hashed_receipt = yield wb_access(legacy_hashed_receipts, hashed_receipt)
+    if wbtip_id:
+        log.debug("Whistleblower: receipt rehashed")
+        receipt_rehashed(legacy_hashed_receipt)
+
+    returnValue(wbtip_id)
+
+@inlineCallbacks
+def login_receiver(username, password):
     """
     This login receiver need to collect also the amount of unsuccessful
     consecutive logins, because this element may bring to password lockdown.
 
     login_receiver return the receiver.id
     """
-    receiver_user = store.find(User, User.username == username).one()
+    credentials = yield get_user_credentials(username, 'receiver')
 
-    if not receiver_user or receiver_user.role != 'receiver':
+    if credentials is None:
         log.debug("Receiver: Fail auth, username %s do not exists" % username)
-        return False
+        returnValue(False)
 
-    if not security.check_password(password, receiver_user.password, receiver_user.salt):
+    user_id, hashed_password, salt = credentials
+
+    valid = yield security.deferred_check_password(password, hashed_password, salt)
+    if not valid:
         log.debug("Receiver login: Invalid password")
-        return False
-    else:
-        log.debug("Receiver: Authorized receiver %s" % username)
-        receiver_user.last_login = utility.datetime_now()
-        receiver = store.find(Receiver, (Receiver.user_id == receiver_user.id)).one()
-        store.commit() # the transact was read only! on success we apply the commit()
-        return receiver.id
+        returnValue(False)
 
-@transact_ro  # read only transact; manual commit on success needed
-def login_admin(store, username, password):
+    log.debug("Receiver: Authorized receiver %s" % username)
+    rehashed_password = yield rehash_password(password, hashed_password, salt)
+    receiver_id = yield update_last_login(user_id, rehashed_password)
+    returnValue(receiver_id)
+
+@inlineCallbacks
+def login_admin(username, password):
     """
     login_admin return the 'username' of the administrator
     """
+    credentials = yield get_user_credentials(username, 'admin')
 
-    admin_user = store.find(User, User.username == username).one()
-
-    if not admin_user or admin_user.role != 'admin':
+    if credentials is None:
         log.debug("Receiver: Fail auth, username %s do not exists" % username)
-        return False
+        returnValue(False)
+
+    user_id, hashed_password, salt = credentials
 
-    if not security.check_password(password, admin_user.password, admin_user.salt):
+    valid = yield security.deferred_check_password(password, hashed_password, salt)
+    if not valid:
         log.debug("Admin login: Invalid password")
-        return False
-    else:
-        log.debug("Admin: Authorized admin %s" % username)
-        admin_user.last_login = utility.datetime_now()
-        store.commit() # the transact was read only! on success we apply the commit()
-        return username
+        returnValue(False)
+
+    log.debug("Admin: Authorized admin %s" % username)
+    rehashed_password = yield rehash_password(password, hashed_password, salt)
+    yield update_last_login(user_id, rehashed_password)
+    returnValue(username)
 
 class AuthenticationHandler(BaseHandler):
     """
@@ -7,12 +7,14 @@
 # needings.
 #
 
+import os
 import httplib
 import types
 import collections
 import json
 import re
 import sys
+import time
 import logging
 
 from StringIO import StringIO
@@ -21,7 +23,6 @@ from cryptography.hazmat.primitives.constant_time import bytes_eq
 
 from twisted.python.failure import Failure
 from twisted.internet.defer import inlineCallbacks
-from twisted.internet import fdesc
 
 from cyclone.web import RequestHandler, HTTPError, HTTPAuthenticationRequired, StaticFileHandler, RedirectHandler
 from cyclone.httpserver import HTTPConnection, HTTPRequest, _BadRequestException
@@ -29,11 +30,18 @@ from cyclone import escape, httputil
 from cyclone.escape import native_str, parse_qs_bytes
 
 from globaleaks.jobs.statistics_sched import alarm_level
-from globaleaks.utils.utility import log, log_remove_escapes, log_encode_html, datetime_now, deferred_sleep
+from globaleaks.utils.utility import log, datetime_now, is_expired, \
+    http_log_writer, uniform_delay_wheel
 from globaleaks.utils.mailutils import mail_exception
+from globaleaks.utils.metrics import request_metrics, request_context
+from globaleaks.utils.uploads import GLUploadWriter, ChunkedBodyDecoder
+from globaleaks.utils.streaming import GLStreamProducer, parse_range_header, range_start
+from globaleaks.utils.apicache import etag_matches
 from globaleaks.settings import GLSetting
 from globaleaks.rest import errors
+from globaleaks.rest.validation import template_validator
 from globaleaks.security import GLSecureTemporaryFile
+from globaleaks.handlers.static import GLStaticAssets, accepts_encoding
 
 def validate_host(host_key):
     """
@@ -64,26 +72,154 @@ class GLHTTPServer(HTTPConnection):
 
     def __init__(self):
         self.uploaded_file = {}
+        self._upload_writer = None
+        self._chunked_decoder = None
+        self._upload_chunk = False
+        self._body_length = 0
+        self._pause_reasons = set()
+
+    def pause_reading(self, reason):
+        """
+        Pause the reading of the connection; the transport is resumed only
+        when every reason of pause has been removed by resume_reading.
+        """
+        if not self._pause_reasons and self.transport:
+            self.transport.pauseProducing()
+
+        self._pause_reasons.add(reason)
+
+    def resume_reading(self, reason):
+        if reason not in self._pause_reasons:
+            return
+
+        self._pause_reasons.remove(reason)
+
+        if not self._pause_reasons and self.transport:
+            self.transport.resumeProducing()
 
     def rawDataReceived(self, data):
-        if self.content_length is not None:
-            data, rest = data[:self.content_length], data[self.content_length:]
-            self.content_length -= len(data)
+        if self._contentbuffer is None:
+            # the body has been refused
+            return
+
+        try:
+            if self._chunked_decoder is not None:
+                data, rest = self._chunked_decoder.feed(data)
+                complete = self._chunked_decoder.finished
+
+                # the size of the body can only be checked while it is received
+                self._check_body_size(self._body_length + len(data))
+            elif self.content_length is not None:
+                data, rest = data[:self.content_length], data[self.content_length:]
+                self.content_length -= len(data)
+                complete = self.content_length == 0
+            else:
+                rest = ''
+                complete = False
+        except Exception as exception:
+            self._on_body_refused(exception)
+            return
+
+        self._body_length += len(data)
+
+        if self._upload_writer is not None:
+            self._upload_writer.write(data)
         else:
-            rest = ''
+            self._contentbuffer.write(data)
 
-        self._contentbuffer.write(data)
-        if self.content_length == 0 and self._contentbuffer is not None:
+        if complete:
             tmpbuf = self._contentbuffer
-            self.content_length = self._contentbuffer = None
-            self.setLineMode(rest)
-            tmpbuf.seek(0, 0)
+            self.content_length = self._contentbuffer = self._chunked_decoder = None
+
             if self.file_upload:
-                self._on_request_body(self.uploaded_file)
-                self.file_upload = False
-                self.uploaded_file = {}
-            else:
-                self._on_request_body(tmpbuf.read())
+                self.uploaded_file['body_len'] = self._body_length
+
+            if self._upload_writer is None:
+                self.setLineMode(rest)
+                self._on_content_complete(tmpbuf)
+                return
+
+            # the next request is not parsed until the whole
+            # body of this one has been written on the disk
+            writer, self._upload_writer = self._upload_writer, None
+            self.pause_reading('upload')
+
+            d = writer.close()
+            d.addCallback(self._on_upload_written, rest)
+            d.addErrback(self._on_upload_failed)
+
+    def _on_upload_written(self, tmpbuf, rest):
+        self.resume_reading('upload')
+        self.setLineMode(rest)
+        self._on_content_complete(tmpbuf)
+
+    def _on_upload_failed(self, failure):
+        log.err("Upload from %s failed: %s" % (self._remote_ip, failure.getErrorMessage()))
+        if self._request:
+            self._request.finish()
+        if self.transport:
+            self.transport.loseConnection()
+
+    def _on_body_refused(self, exception):
+        log.msg("Malformed HTTP request body from %s: %s" % (self._remote_ip, exception))
+
+        # the spooled part of the body is deleted
+        tmpbuf, writer = self._contentbuffer, self._upload_writer
+        if writer is not None:
+            writer.close().addBoth(lambda _: tmpbuf.close())
+        else:
+            tmpbuf.close()
+
+        self._contentbuffer = self._upload_writer = self._chunked_decoder = None
+        self.file_upload = False
+        self.uploaded_file = {}
+
+        if self._request:
+            self._request.finish()
+        if self.transport:
+            self.transport.loseConnection()
+
+    def _on_content_complete(self, tmpbuf):
+        tmpbuf.seek(0, 0)
+        if self.file_upload:
+            self._on_request_body(self.uploaded_file)
+            self.file_upload = False
+            self.uploaded_file = {}
+        else:
+            self._on_request_body(tmpbuf.read())
+
+    def _check_body_size(self, length):
+        """
+        @raise HTTPRawLimitReach: if a body of this length is not acceptable
+        """
+        if self._upload_chunk:
+            if length > GLSetting.upload_chunk_maximum_size:
+                log.err("Tried upload chunk larger than expected (%d > %d)" %
+                        (length, GLSetting.upload_chunk_maximum_size))
+
+                raise errors.HTTPRawLimitReach
+
+            return
+
+        megabytes = length / (1024 * 1024)
+
+        if self.file_upload:
+            limit_type = "upload"
+            limit = GLSetting.memory_copy.maximum_filesize
+        else:
+            limit_type = "json"
+            limit = 1000000 # 1MB fixme: add GLSetting.memory_copy.maximum_jsonsize
+            # is 1MB probably too high. probably this variable must be in kB
+
+        # less than 1 megabytes is always accepted
+        if megabytes > limit:
+            log.err("Tried %s request larger than expected (%dMb > %dMb)" %
+                    (limit_type,
+                     megabytes,
+                     limit))
+
+            # In HTTP Protocol errors need to be managed differently than handlers
+            raise errors.HTTPRawLimitReach
 
     def _on_headers(self, data):
         try:
@@ -102,19 +238,41 @@ class GLHTTPServer(HTTPConnection):
                 connection=self, method=method, uri=uri, version=version,
                 headers=headers, remote_ip=self._remote_ip)
 
-            self.content_length = int(headers.get("Content-Length", 0))
+            self._body_length = 0
+            self._chunked_decoder = None
+
+            transfer_encoding = headers.get("Transfer-Encoding", "identity").strip().lower()
+            if transfer_encoding == "chunked":
+                # the Content-Length is ignored, and the length of the body
+                # is checked while it is decoded
+                self._chunked_decoder = ChunkedBodyDecoder()
+                self.content_length = None
+            elif transfer_encoding == "identity":
+                self.content_length = int(headers.get("Content-Length", 0))
+            else:
+                raise _BadRequestException("Unsupported Transfer-Encoding")
+
+            # the chunks of the resumable uploads are small and are appended
+            # to the encrypted file of their upload session by the handler
+            self._upload_chunk = headers.get("Content-Type", "").startswith("application/offset+octet-stream")
 
             # we always use secure temporary files in case of large json or file uploads
-            if self.content_length < 100000 and self._request.headers.get("Content-Disposition") is None:
+            # (or of bodies whose length is not known in advance)
+            self._upload_writer = None
+            if self._upload_chunk or \
+                    (self._chunked_decoder is None and self.content_length < 100000 and \
+                     self._request.headers.get("Content-Disposition") is None):
                 self._contentbuffer = StringIO('')
             else:
                 self._contentbuffer = GLSecureTemporaryFile(GLSetting.tmp_upload_path)
+                # encryption and disk writes are kept out of the reactor thread
+                self._upload_writer = GLUploadWriter(self._contentbuffer, self)
 
             if headers.get("Expect") == "100-continue":
                 self.transport.write("HTTP/1.1 100 (Continue)\r\n\r\n")
 
             c_d_header = self._request.headers.get("Content-Disposition")
-            if c_d_header is not None:
+            if c_d_header is not None and not self._upload_chunk:
                 key, pdict = parse_header(c_d_header)
                 if key != 'attachment' or 'filename' not in pdict:
                     raise _BadRequestException("Malformed Content-Disposition header")
@@ -125,28 +283,14 @@ class GLHTTPServer(HTTPConnection):
                                                                                'application/octet-stream')
 
                 self.uploaded_file['body'] = self._contentbuffer
-                self.uploaded_file['body_len'] = int(self.content_length)
+                self.uploaded_file['body_len'] = int(self.content_length or 0)
                 self.uploaded_file['body_filepath'] = self._contentbuffer.filepath
 
-            megabytes = int(self.content_length) / (1024 * 1024)
+            if self._chunked_decoder is not None:
+                self.setRawMode()
+                return
 
-            if self.file_upload:
-                limit_type = "upload"
-                limit = GLSetting.memory_copy.maximum_filesize
-            else:
-                limit_type = "json"
-                limit = 1000000 # 1MB fixme: add GLSetting.memory_copy.maximum_jsonsize
-                # is 1MB probably too high. probably this variable must be in kB
-
-            # less than 1 megabytes is always accepted
-            if megabytes > limit:
-                log.err("Tried %s request larger than expected (%dMb > %dMb)" %
-                        (limit_type,
-                         megabytes,
-                         limit))
-
-                # In HTTP Protocol errors need to be managed differently than handlers
-                raise errors.HTTPRawLimitReach
+            self._check_body_size(self.content_length)
 
             if self.content_length > 0:
                 self.setRawMode()
@@ -195,6 +339,19 @@ class GLHTTPServer(HTTPConnection):
 class BaseHandler(RequestHandler):
     xsrf_cookie_name = "XSRF-TOKEN"
 
+    def __init__(self, application, request, **kwargs):
+        # the times accounted in the metrics of the request
+        request.db_time = 0.0
+        request.delay_time = 0.0
+
+        RequestHandler.__init__(self, application, request, **kwargs)
+
+    def _execute(self, transforms, *args, **kwargs):
+        # the transactions started while handling the request account
+        # their time to it (see transact)
+        return request_context(self.request, RequestHandler._execute,
+                               self, transforms, *args, **kwargs)
+
     def set_default_headers(self):
         """
         In this function are written some security enforcements
@@ -229,7 +386,9 @@ class BaseHandler(RequestHandler):
 
         lang = self.request.headers.get('GL-Language', None)
 
-        if not lang:
+        # the language is a key of the cached answers: only the enabled
+        # ones are accepted
+        if lang not in GLSetting.memory_copy.languages_enabled:
             # before was used the Client language. but shall be unsupported
             # lang = self.request.headers.get('Accepted-Language', None)
             lang = GLSetting.memory_copy.default_language
@@ -253,73 +412,9 @@ class BaseHandler(RequestHandler):
         # http://stackoverflow.com/questions/7585307/python-hashlib-problem-typeerror-unicode-objects-must-be-encoded-before-hashin
 
 
-    @staticmethod
-    def validate_python_type(value, python_type):
-        """
-        Return True if the python class instantiates the python_type given,
-            'int' fields are accepted also as 'unicode' but cast on base 10
-            before validate them
-            'bool' fields are accepted also as 'true' 'false' because this
-            happen on angular.js
-        """
-        if value is None:
-            return True
-
-        if python_type == int:
-            try:
-                int(value)
-                return True
-            except Exception:
-                return False
-
-        if python_type == bool:
-            if value == u'true' or value == u'false':
-                return True
-
-        return isinstance(value, python_type)
-
-    @staticmethod
-    def validate_GLtype(value, gl_type):
-        """
-        Return True if the python class matches the given regexp.
-        """
-        if isinstance(value, (str, unicode)):
-            return bool(re.match(gl_type, value))
-        else:
-            return False
-
     @staticmethod
     def validate_type(value, gl_type):
-        # if it's callable, than assumes is a primitive class
-        if callable(gl_type):
-            retval = BaseHandler.validate_python_type(value, gl_type)
-            if not retval:
-                log.err("-- Invalid python_type, in [%s] expected %s" % (value, gl_type))
-            return retval
-        # value as "{foo:bar}"
-        elif isinstance(gl_type, collections.Mapping):
-            retval = BaseHandler.validate_jmessage(value, gl_type)
-            if not retval:
-                log.err("-- Invalid JSON/dict [%s] expected %s" % (value, gl_type))
-            return retval
-        # regexp
-        elif isinstance(gl_type, str):
-            retval = BaseHandler.validate_GLtype(value, gl_type)
-            if not retval:
-                log.err("-- Failed Match in regexp [%s] against %s" % (value, gl_type))
-            return retval
-        # value as "[ type ]"
-        elif isinstance(gl_type, collections.Iterable):
-            # empty list is ok
-            if len(value) == 0:
-                return True
-            else:
-                retval = all(BaseHandler.validate_type(x, gl_type[0]) for x in value)
-                if not retval:
-                    log.err("-- List validation failed [%s] of %s" % (value, gl_type))
-                return retval
-        else:
-            raise AssertionError
+        return template_validator(gl_type)(value)
 
     @staticmethod
     def validate_jmessage(jmessage, message_template):
@@ -327,47 +422,18 @@ class BaseHandler(RequestHandler):
         Takes a string that represents a JSON messages and checks to see if it
         conforms to the message type it is supposed to be.
 
-        This message must be either a dict or a list. This function may be called
-        recursively to validate sub-parameters that are also go GLType.
+        This message must be either a dict or a list. The template is
+        compiled in a validator (see compile_template) that checks also
+        the sub-parameters that are also go GLType.
 
         message: the message string that should be validated
 
         message_type: the GLType class it should match.
         """
-        if isinstance(message_template, dict):
-            valid_jmessage = {}
-            for key in message_template.keys():
-                if key not in jmessage:
-                    log.err('validate_message: key %s not in %s' % (key, jmessage))
-                    raise errors.InvalidInputFormat('wrong schema: missing %s' % key)
-                else:
-                    valid_jmessage[key] = jmessage[key]
-
-            if GLSetting.loglevel == "DEBUG":
-                # check if wrong keys are reaching the GLBackend, they are
-                # stripped in the previous loop, because valid_jmessage is returned
-                for double_k in jmessage.keys():
-                    if double_k not in message_template.keys():
-                        log.err("[!?] validate_message: key %s not expected" % double_k)
-
-            jmessage = valid_jmessage
-
-            for key, value in message_template.iteritems():
-                if not BaseHandler.validate_type(jmessage[key], value):
-                    raise errors.InvalidInputFormat("REST integrity check 1, fail in %s" % key)
-
-            for key, value in jmessage.iteritems():
-                if not BaseHandler.validate_type(value, message_template[key]):
-                    raise errors.InvalidInputFormat("REST integrity check 2, fail in %s" % key)
-
-            return True
-
-        elif isinstance(message_template, list):
-            return all(BaseHandler.validate_type(x, message_template[0]) for x in jmessage)
-
-        else:
+        if not isinstance(message_template, (dict, list)):
             raise errors.InvalidInputFormat("invalid json massage: expected dict or list")
-            
+
+        return template_validator(message_template)(jmessage)
 
     @staticmethod
     def validate_message(message, message_template):
@@ -413,26 +479,21 @@ class BaseHandler(RequestHandler):
             GLSetting.http_log_counter += 1
 
             try:
-                content = (">" * 15)
-                content += (" Request %d " % GLSetting.http_log_counter)
-                content += (">" * 15) + "\n\n"
-
-                content += self.request.method + " " + self.request.full_url() + "\n\n"
+                content = [">" * 15 + " Request %d " % GLSetting.http_log_counter + ">" * 15, "",
+                           self.request.method + " " + self.request.full_url(), "",
+                           "headers:"]
 
-                content += "headers:\n"
                 for k, v in self.request.headers.get_all():
-                    content += "%s: %s\n" % (k, v)
+                    content.append("%s: %s" % (k, v))
 
                 if type(self.request.body) == dict and 'body' in self.request.body:
-                    # this is needed due to cyclone hack for file uploads
-                    body = self.request.body['body'].read()
-                else:
-                    body = self.request.body
-
-                if len(body):
-                    content += "\nbody:\n" + body + "\n"
+                    # this is needed due to cyclone hack for file uploads:
+                    # the uploaded files are not read back to be logged
+                    content += ["", "body: <uploaded file of %d bytes>" % self.request.body['body_len']]
+                elif len(self.request.body):
+                    content += ["", "body:", self.request.body]
 
-                self.do_verbose_log(content)
+                self.do_verbose_log("\n".join(content) + "\n")
 
             except Exception as excep:
                 log.err("JSON logging fail (prepare): %s" % excep.message)
@@ -455,21 +516,21 @@ class BaseHandler(RequestHandler):
         It's here implemented to supports the I/O logging if requested
         with the command line options --io $number_of_request_recorded
         """
-        if hasattr(self, 'globaleaks_io_debug'):
+        # with streamed answers flush() is called once per chunk:
+        # the response is logged only the first time.
+        if hasattr(self, 'globaleaks_io_debug') and not self._headers_written:
             try:
-                content = ("<" * 15)
-                content += (" Response %d " % self.globaleaks_io_debug)
-                content += ("<" * 15) + "\n\n"
-                content += "status code: " + str(self._status_code) + "\n\n"
+                content = ["<" * 15 + " Response %d " % self.globaleaks_io_debug + "<" * 15, "",
+                           "status code: " + str(self._status_code), "",
+                           "headers:"]
 
-                content += "headers:\n"
                 for k, v in self._headers.iteritems():
-                    content += "%s: %s\n" % (k, v)
+                    content.append("%s: %s" % (k, v))
 
                 if self._write_buffer is not None:
-                    content += "\nbody: " + str(self._write_buffer) + "\n"
+                    content += ["", "body: " + str(self._write_buffer)]
 
-                self.do_verbose_log(content)
+                self.do_verbose_log("\n".join(content) + "\n")
             except Exception as excep:
                 log.err("JSON logging fail (flush): %s" % excep.message)
                 return
@@ -479,16 +540,17 @@ class BaseHandler(RequestHandler):
 
     def do_verbose_log(self, content):
         """
-        Record in the verbose log the content as defined by Cyclone wrappers.
+        Record in the verbose log the content as defined by Cyclone wrappers;
+        the content is escaped and written by the thread of http_log_writer.
         """
-        content = log_remove_escapes(content)
-        content = log_encode_html(content)
+        if not http_log_writer.running:
+            try:
+                http_log_writer.start(GLSetting.httplogfile)
+            except Exception as excep:
+                log.err("Unable to open %s: %s" % (GLSetting.httplogfile, excep))
+                return
 
-        try:
-            with open(GLSetting.httplogfile, 'a+') as fd:
-                fdesc.writeToFD(fd.fileno(), content + "\n")
-        except Exception as excep:
-            log.err("Unable to open %s: %s" % (GLSetting.httplogfile, excep))
+        http_log_writer.write(content)
 
     def write_error(self, status_code, **kw):
         exception = kw.get('exception')
@@ -519,6 +581,97 @@ class BaseHandler(RequestHandler):
         else:
             RequestHandler.write(self, chunk)
 
+    def set_range_headers(self, total_size, etag):
+        """
+        Evaluate the Range and If-Range headers of a download, whose content
+        is identified by the strong validator etag, and set the status and
+        the length headers of the answer.
+
+        @return: the (start, end) range to be sent, or None for the whole content
+        """
+        self.set_header('Accept-Ranges', 'bytes')
+        self.set_header('Etag', etag)
+
+        byte_range = parse_range_header(self.request.headers.get('Range'), total_size)
+
+        # a range is served only if the content is still the one known by the client
+        if_range = self.request.headers.get('If-Range')
+        if if_range is not None and if_range != etag:
+            byte_range = None
+
+        if byte_range is None:
+            self.set_header('Content-Length', total_size)
+        else:
+            start, end = byte_range
+            self.set_status(206)
+            self.set_header('Content-Range', 'bytes %d-%d/%d' % (start, end, total_size))
+            self.set_header('Content-Length', end - start + 1)
+
+        return byte_range
+
+    def resume_validator(self, download):
+        """
+        A counted download can be resumed, without being counted again, by
+        a Range request starting after the first byte and conditioned by
+        If-Range, within download_resume_seconds from the counted request.
+
+        @param download: the key of the download in resumable_downloads
+        @return: the If-Range validator of a request that can resume the
+                 download, or None; the download is resumed only if the
+                 validator is the strong etag of the same content.
+        """
+        if_range = self.request.headers.get('If-Range')
+
+        if if_range is None or not range_start(self.request.headers.get('Range')):
+            return None
+
+        downloads = GLSetting.resumable_downloads
+        if download not in downloads or \
+                is_expired(downloads[download]['date'], seconds=GLSetting.download_resume_seconds):
+            return None
+
+        return if_range
+
+    def check_etag(self, etag):
+        """
+        Mark a public answer as cacheable by the client, provided that it
+        is revalidated on every use, and evaluate the If-None-Match header.
+        The no-store policy set by default stays for everything else.
+
+        @return: True if the copy of the client is still the current one;
+                 the status is then set to 304 and the request has to be
+                 finished without a body.
+        """
+        self.set_header('Cache-control', 'no-cache, must-revalidate')
+        self.set_header('Etag', etag)
+
+        if etag_matches(self.request.headers.get('If-None-Match'), etag):
+            self.set_status(304)
+            return True
+
+        return False
+
+    def finish_json(self, serialized, etag=None):
+        """
+        Finish the request with a JSON answer already serialized,
+        as returned by GLApiCache.get, answering 304 when the client
+        already has it.
+        """
+        if etag is not None and self.check_etag(etag):
+            self.finish()
+            return
+
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        self.finish(serialized)
+
+    def stream(self, chunks):
+        """
+        Send the headers and then stream the chunks with a GLStreamProducer;
+        the caller has to finish() the request when the returned Deferred fires.
+        """
+        self.flush()
+        return GLStreamProducer(self, chunks).start()
+
     @inlineCallbacks
     def uniform_answers_delay(self):
         """
@@ -542,13 +695,22 @@ class BaseHandler(RequestHandler):
             #    (1000.0 * needed_diff),
             #    (1000.0 * uniform_delay)
             #)
-            yield deferred_sleep(needed_diff)
+            start = time.time()
+            yield uniform_delay_wheel.sleep(needed_diff)
+            self.request.delay_time += time.time() - start
         else:
             #print "uniform delay of %.2fms it's more than %.2fms" % (
             #    (1000.0 * request_time ), (1000.0 * uniform_delay)
             #)
             pass
 
+    def on_finish(self):
+        request_metrics.record(self.__class__.__name__,
+                               self._status_code,
+                               self.request.request_time(),
+                               self.request.db_time,
+                               self.request.delay_time)
+
     @property
     def current_user(self):
         session_id = None
@@ -639,6 +801,54 @@ class BaseStaticFileHandler(BaseHandler, StaticFileHandler):
         if not validate_host(self.request.host):
             raise errors.InvalidHostSpecified
 
+    def get(self, path, include_body=True):
+        """
+        Serve the file from GLStaticAssets, gzipped to the clients accepting
+        it; the files too big to be kept in memory are read from the disk.
+        """
+        abspath = os.path.abspath(os.path.join(self.root, self.parse_url_path(path)))
+        if not (abspath + os.path.sep).startswith(self.root):
+            raise HTTPError(403, "%s is not in root static directory", path)
+
+        if os.path.isdir(abspath) and self.default_filename is not None:
+            if not self.request.path.endswith("/"):
+                self.redirect("%s/" % self.request.path)
+                return
+
+            abspath = os.path.join(abspath, self.default_filename)
+
+        st = GLStaticAssets.stat(abspath)
+        if st is None:
+            return StaticFileHandler.get(self, path, include_body)
+
+        d = GLStaticAssets.get(abspath, st)
+        d.addCallback(self.write_asset, path, include_body)
+        return d
+
+    def write_asset(self, asset, path, include_body):
+        if asset is None:
+            return StaticFileHandler.get(self, path, include_body)
+
+        data, etag = asset.data, asset.etag
+
+        if asset.gzip_data is not None:
+            self.set_header('Vary', 'Accept-Encoding')
+            if accepts_encoding(self.request.headers.get('Accept-Encoding'), 'gzip'):
+                data, etag = asset.gzip_data, asset.gzip_etag
+                self.set_header('Content-Encoding', 'gzip')
+
+        self.set_header('Last-Modified', asset.modified)
+        if asset.mime_type:
+            self.set_header('Content-Type', asset.mime_type)
+
+        if self.check_etag(etag):
+            return
+
+        if include_body:
+            self.write(data)
+        else:
+            self.set_header('Content-Length', len(data))
+
 
 class BaseRedirectHandler(BaseHandler, RedirectHandler):
     def prepare(self):
@@ -700,3 +910,4 @@ def anomaly_check(element):
         return call_handler
 
     return wrapper
+
@@ -8,6 +8,8 @@
 from twisted.internet.defer import inlineCallbacks
 
 import os
+import time
+import hashlib
 import tarfile
 import StringIO
 
@@ -18,10 +20,12 @@ from globaleaks.handlers import admin
 from globaleaks.rest import errors
 from globaleaks.settings import GLSetting, transact_ro
 from globaleaks.utils.zipstream import ZipStream, ZIP_STORED, ZIP_DEFLATED
+from globaleaks.utils.streaming import file_chunks, range_chunks
 from globaleaks.plugins.base import Event
 from globaleaks.jobs.notification_sched import serialize_receivertip
 from globaleaks.models import ReceiverTip, ReceiverFile
-from globaleaks.utils.utility import log
+from globaleaks.security import access_tip
+from globaleaks.utils.utility import log, datetime_now
 from globaleaks.utils.templating import Templating
 
 def get_compression_opts(compression):
@@ -92,6 +96,10 @@ def get_collection_info(store, rtip_id):
 
     return collection_dict
 
+@transact_ro
+def check_rtip_access(store, user_id, rtip_id):
+    access_tip(store, user_id, rtip_id)
+
 @transact_ro
 def get_receiver_from_rtip(store, rtip_id):
     rtip = store.find(ReceiverTip, ReceiverTip.id == rtip_id).one()
@@ -103,13 +111,81 @@ def get_receiver_from_rtip(store, rtip_id):
     return admin.admin_serialize_receiver(rtip.receiver, GLSetting.memory_copy.default_language)
 
 
+def collection_etag(zipstream):
+    """
+    Strong validator of a stored zip collection, derived from everything
+    defining its content: the files time, names and sizes, and the content
+    of the generated files (the files on disk are never modified).
+    """
+    sha = hashlib.sha256()
+    sha.update(repr(zipstream.time))
+
+    for f in zipstream.files:
+        sha.update(repr((f['name'], f['size'], f.get('path'), f.get('buf'))))
+
+    return '"%s"' % sha.hexdigest()
+
+
 class CollectionStreamer(object):
-    def __init__(self, handler):
-        self.handler = handler
+    """
+    File-like object used as tarfile output: the written data is kept
+    in memory only until the next pop(), done by tar_stream.
+    """
+    def __init__(self):
+        self.buf = []
 
     def write(self, data):
         if len(data) > 0:
-          self.handler.write(data)
+            self.buf.append(data)
+
+    def pop(self):
+        data = ''.join(self.buf)
+        self.buf = []
+        return data
+
+
+def tar_stream(files, compression_type):
+    """
+    Generator of the tar archive (optionally compressed) of files;
+    file contents are added one chunk at time, so that at most a chunk
+    (plus the tarfile internal buffer) is kept in memory.
+    """
+    collectionstreamer = CollectionStreamer()
+    tar = tarfile.open("collection.tar", 'w|' + compression_type, collectionstreamer)
+
+    for f in files:
+        if 'path' in f:
+            try:
+                tarinfo = tar.gettarinfo(f['path'], f['name'])
+                fp = open(f['path'], 'rb')
+            except (OSError, IOError) as excpd:
+                log.err("OSError while adding %s to files collection: %s" % (f['path'], excpd))
+                continue
+
+            # this is what TarFile.addfile does, with the copy of the
+            # file content split in chunks yielded one by one.
+            tar.addfile(tarinfo)
+
+            for chunk in file_chunks(fp):
+                tar.fileobj.write(chunk)
+                yield collectionstreamer.pop()
+
+            blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+            if remainder > 0:
+                tar.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+                blocks += 1
+            tar.offset += blocks * tarfile.BLOCKSIZE
+
+        elif 'buf' in f:
+            tarinfo = tarfile.TarInfo(f['name'])
+            tarinfo.size = len(f['buf'])
+            tar.addfile(tarinfo, StringIO.StringIO(f['buf']))
+
+        yield collectionstreamer.pop()
+
+    tar.close()
+
+    yield collectionstreamer.pop()
 
 
 class CollectionDownload(BaseHandler):
@@ -119,16 +195,27 @@ class CollectionDownload(BaseHandler):
     @inlineCallbacks
     def post(self, rtip_id, compression):
 
-        files_dict = yield download_all_files(self.current_user.user_id, rtip_id)
-
-        if not files_dict:
-            raise errors.DownloadLimitExceeded
-
         if compression is None:
             compression = 'zipstored'
 
         opts = get_compression_opts(compression)
 
+        # a stored collection can be resumed without being counted again:
+        # the resumed request gets the same archive, with the files and the
+        # time of the counted request.
+        download = (self.current_user.user_id, rtip_id)
+        if_range = self.resume_validator(download) if compression == 'zipstored' else None
+
+        if if_range is not None and if_range == GLSetting.resumable_downloads[download].get('etag'):
+            yield check_rtip_access(self.current_user.user_id, rtip_id)
+            yield self.stream_collection(GLSetting.resumable_downloads[download], opts)
+            return
+
+        files_dict = yield download_all_files(self.current_user.user_id, rtip_id)
+
+        if not files_dict:
+            raise errors.DownloadLimitExceeded
+
         node_dict = yield admin.admin_serialize_node()
         receiver_dict = yield get_receiver_from_rtip(rtip_id)
         rtip_dict = yield get_rtip_info(rtip_id)
@@ -155,31 +242,66 @@ class CollectionDownload(BaseHandler):
               'name' : "COLLECTION_INFO.txt"
             })
 
+        if compression == 'zipstored':
+            collection = {
+                'date': datetime_now(),
+                'files': files_dict,
+                'time': time.localtime()[0:6]
+            }
+
+            yield self.stream_collection(collection, opts)
+
+            # only the counted download opens the window of its resumptions
+            GLSetting.resumable_downloads[download] = collection
+            return
+
+        self.set_download_headers(opts)
+
+        if compression == 'zipdeflated':
+            chunks = ZipStream(files_dict, opts['compression_type']).chunks()
+
+        elif compression in ['tar', 'targz', 'tarbz2']:
+            chunks = tar_stream(files_dict, opts['compression_type'])
+
+        # the archive is generated while the client downloads it,
+        # following the speed of the connection.
+        yield self.stream(chunks)
+
+        self.finish()
+
+    def set_download_headers(self, opts):
         self.set_status(200)
 
         self.set_header('X-Download-Options', 'noopen')
         self.set_header('Content-Type', 'application/octet-stream')
         self.set_header('Content-Disposition','attachment; filename=\"%s\"' %opts['filename'])
 
-        if compression in ['zipstored', 'zipdeflated']:
-            for data in ZipStream(files_dict, opts['compression_type']):
-                self.write(data)
-
-        elif compression in ['tar', 'targz', 'tarbz2']:
-            collectionstreamer = CollectionStreamer(self)
-            tar = tarfile.open("collection." + compression, 'w|'+opts['compression_type'], collectionstreamer)
-            for f in files_dict:
-                if 'path' in f:
-                    try:
-                        tar.add(f['path'], f['name'])
-                    except (OSError, IOError) as excpd:
-                        log.err("OSError while adding %s to files collection: %s" % (f['path'], excpd))
-
-                elif 'buf' in f:
-                    tarinfo = tarfile.TarInfo(f['name'])
-                    tarinfo.size = len(f['buf'])
-                    tar.addfile(tarinfo, StringIO.StringIO(f['buf']))
-
-            tar.close()
+    @inlineCallbacks
+    def stream_collection(self, collection, opts):
+        """
+        Streams the stored zip of the collection, whose size is known in
+        advance: the client gets the Content-Length and can resume the
+        download with a Range. The etag of the archive is recorded in the
+        collection, to recognize the resumed requests.
+        """
+        self.set_download_headers(opts)
+
+        chunks = ZipStream(collection['files'], opts['compression_type'],
+                           date_time=collection['time'])
+
+        collection['etag'] = collection_etag(chunks)
+
+        byte_range = self.set_range_headers(chunks.size(), collection['etag'])
+        if byte_range is not None:
+            chunks = range_chunks(chunks, *byte_range)
+
+        try:
+            yield self.stream(chunks)
+        except (OSError, IOError) as excep:
+            # a file that can't be read anymore would make the answer
+            # shorter than its Content-Length
+            log.err("Unable to stream the collection: %s" % excep)
+            self.request.connection.transport.abortConnection()
+            return
 
         self.finish()
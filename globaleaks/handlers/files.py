@@ -9,20 +9,25 @@
 from __future__ import with_statement
 import os
 import time
+import hashlib
 
 import shutil
 
-from twisted.internet import threads
+from twisted.internet import threads, reactor
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.threads import deferToThreadPool
 from cyclone.web import StaticFileHandler
+from cyclone.util import ObjectDict as OD
 
 from globaleaks.settings import transact, transact_ro, GLSetting, stats_counter
 from globaleaks.handlers.base import BaseHandler, BaseStaticFileHandler, anomaly_check
 from globaleaks.handlers.authentication import transport_security_check, authenticated, unauthenticated
-from globaleaks.utils.utility import log, datetime_to_ISO8601
-from globaleaks.rest import errors
+from globaleaks.utils.utility import log, datetime_to_ISO8601, datetime_now, is_expired, uuid4
+from globaleaks.utils.uploads import GLUploadWriter
+from globaleaks.utils.streaming import file_chunks, range_chunks
+from globaleaks.rest import errors, requests
 from globaleaks.models import ReceiverTip, ReceiverFile, InternalTip, InternalFile, WhistleblowerTip
-from globaleaks.security import access_tip
+from globaleaks.security import access_tip, GLSecureTemporaryFile
 
 def serialize_file(internalfile):
 
@@ -125,17 +130,31 @@ def get_tip_by_wbtip(store, wb_tip_id):
     return wb_tip.internaltip.id
 
 
+def serialize_upload(upload):
+
+    upload_desc = {
+        'id' : upload.id,
+        'name' : upload.name,
+        'content_type' : upload.content_type,
+        'size' : upload.size,
+        'offset' : upload.offset,
+    }
+
+    return upload_desc
+
+
 class FileHandler(BaseHandler):
 
     @inlineCallbacks
-    def handle_file_upload(self, itip_id):
+    def handle_file_upload(self, itip_id, uploaded_file=None):
         result_list = []
 
         # measure the operation of all the files (via browser can be selected
         # more than 1), because all files are delivered in the same time.
         start_time = time.time()
 
-        uploaded_file = self.request.body
+        if uploaded_file is None:
+            uploaded_file = self.request.body
 
         uploaded_file['body'].avoid_delete()
         uploaded_file['body'].close()
@@ -161,6 +180,38 @@ class FileHandler(BaseHandler):
         self.write({'files': result_list})
 
 
+    def create_upload_session(self, itip_id, user_id=None):
+        """
+        Open a resumable upload: the file is received in chunks appended
+        to the same GLSecureTemporaryFile, and the InternalFile is
+        registered only when the upload is finalized.
+        """
+        request = self.validate_message(self.request.body, requests.uploadSessionDesc)
+
+        if request['size'] < 0 or \
+                request['size'] / (1024 * 1024) > GLSetting.memory_copy.maximum_filesize:
+            raise errors.InvalidInputFormat("Invalid file size")
+
+        upload = OD()
+        upload.id = uuid4()
+        upload.itip_id = itip_id
+        upload.user_id = user_id
+        upload.name = request['name']
+        upload.content_type = request['content_type']
+        upload.size = request['size']
+        upload.offset = 0
+        upload.writing = False
+        upload.body = GLSecureTemporaryFile(GLSetting.tmp_upload_path)
+        upload.creationdate = upload.refreshdate = datetime_now()
+
+        GLSetting.upload_sessions[upload.id] = upload
+
+        self.set_status(201) # Created
+        self.set_header('Location', '/upload/%s' % upload.id)
+        self.set_header('Upload-Offset', upload.offset)
+        self.write(serialize_upload(upload))
+
+
 # This is different from FileInstance, just because there are a different authentication requirements
 class FileAdd(FileHandler):
     """
@@ -206,10 +257,185 @@ class FileInstance(FileHandler):
         yield self.handle_file_upload(itip_id)
 
 
+class FileUploadAdd(FileHandler):
+    """
+    WhistleBlower interface for start a resumable upload of a new file
+    in an already completed submission
+    """
+
+    @transport_security_check('wb')
+    @authenticated('wb')
+    @anomaly_check('file_uploaded')
+    @inlineCallbacks
+    def post(self, *args):
+        """
+        Request: uploadSessionDesc
+        Response: 201, the upload session
+        Errors: TipIdNotFound, InvalidInputFormat
+        """
+        stats_counter('file_uploaded')
+        itip_id = yield get_tip_by_wbtip(self.current_user['user_id'])
+
+        self.create_upload_session(itip_id, self.current_user['user_id'])
+
+class FileUploadInstance(FileHandler):
+    """
+    WhistleBlower interface for start a resumable upload of a new file
+    in a not yet completed submission
+    """
+
+    @transport_security_check('wb')
+    @unauthenticated
+    @anomaly_check('file_uploaded')
+    @inlineCallbacks
+    def post(self, submission_id, *args):
+        """
+        Parameter: internaltip_id
+        Request: uploadSessionDesc
+        Response: 201, the upload session
+        Errors: SubmissionIdNotFound, SubmissionConcluded, InvalidInputFormat
+        """
+        stats_counter('file_uploaded')
+        itip_id = yield get_tip_by_submission(submission_id)
+
+        self.create_upload_session(itip_id)
+
+class FileUploadSession(FileHandler):
+    """
+    A resumable upload session: the current offset is read with GET, the
+    chunks of the file are sent with PATCH (Content-Type
+    application/offset+octet-stream, with the Upload-Offset header set to
+    the current offset) and the upload is finalized with POST.
+    """
+
+    def get_upload_session(self, upload_id):
+        upload = GLSetting.upload_sessions.get(upload_id)
+
+        # the activity keeps a session open only until its maximum lifetime
+        if upload is None or \
+                is_expired(upload.refreshdate, seconds=GLSetting.upload_session_seconds) or \
+                is_expired(upload.creationdate, seconds=GLSetting.upload_session_lifetime_seconds):
+            raise errors.UploadSessionNotFound
+
+        # the sessions opened from a WBTip are bound to the whistleblower
+        if upload.user_id is not None and \
+                (not self.current_user or self.current_user.user_id != upload.user_id):
+            raise errors.UploadSessionNotFound
+
+        upload.refreshdate = datetime_now()
+
+        return upload
+
+    @transport_security_check('wb')
+    @unauthenticated
+    def get(self, upload_id):
+        """
+        Parameter: upload_id
+        Response: the upload session
+        Errors: UploadSessionNotFound
+        """
+        upload = self.get_upload_session(upload_id)
+
+        self.set_status(200)
+        self.set_header('Upload-Offset', upload.offset)
+        self.finish(serialize_upload(upload))
+
+    @transport_security_check('wb')
+    @unauthenticated
+    @inlineCallbacks
+    def patch(self, upload_id):
+        """
+        Parameter: upload_id
+        Request: a chunk of the file
+        Response: 204, with the new Upload-Offset
+        Errors: UploadSessionNotFound, UploadOffsetMismatch, InvalidInputFormat
+        """
+        upload = self.get_upload_session(upload_id)
+
+        try:
+            offset = int(self.request.headers.get('Upload-Offset'))
+        except (TypeError, ValueError):
+            raise errors.InvalidInputFormat("Invalid Upload-Offset header")
+
+        if upload.writing or offset != upload.offset:
+            raise errors.UploadOffsetMismatch(upload.offset)
+
+        chunk = self.request.body
+
+        if upload.offset + len(chunk) > upload.size:
+            raise errors.InvalidInputFormat("The chunk exceeds the size of the file")
+
+        upload.writing = True
+        try:
+            yield deferToThreadPool(reactor, GLUploadWriter.tp, upload.body.write, chunk)
+        except Exception as excep:
+            # the encrypted file is no more consistent with the offset
+            log.err("Unable to write a chunk of %s: %s" % (upload.name, excep))
+            del GLSetting.upload_sessions[upload.id]
+            upload.body.close()
+            raise errors.InternalServerError("Unable to accept new files")
+        finally:
+            upload.writing = False
+
+        upload.offset += len(chunk)
+
+        self.set_status(204)
+        self.set_header('Upload-Offset', upload.offset)
+
+    @transport_security_check('wb')
+    @unauthenticated
+    @inlineCallbacks
+    def post(self, upload_id):
+        """
+        Parameter: upload_id
+        Response: 201, the registered file
+        Errors: UploadSessionNotFound, UploadIncomplete, SubmissionConcluded,
+                TipIdNotFound
+        """
+        upload = self.get_upload_session(upload_id)
+
+        if upload.writing or upload.offset != upload.size:
+            raise errors.UploadIncomplete
+
+        del GLSetting.upload_sessions[upload.id]
+
+        # the submission may have been concluded while the file was uploaded
+        try:
+            if upload.user_id is None:
+                yield get_tip_by_submission(upload.itip_id)
+            else:
+                yield get_tip_by_wbtip(upload.user_id)
+        except Exception:
+            upload.body.close()
+            raise
+
+        uploaded_file = {
+            'filename': upload.name,
+            'content_type': upload.content_type,
+            'body': upload.body,
+            'body_len': upload.size,
+            'body_filepath': upload.body.filepath,
+        }
+
+        yield self.handle_file_upload(upload.itip_id, uploaded_file)
+
+
+def receiver_file_etag(rfile):
+    """
+    The stored files are never modified: their random path and their
+    size are a strong validator for the If-Range header.
+    """
+    return '"%s"' % hashlib.sha256("%s:%d" % (rfile['path'], rfile['size'])).hexdigest()
+
+
 @transact
-def download_file(store, user_id, tip_id, file_id):
+def download_file(store, user_id, tip_id, file_id, resume_validator=None):
     """
     Auth temporary disabled, just Tip_id and File_id required
+
+    A resumed download (a Range request continuing a download already
+    counted, whose If-Range validator is passed as resume_validator) is not
+    counted again and is not subject to the download limit.
     """
 
     rtip = access_tip(store, user_id, tip_id)
@@ -224,6 +450,10 @@ def download_file(store, user_id, tip_id, file_id):
               (rfile.internalfile.name, rfile.downloads,
                rfile.internalfile.internaltip.download_limit, rfile.receiver.name))
 
+    if resume_validator is not None and \
+            resume_validator == receiver_file_etag(serialize_receiver_file(rfile)):
+        return serialize_receiver_file(rfile)
+
     if rfile.downloads == rfile.internalfile.internaltip.download_limit:
         raise errors.DownloadLimitExceeded
 
@@ -262,31 +492,52 @@ class Download(BaseHandler):
     @inlineCallbacks
     def post(self, tip_id, rfile_id, *uriargs):
 
-        rfile = yield download_file(self.current_user.user_id, tip_id, rfile_id)
+        # the Range requests of a receiver following a recent download of
+        # the same file are the continuation of a single logical download.
+        download = (self.current_user.user_id, rfile_id)
+        if_range = self.resume_validator(download)
+
+        rfile = yield download_file(self.current_user.user_id, tip_id, rfile_id, if_range)
+
+        etag = receiver_file_etag(rfile)
+
+        # only a counted download opens the window of its resumptions
+        if if_range != etag:
+            GLSetting.resumable_downloads[download] = {'date': datetime_now()}
 
         # keys:  'file_path'  'size' : 'content_type' 'file_name'
 
+        filelocation = os.path.join(GLSetting.submission_path, rfile['path'])
+
+        try:
+            fp = open(filelocation, "rb")
+        except IOError as srcerr:
+            log.err("Unable to open %s: %s " % (filelocation, srcerr.strerror))
+            self.set_status(404)
+            self.finish()
+            return
+
         self.set_status(200)
 
         self.set_header('X-Download-Options', 'noopen')
         self.set_header('Content-Type', 'application/octet-stream')
-        self.set_header('Content-Length', rfile['size'])
         self.set_header('Content-Disposition','attachment; filename=\"%s\"' % rfile['name'])
 
-        filelocation = os.path.join(GLSetting.submission_path, rfile['path'])
-
         try:
+            byte_range = self.set_range_headers(rfile['size'], etag)
+        except errors.RequestedRangeNotSatisfiable:
+            fp.close()
+            raise
 
-            with open(filelocation, "rb") as requestf:
-                chunk_size = 8192
-                while True:
-                    chunk = requestf.read(chunk_size)
-                    if len(chunk) == 0:
-                        break
-                    self.write(chunk)
+        chunks = file_chunks(fp)
 
-        except IOError as srcerr:
-            log.err("Unable to open %s: %s " % (filelocation, srcerr.strerror))
-            self.set_status(404)
+        if byte_range is not None:
+            start, end = byte_range
+            fp.seek(start)
+            chunks = range_chunks(chunks, 0, end - start)
+
+        # the file is streamed from the disk following the client speed,
+        # without being loaded in the handler buffer.
+        yield self.stream(chunks)
 
         self.finish()
@@ -5,12 +5,13 @@
 # Implementation of classes handling the HTTP request to /node, public
 # exposed API.
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks.utils.utility import log, datetime_to_ISO8601
 from globaleaks.utils.structures import Rosetta, Fields
 from globaleaks.settings import transact_ro, GLSetting, stats_counter
 from globaleaks.handlers.base import BaseHandler
+from globaleaks.utils.apicache import GLApiCache
 from globaleaks.handlers.authentication import transport_security_check, unauthenticated
 from globaleaks import models, LANGUAGES_SUPPORTED
 
@@ -146,8 +147,27 @@ class InfoCollection(BaseHandler):
         Errors: NodeNotFound
         """
         stats_counter('anon_requests')
-        response = yield anon_serialize_node(self.request.language)
-        self.finish(response)
+        serialized, etag = yield GLApiCache.get('node', self.request.language,
+                                                anon_serialize_node, self.request.language)
+        self.finish_json(serialized, etag)
+
+
+@inlineCallbacks
+def anon_serialize_ahmia(language):
+    node_info = yield anon_serialize_node(language)
+
+    ahmia_description = {
+        "title": node_info['name'],
+        "description": node_info['description'],
+        # we've not yet keywords, need to add them in Node ?
+        "keywords": "%s (GlobaLeaks instance)" % node_info['name'],
+        "relation": node_info['public_site'],
+        "language": node_info['default_language'],
+        "contactInformation": u'', # we've removed Node.email_addr
+        "type": "GlobaLeaks"
+    }
+
+    returnValue(ahmia_description)
 
 
 class AhmiaDescriptionHandler(BaseHandler):
@@ -164,19 +184,9 @@ class AhmiaDescriptionHandler(BaseHandler):
     def get(self, *uriargs):
 
         log.debug("Requested Ahmia description file")
-        node_info = yield anon_serialize_node(self.request.language)
-
-        ahmia_description = {
-            "title": node_info['name'],
-            "description": node_info['description'],
-            # we've not yet keywords, need to add them in Node ?
-            "keywords": "%s (GlobaLeaks instance)" % node_info['name'],
-            "relation": node_info['public_site'],
-            "language": node_info['default_language'],
-            "contactInformation": u'', # we've removed Node.email_addr
-            "type": "GlobaLeaks"
-        }
-        self.finish(ahmia_description)
+        serialized, etag = yield GLApiCache.get('ahmia', self.request.language,
+                                                anon_serialize_ahmia, self.request.language)
+        self.finish_json(serialized, etag)
 
 
 @transact_ro
@@ -209,8 +219,9 @@ class ContextsCollection(BaseHandler):
         Errors: None
         """
         stats_counter('anon_requests')
-        response = yield get_public_context_list(self.request.language)
-        self.finish(response)
+        serialized, etag = yield GLApiCache.get('contexts', self.request.language,
+                                                get_public_context_list, self.request.language)
+        self.finish_json(serialized, etag)
 
 @transact_ro
 def get_public_receiver_list(store, default_lang):
@@ -240,5 +251,6 @@ class ReceiversCollection(BaseHandler):
         Errors: None
         """
         stats_counter('anon_requests')
-        response = yield get_public_receiver_list(self.request.language)
-        self.finish(response)
+        serialized, etag = yield GLApiCache.get('receivers', self.request.language,
+                                                get_public_receiver_list, self.request.language)
+        self.finish_json(serialized, etag)
@@ -5,77 +5,153 @@
 # Implementation of the code executed when an HTTP client reach /overview/* URI
 
 import os
+from datetime import datetime
 
 from twisted.internet.defer import inlineCallbacks
-from storm.expr import Desc
+from storm.expr import Desc, Or, And, Count, Sum
 
 from globaleaks.settings import transact_ro, GLSetting
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.authentication import authenticated, transport_security_check
+from globaleaks.rest import errors
 from globaleaks import models
 
 from globaleaks.utils.utility import log, datetime_to_ISO8601
 from globaleaks.utils.structures import Rosetta
 
-@transact_ro
-def collect_tip_overview(store, language=GLSetting.memory_copy.default_language):
+# the format of the creation_date in the cursors of the pages
+cursor_date_format = '%Y-%m-%dT%H:%M:%S.%f'
 
-    tip_description_list = []
-    all_itips = store.find(models.InternalTip)
-    all_itips.order_by(Desc(models.InternalTip.creation_date))
+def page_cursor(element):
+    return u"%s,%s" % (element.creation_date.strftime(cursor_date_format), element.id)
 
-    for itip in all_itips:
-        tip_description = {
-            "id": itip.id,
-            "creation_date": datetime_to_ISO8601(itip.creation_date),
-            "creation_lifetime": datetime_to_ISO8601(itip.creation_date),
-            "expiration_date": datetime_to_ISO8601(itip.expiration_date),
-            "context_id": itip.context_id,
-            "pertinence_counter": itip.pertinence_counter,
-            "status": itip.mark,
-            "receivertips": [],
-            "internalfiles": [],
-            "comments": [],
-        }
+def parse_page_cursor(cursor):
+    """
+    @return: the (creation_date, id) of the last element of the previous page
+    """
+    try:
+        date, element_id = cursor.split(',', 1)
+        return datetime.strptime(date, cursor_date_format), unicode(element_id)
+    except ValueError:
+        raise errors.InvalidInputFormat("Invalid page cursor")
+
+def keyset_page(store, model, conditions, limit, after=None):
+    """
+    The elements are paginated on (creation_date, id), newest first: a page
+    starts after the last element of the previous one, identified by the
+    cursor 'after', so that it does not depend on an OFFSET scan and is
+    stable while the elements are created and deleted.
+
+    @return: the number of the elements matching the conditions, the page
+        of at most 'limit' of them, and the cursor of the next page (None
+        if this is the last one)
+    """
+    total = store.find(model, *conditions).count()
+
+    if after is not None:
+        date, element_id = parse_page_cursor(after)
+        conditions = conditions + [Or(model.creation_date < date,
+                                      And(model.creation_date == date, model.id < element_id))]
 
-        mo = Rosetta()
-        mo.acquire_storm_object(itip.context)
-        tip_description['context_name'] = mo.dump_translated('name', language)
+    elements = store.find(model, *conditions)
+    elements.order_by(Desc(model.creation_date), Desc(model.id))
+    elements = list(elements[:limit + 1])
 
-        # strip uncompleted submission, until GLClient open new submission
-        # also if no data has been supply
-        if itip.mark == models.InternalTip._marker[0]:
-            continue
+    if len(elements) <= limit:
+        return total, elements, None
 
-        for rtip in itip.receivertips:
-            tip_description['receivertips'].append({
+    elements = elements[:limit]
+    return total, elements, page_cursor(elements[-1])
+
+def serialize_page(total, elements, next_cursor):
+    return {
+        'total': total,
+        'next': next_cursor,
+        'elements': elements,
+    }
+
+# the ids bound to a single query: SQLite refuses the statements with
+# more than 999 variables
+ids_batch_size = 500
+
+def ids_batches(ids):
+    for i in xrange(0, len(ids), ids_batch_size):
+        yield ids[i:i + ids_batch_size]
+
+def serialize_tips_overview(store, itips, language):
+    """
+    Serialize the InternalTips with a query for each of the relations
+    of a batch of them, instead of walking the relations of each tip.
+    """
+    itips_ids = [itip.id for itip in itips]
+
+    receivertips = dict((itip_id, []) for itip_id in itips_ids)
+    internalfiles = dict((itip_id, []) for itip_id in itips_ids)
+    comments = dict((itip_id, []) for itip_id in itips_ids)
+    wbtips = {}
+
+    for batch in ids_batches(itips_ids):
+        for rtip, receiver, user in store.find((models.ReceiverTip, models.Receiver, models.User),
+                                               models.ReceiverTip.internaltip_id.is_in(batch),
+                                               models.Receiver.id == models.ReceiverTip.receiver_id,
+                                               models.User.id == models.Receiver.user_id):
+            receivertips[rtip.internaltip_id].append({
                 'access_counter': rtip.access_counter,
                 'notification_date': datetime_to_ISO8601(rtip.notification_date),
                 # 'creation_date': datetime_to_ISO8601(rtip.creation_date),
                 'status': rtip.mark,
-                'receiver_id': rtip.receiver.id,
-                'receiver_username': rtip.receiver.user.username,
-                'receiver_name': rtip.receiver.name,
+                'receiver_id': receiver.id,
+                'receiver_username': user.username,
+                'receiver_name': receiver.name,
                 # last_access censored willingly
             })
 
-        for ifile in itip.internalfiles:
-            tip_description['internalfiles'].append({
+        for ifile in store.find(models.InternalFile,
+                                models.InternalFile.internaltip_id.is_in(batch)):
+            internalfiles[ifile.internaltip_id].append({
                 'name': ifile.name,
                 'size': ifile.size,
                 'status': ifile.mark,
                 'content_type': ifile.content_type
             })
 
-        for comment in itip.comments:
-            tip_description['comments'].append({
+        for comment in store.find(models.Comment,
+                                  models.Comment.internaltip_id.is_in(batch)):
+            comments[comment.internaltip_id].append({
                 'type': comment.type,
                 'lifetime': datetime_to_ISO8601(comment.creation_date),
             })
 
         # whistleblower tip has not a reference from itip, then:
-        wbtip = store.find(models.WhistleblowerTip,
-            models.WhistleblowerTip.internaltip_id == itip.id).one()
+        for wbtip in store.find(models.WhistleblowerTip,
+                                models.WhistleblowerTip.internaltip_id.is_in(batch)):
+            wbtips[wbtip.internaltip_id] = wbtip
+
+    context_names = {}
+
+    tip_description_list = []
+
+    for itip in itips:
+        if itip.context_id not in context_names:
+            mo = Rosetta()
+            mo.acquire_storm_object(itip.context)
+            context_names[itip.context_id] = mo.dump_translated('name', language)
+
+        tip_description = {
+            "id": itip.id,
+            "creation_date": datetime_to_ISO8601(itip.creation_date),
+            "creation_lifetime": datetime_to_ISO8601(itip.creation_date),
+            "expiration_date": datetime_to_ISO8601(itip.expiration_date),
+            "context_id": itip.context_id,
+            "context_name": context_names[itip.context_id],
+            "pertinence_counter": itip.pertinence_counter,
+            "status": itip.mark,
+            "receivertips": receivertips[itip.id],
+            "internalfiles": internalfiles[itip.id],
+            "comments": comments[itip.id],
+        }
+
+        wbtip = wbtips.get(itip.id)
 
         if wbtip is not None:
             tip_description.update({
@@ -91,6 +167,33 @@ def collect_tip_overview(store, language=GLSetting.memory_copy.default_language)
 
     return tip_description_list
 
+@transact_ro
+def collect_tip_overview(store, language=GLSetting.memory_copy.default_language):
+
+    # strip uncompleted submission, until GLClient open new submission
+    # also if no data has been supply
+    all_itips = store.find(models.InternalTip,
+                           models.InternalTip.mark != models.InternalTip._marker[0])
+    all_itips.order_by(Desc(models.InternalTip.creation_date))
+
+    return serialize_tips_overview(store, list(all_itips), language)
+
+@transact_ro
+def collect_tip_overview_page(store, limit, after=None, status=None, context_id=None,
+                              language=GLSetting.memory_copy.default_language):
+
+    conditions = [models.InternalTip.mark != models.InternalTip._marker[0]]
+
+    if status is not None:
+        conditions.append(models.InternalTip.mark == status)
+
+    if context_id is not None:
+        conditions.append(models.InternalTip.context_id == context_id)
+
+    total, itips, next_cursor = keyset_page(store, models.InternalTip, conditions, limit, after)
+
+    return serialize_page(total, serialize_tips_overview(store, itips, language), next_cursor)
+
 
 @transact_ro
 def collect_users_overview(store):
@@ -138,6 +241,78 @@ def collect_users_overview(store):
 
     return users_description_list
 
+@transact_ro
+def collect_users_overview_page(store, limit, after=None, gpg_key_status=None):
+    """
+    The page of the receivers reports the counters of their tips and
+    files by status, computed by grouped queries, instead of the lists.
+    """
+    conditions = []
+
+    if gpg_key_status is not None:
+        conditions.append(models.Receiver.gpg_key_status == gpg_key_status)
+
+    total, receivers, next_cursor = keyset_page(store, models.Receiver, conditions, limit, after)
+
+    users_description = dict((receiver.id, {
+        'id': receiver.id,
+        'name': receiver.name,
+        'gpg_key_status': receiver.gpg_key_status,
+        'receivertips': {},
+        'receiverfiles': {},
+        'downloads': 0,
+    }) for receiver in receivers)
+
+    receivers_ids = users_description.keys()
+
+    for receiver_id, mark, count in store.find(
+            (models.ReceiverTip.receiver_id, models.ReceiverTip.mark, Count()),
+            models.ReceiverTip.receiver_id.is_in(receivers_ids)).group_by(
+            models.ReceiverTip.receiver_id, models.ReceiverTip.mark):
+        users_description[receiver_id]['receivertips'][mark] = count
+
+    for receiver_id, mark, count, downloads in store.find(
+            (models.ReceiverFile.receiver_id, models.ReceiverFile.mark,
+             Count(), Sum(models.ReceiverFile.downloads)),
+            models.ReceiverFile.receiver_id.is_in(receivers_ids)).group_by(
+            models.ReceiverFile.receiver_id, models.ReceiverFile.mark):
+        users_description[receiver_id]['receiverfiles'][mark] = count
+        users_description[receiver_id]['downloads'] += downloads
+
+    return serialize_page(total, [users_description[receiver.id] for receiver in receivers], next_cursor)
+
+def serialize_file_overview(ifile, rfiles):
+    file_desc = {
+        'id': ifile.id,
+        'name': ifile.name,
+        'content_type': ifile.content_type,
+        'size': ifile.size,
+        'itip': ifile.internaltip_id,
+        'creation_date': datetime_to_ISO8601(ifile.creation_date),
+        'rfiles': rfiles,
+        'stored': None,
+        'path': '',
+    }
+
+    if os.path.isfile(ifile.file_path):
+        file_desc['stored'] = True
+        file_desc['path'] = ifile.file_path
+    else:
+        if ifile.mark == 'ready': # is the status userd by plaintext files
+            log.err("InternalFile %s references a not existent file: %s" %
+                    (file_desc['id'], ifile.file_path) )
+
+        file_desc['stored'] = False
+
+    return file_desc
+
+def count_receiverfiles(store, *conditions):
+    """
+    @return: a dict with the number of ReceiverFile of each InternalFile
+    """
+    return dict(store.find((models.ReceiverFile.internalfile_id, Count()),
+                           *conditions).group_by(models.ReceiverFile.internalfile_id))
+
 @transact_ro
 def collect_files_overview(store):
 
@@ -150,29 +325,14 @@ def collect_files_overview(store):
     stored_rfiles = store.find(models.ReceiverFile)
     stored_rfiles.order_by(Desc(models.ReceiverFile.creation_date))
 
+    rfiles_n = count_receiverfiles(store)
+
     # ifile evaluation
     for ifile in stored_ifiles:
 
-        file_desc = {
-            'id': ifile.id,
-            'name': ifile.name,
-            'content_type': ifile.content_type,
-            'size': ifile.size,
-            'itip': ifile.internaltip_id,
-            'creation_date': datetime_to_ISO8601(ifile.creation_date),
-            'rfiles': 0,
-            'stored': None,
-            'path': '',
-        }
-
-        file_desc['rfiles'] = store.find(models.ReceiverFile,
-                                         models.ReceiverFile.internalfile_id == ifile.id).count()
-
-        if os.path.isfile(ifile.file_path):
-
-            file_desc['stored'] = True
-            file_desc['path'] = ifile.file_path
+        file_desc = serialize_file_overview(ifile, rfiles_n.get(ifile.id, 0))
 
+        if file_desc['stored']:
             # disk_files contains all the files present in the submission_dir
             # we remove the InternalFiles one by one, and the goal is to keep
             # in disk_files all the not referenced files.
@@ -181,13 +341,6 @@ def collect_files_overview(store):
             if filename in disk_files:
                 disk_files.remove(filename)
 
-        else:
-            if ifile.mark == 'ready': # is the status userd by plaintext files
-                log.err("InternalFile %s references a not existent file: %s" %
-                        (file_desc['id'], ifile.file_path) )
-
-            file_desc['stored'] = False
-
         file_description_list.append(file_desc)
 
     # remaining files are checked for rfile presence
@@ -247,6 +400,60 @@ def collect_files_overview(store):
     return file_description_list
 
 
+@transact_ro
+def collect_files_overview_page(store, limit, after=None, status=None, itip=None):
+    """
+    The page of the InternalFiles; the files on disk not referenced by
+    any of them are reported only by the complete overview.
+    """
+    conditions = []
+
+    if status is not None:
+        conditions.append(models.InternalFile.mark == status)
+
+    if itip is not None:
+        conditions.append(models.InternalFile.internaltip_id == itip)
+
+    total, ifiles, next_cursor = keyset_page(store, models.InternalFile, conditions, limit, after)
+
+    rfiles_n = count_receiverfiles(store, models.ReceiverFile.internalfile_id.is_in(
+        [ifile.id for ifile in ifiles]))
+
+    file_description_list = [serialize_file_overview(ifile, rfiles_n.get(ifile.id, 0))
+                             for ifile in ifiles]
+
+    return serialize_page(total, file_description_list, next_cursor)
+
+
+def get_page_arguments(handler, *filters):
+    """
+    @return: None if the request does not ask for a page, otherwise the
+        dict of the 'limit', 'after' and filters arguments of the request
+    """
+    limit = handler.get_argument('limit', None)
+
+    if limit is None:
+        return None
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise errors.InvalidInputFormat("Invalid page limit")
+
+    if limit < 1 or limit > GLSetting.overview_page_maximum_size:
+        raise errors.InvalidInputFormat("Invalid page limit")
+
+    arguments = {
+        'limit': limit,
+        'after': handler.get_argument('after', None),
+    }
+
+    for filter_name in filters:
+        arguments[filter_name] = handler.get_argument(filter_name, None)
+
+    return arguments
+
+
 class Tips(BaseHandler):
     """
     /admin/overview/tips
@@ -258,14 +465,20 @@ class Tips(BaseHandler):
     @inlineCallbacks
     def get(self, *uriargs):
         """
-        Parameters: None
-        Response: TipsOverviewList
-        Errors: None
+        Parameters: limit, after, status, context_id (optional)
+        Response: TipsOverviewList, or TipsOverviewPage if limit is specified
+        Errors: InvalidInputFormat
         """
-        tips_complete_list = yield collect_tip_overview(self.request.language)
+        page_arguments = get_page_arguments(self, 'status', 'context_id')
+
+        if page_arguments is None:
+            tips_overview = yield collect_tip_overview(self.request.language)
+        else:
+            tips_overview = yield collect_tip_overview_page(language=self.request.language,
+                                                            **page_arguments)
 
         self.set_status(200)
-        self.finish(tips_complete_list)
+        self.finish(tips_overview)
 
 
 class Users(BaseHandler):
@@ -279,14 +492,19 @@ class Users(BaseHandler):
     @inlineCallbacks
     def get(self, *uriargs):
         """
-        Parameters: None
-        Response: UsersOverviewList
-        Errors: None
+        Parameters: limit, after, gpg_key_status (optional)
+        Response: UsersOverviewList, or UsersOverviewPage if limit is specified
+        Errors: InvalidInputFormat
         """
-        users_complete_list = yield collect_users_overview()
+        page_arguments = get_page_arguments(self, 'gpg_key_status')
+
+        if page_arguments is None:
+            users_overview = yield collect_users_overview()
+        else:
+            users_overview = yield collect_users_overview_page(**page_arguments)
 
         self.set_status(200)
-        self.finish(users_complete_list)
+        self.finish(users_overview)
 
 
 class Files(BaseHandler):
@@ -302,12 +520,16 @@ class Files(BaseHandler):
     @inlineCallbacks
     def get(self, *uriargs):
         """
-        Parameters: None
-        Response: FilesOverviewList
-        Errors: None
+        Parameters: limit, after, status, itip (optional)
+        Response: FilesOverviewList, or FilesOverviewPage if limit is specified
+        Errors: InvalidInputFormat
         """
+        page_arguments = get_page_arguments(self, 'status', 'itip')
 
-        file_complete_list = yield collect_files_overview()
+        if page_arguments is None:
+            files_overview = yield collect_files_overview()
+        else:
+            files_overview = yield collect_files_overview_page(**page_arguments)
 
         self.set_status(200)
-        self.finish(file_complete_list)
+        self.finish(files_overview)
@@ -6,12 +6,14 @@
 # Used by receivers to update personal preferences and access to personal data
 
 from twisted.internet.defer import inlineCallbacks
-from storm.expr import Desc
+from storm.expr import Desc, Count
 
 from globaleaks.utils.utility import log, acquire_bool, datetime_to_ISO8601
 from globaleaks.utils.structures import Rosetta, Fields
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.models import Receiver, Context, ReceiverTip, ReceiverFile, Message, Node
+from globaleaks.utils.apicache import GLApiCache
+from globaleaks.models import Receiver, Context, ReceiverTip, ReceiverFile, Message, Node, \
+    InternalTip, Comment
 from globaleaks.settings import transact, transact_ro, GLSetting
 from globaleaks.handlers.authentication import authenticated, transport_security_check
 from globaleaks.rest import requests, errors
@@ -139,77 +141,103 @@ class ReceiverInstance(BaseHandler):
         receiver_status = yield update_receiver_settings(self.current_user['user_id'],
             request, self.request.language)
 
+        # the public receivers list exposes the description and the key status
+        GLApiCache.invalidate()
+
         self.set_status(200)
         self.finish(receiver_status)
 
 
+def serialize_context_preview(context, language):
+    """
+    @return: the name of the context and the (key, label) of the fields
+        of the context shown in the preview of the tips
+    """
+    mo = Rosetta()
+    mo.acquire_storm_object(context)
+
+    fo = Fields(context.localized_fields, context.unique_fields)
+
+    return mo.dump_translated('name', language), fo.get_preview_keys(language).items()
+
 @transact_ro
 def get_receiver_tip_list(store, receiver_id, language=GLSetting.memory_copy.default_language):
-
-    rtiplist = store.find(ReceiverTip, ReceiverTip.receiver_id == receiver_id)
+    """
+    The summary of the tips is built with a fixed number of queries: the
+    tips joined with their internaltips, and the counters of the files,
+    the comments and the messages grouped by tip; the contexts are
+    serialized once each.
+    """
+    rtiplist = store.find((ReceiverTip, InternalTip),
+                          ReceiverTip.receiver_id == receiver_id,
+                          InternalTip.id == ReceiverTip.internaltip_id)
     rtiplist.order_by(Desc(ReceiverTip.creation_date))
 
     node = store.find(Node).one()
+    receiver = store.find(Receiver, Receiver.id == receiver_id).one()
 
-    rtip_summary_list = []
+    rfiles_n = dict(store.find((ReceiverFile.internaltip_id, Count()),
+                               ReceiverFile.receiver_id == receiver_id).group_by(ReceiverFile.internaltip_id))
 
-    for rtip in rtiplist:
+    comments_n = dict(store.find((Comment.internaltip_id, Count()),
+                                 Comment.internaltip_id == ReceiverTip.internaltip_id,
+                                 ReceiverTip.receiver_id == receiver_id).group_by(Comment.internaltip_id))
 
-        postpone_superpower = (node.postpone_superpower or
-                               rtip.internaltip.context.postpone_superpower or
-                               rtip.receiver.postpone_superpower)
+    # (receivertip_id, type, visualized) => messages
+    messages_n = {}
+    for rtip_id, message_type, visualized, count in store.find(
+            (Message.receivertip_id, Message.type, Message.visualized, Count()),
+            Message.receivertip_id == ReceiverTip.id,
+            ReceiverTip.receiver_id == receiver_id).group_by(
+            Message.receivertip_id, Message.type, Message.visualized):
+        messages_n[(rtip_id, message_type, bool(visualized))] = count
 
-        can_delete_submission = (node.can_delete_submission or
-                                 rtip.internaltip.context.can_delete_submission or
-                                 rtip.receiver.can_delete_submission)
+    contexts = {}
 
-        rfiles_n = store.find(ReceiverFile,
-            (ReceiverFile.internaltip_id == rtip.internaltip.id,
-             ReceiverFile.receiver_id == receiver_id)).count()
+    rtip_summary_list = []
 
-        your_messages = store.find(Message,
-                                   Message.receivertip_id == rtip.id,
-                                   Message.type == u'receiver').count()
+    for rtip, itip in rtiplist:
 
-        unread_messages = store.find(Message,
-                                     Message.receivertip_id == rtip.id,
-                                     Message.type == u'whistleblower',
-                                     Message.visualized == False).count()
+        if itip.context_id not in contexts:
+            context = store.find(Context, Context.id == itip.context_id).one()
+            contexts[itip.context_id] = (context, serialize_context_preview(context, language))
 
-        read_messages = store.find(Message,
-                                   Message.receivertip_id == rtip.id,
-                                   Message.type == u'whistleblower',
-                                   Message.visualized == True).count()
+        context, (context_name, preview_keys) = contexts[itip.context_id]
+
+        postpone_superpower = (node.postpone_superpower or
+                               context.postpone_superpower or
+                               receiver.postpone_superpower)
+
+        can_delete_submission = (node.can_delete_submission or
+                                 context.can_delete_submission or
+                                 receiver.can_delete_submission)
 
         single_tip_sum = dict({
             'id' : rtip.id,
             'expressed_pertinence': rtip.expressed_pertinence,
             'creation_date' : datetime_to_ISO8601(rtip.creation_date),
             'last_access' : datetime_to_ISO8601(rtip.last_access),
-            'expiration_date' : datetime_to_ISO8601(rtip.internaltip.expiration_date),
+            'expiration_date' : datetime_to_ISO8601(itip.expiration_date),
             'access_counter': rtip.access_counter,
-            'files_number': rfiles_n,
-            'comments_number': rtip.internaltip.comments.count(),
-            'unread_messages' : unread_messages,
-            'read_messages' : read_messages,
-            'your_messages' : your_messages,
+            'files_number': rfiles_n.get(itip.id, 0),
+            'comments_number': comments_n.get(itip.id, 0),
+            'unread_messages' : messages_n.get((rtip.id, u'whistleblower', False), 0),
+            'read_messages' : messages_n.get((rtip.id, u'whistleblower', True), 0),
+            'your_messages' : messages_n.get((rtip.id, u'receiver', False), 0) +
+                              messages_n.get((rtip.id, u'receiver', True), 0),
             'postpone_superpower': postpone_superpower,
             'can_delete_submission': can_delete_submission,
+            'context_name': context_name,
         })
 
-        mo = Rosetta()
-        mo.acquire_storm_object(rtip.internaltip.context)
-        single_tip_sum["context_name"] = mo.dump_translated('name', language)
-
         preview_data = []
 
-        fo = Fields(rtip.internaltip.context.localized_fields, rtip.internaltip.context.unique_fields)
-        for preview_key, preview_label in fo.get_preview_keys(language).iteritems():
+        for preview_key, preview_label in preview_keys:
 
             # preview in a format angular.js likes
             try:
                 entry = dict({'label' : preview_label,
-                              'text': rtip.internaltip.wb_fields[preview_key] })
+                              'text': itip.wb_fields[preview_key] })
 
             except KeyError as xxx:
                 log.err("Legacy error: suppressed 'preview_keys' %s" % xxx.message )
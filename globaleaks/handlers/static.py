@@ -0,0 +1,173 @@
+# -*- encoding: utf-8 -*-
+#
+#  static
+#  ******
+#
+# The static files served from memory by BaseStaticFileHandler,
+# together with their gzip compression.
+
+import os
+import stat
+import zlib
+import mimetypes
+import datetime
+
+from twisted.python.threadpool import ThreadPool
+from twisted.internet.defer import succeed
+from twisted.internet.threads import deferToThreadPool
+from twisted.internet import reactor
+
+from globaleaks.settings import GLSetting
+from globaleaks.utils.apicache import strong_etag
+
+
+def accepts_encoding(accept_encoding, encoding):
+    """
+    Evaluate an Accept-Encoding header: an encoding is accepted if it is
+    listed, or matched by '*', with a quality value greater than zero.
+    """
+    if not accept_encoding:
+        return False
+
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        params = item.split(';')
+        name = params[0].strip().lower()
+
+        qvalue = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+
+        qvalues[name] = qvalue
+
+    return qvalues.get(encoding, qvalues.get('*', 0.0)) > 0
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+def compressible_mime_type(mime_type):
+    if mime_type is None:
+        return False
+
+    return mime_type.startswith('text/') or \
+           mime_type.endswith('+xml') or \
+           mime_type in ('application/javascript',
+                         'application/x-javascript',
+                         'application/json',
+                         'application/xml')
+
+
+def file_etag(path, st):
+    """
+    The static files change only when replaced on disk, so that their
+    entity tag is derived from the file identity without reading it.
+    """
+    return strong_etag("%s:%d:%d:%f" % (path, st.st_ino, st.st_size, st.st_mtime))
+
+
+class GLStaticAsset(object):
+    """
+    A static file kept in memory together with its gzip compression,
+    when the compression is useful.
+    """
+    def __init__(self, path, st):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+
+        self.identity = (st.st_ino, st.st_size, st.st_mtime)
+        self.modified = datetime.datetime.fromtimestamp(int(st.st_mtime))
+        self.mime_type = mimetypes.guess_type(path)[0]
+        self.etag = file_etag(path, st)
+
+        self.gzip_data = None
+        self.gzip_etag = None
+        if compressible_mime_type(self.mime_type):
+            compressed = gzip_compress(self.data)
+            if len(compressed) < len(self.data):
+                self.gzip_data = compressed
+                # every representation has its own strong entity tag
+                self.gzip_etag = self.etag[:-1] + '-gzip"'
+
+    def is_current(self, st):
+        return self.identity == (st.st_ino, st.st_size, st.st_mtime)
+
+
+def load_static_asset(path, st):
+    try:
+        return GLStaticAsset(path, st)
+    except IOError:
+        return None
+
+
+class GLStaticAssets(object):
+    """
+    The table of the static files served from memory, by absolute path.
+    The GLClient is loaded at the start; every file is checked with a
+    stat() when requested, and loaded again if changed on the disk, so
+    that an upgraded client or a file uploaded by the admin are served
+    without a restart. The files are read and compressed by the thread
+    of GLStaticAssets.tp, out of the reactor.
+    """
+    tp = ThreadPool(0, 1)
+
+    assets = {}
+
+    @classmethod
+    def stat(cls, path):
+        """
+        @return: the stat of path, or None if path is not a file
+                 to be kept in memory.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            cls.assets.pop(path, None)
+            return None
+
+        if not stat.S_ISREG(st.st_mode) or st.st_size > GLSetting.static_asset_maximum_size:
+            cls.assets.pop(path, None)
+            return None
+
+        return st
+
+    @classmethod
+    def get(cls, path, st):
+        """
+        @return: a Deferred fired with the GLStaticAsset of path, or with
+                 None if the file could not be read.
+        """
+        asset = cls.assets.get(path)
+        if asset is not None and asset.is_current(st):
+            return succeed(asset)
+
+        d = deferToThreadPool(reactor, cls.tp, load_static_asset, path, st)
+        d.addCallback(cls.loaded, path)
+        return d
+
+    @classmethod
+    def loaded(cls, asset, path):
+        if asset is None:
+            cls.assets.pop(path, None)
+        else:
+            cls.assets[path] = asset
+
+        return asset
+
+    @classmethod
+    def preload(cls, directory):
+        for root, dirs, files in os.walk(directory):
+            for filename in files:
+                path = os.path.abspath(os.path.join(root, filename))
+                st = cls.stat(path)
+                if st is not None:
+                    cls.loaded(load_static_asset(path, st), path)
+
+    @classmethod
+    def reset(cls):
+        cls.assets.clear()
@@ -13,7 +13,9 @@ from globaleaks.settings import transact_ro, GLSetting, external_counted_events
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.authentication import transport_security_check, authenticated
 from globaleaks.models import Stats
-from globaleaks.utils.utility import datetime_to_ISO8601
+from globaleaks.utils.utility import datetime_to_ISO8601, uniform_delay_wheel
+from globaleaks.utils.metrics import request_metrics, transaction_metrics, \
+    transaction_profiles
 
 @transact_ro
 def admin_serialize_stats(store, language=GLSetting.memory_copy.default_language):
@@ -73,4 +75,34 @@ class StatsCollection(BaseHandler):
         self.finish(stats_block)
 
 
+class MetricsCollection(BaseHandler):
+    """
+    This Handler returns the metrics of the requests served since the start:
+    by handler, the status codes and the latency histograms; the retries of
+    the transactions and their profiles by function, and the status of the
+    answers delayed by uniform_answers_delay.
+    With ?format=prometheus the metrics are in the Prometheus text format.
+    """
 
+    @transport_security_check("admin")
+    @authenticated("admin")
+    def get(self, *uriargs):
+        uniform_delay = uniform_delay_wheel.stats()
+
+        if self.get_argument('format', 'json') == 'prometheus':
+            self.set_header('Content-Type', 'text/plain; version=0.0.4')
+            self.finish(request_metrics.prometheus() +
+                        transaction_metrics.prometheus() +
+                        transaction_profiles.prometheus() +
+                        '# TYPE globaleaks_uniform_delay_parked gauge\n'
+                        'globaleaks_uniform_delay_parked %d\n'
+                        '# TYPE globaleaks_uniform_delay_released_total counter\n'
+                        'globaleaks_uniform_delay_released_total %d\n' %
+                        (uniform_delay['parked'], uniform_delay['released']))
+        else:
+            self.finish({
+                'handlers': request_metrics.serialize(),
+                'transactions': transaction_metrics.serialize(),
+                'transaction_profiles': transaction_profiles.serialize(),
+                'uniform_delay': uniform_delay
+            })
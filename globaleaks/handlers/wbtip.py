@@ -349,7 +349,6 @@ def get_messages_content(store, wb_tip_id, receiver_id):
             log.debug("Marking as readed message [%s] from %s" % (msg.content, msg.author))
             msg.visualized = True
 
-    store.commit()
     return messages_list
 
 
@@ -9,6 +9,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.settings import transact, transact_ro, GLSetting
 from globaleaks.handlers.base import BaseHandler
+from globaleaks.utils.apicache import GLApiCache
 from globaleaks.handlers.authentication import authenticated, transport_security_check
 from globaleaks.handlers.admin import db_create_context, db_create_receiver, db_update_node
 from globaleaks.rest import errors, requests
@@ -155,6 +156,8 @@ class AppdataCollection(BaseHandler):
 
         app_fields_dump = yield admin_update_appdata(request)
 
+        GLApiCache.invalidate()
+
         self.set_status(202) # Updated
         self.finish(app_fields_dump)
 
@@ -175,6 +178,8 @@ class FirstSetup(BaseHandler):
 
         yield wizard(request, self.request.language)
 
+        GLApiCache.invalidate()
+
         self.set_status(201) # Created
         self.finish()
 
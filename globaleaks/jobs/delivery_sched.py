@@ -84,6 +84,44 @@ def get_receiverfile_by_itip(store, itip_id):
     return rfile_list
 
 
+@transact_ro
+def get_orphan_files(store):
+    """
+    @return: the (name, path) of the InternalFiles to be processed that
+             have not an InternalTip assigned.
+    """
+    orphan_files = []
+    for filex in store.find(InternalFile, InternalFile.mark == u'not processed'):
+        if not filex.internaltip:
+            orphan_files.append((filex.name, filex.file_path))
+
+    return orphan_files
+
+def remove_orphan_files(orphan_files):
+    """
+    Removes the files, and their keys, returned by get_orphan_files: this
+    is done out of the transactions, that may be run more than once.
+    """
+    for name, file_path in orphan_files:
+        log.err("Integrity failure: the file %s"\
+                "has not an InternalTip assigned (path: %s)" %
+                (name, file_path) )
+
+        try:
+            os.remove(os.path.join(GLSetting.submission_path, file_path))
+        except OSError as excep:
+            log.err("Unable to remove %s in integrity fixing routine: %s" %
+                (file_path, excep.strerror) )
+
+        key_id = os.path.basename(file_path).split('.')[0]
+        keypath = os.path.join(GLSetting.ramdisk_path, ("%s%s" % (GLSetting.AES_keyfile_prefix, key_id)))
+
+        try:
+            os.remove(keypath)
+        except OSError as excep:
+            log.err("Unable to delete keyfile %s: %s" % (keypath, excep.strerror))
+
+
 @transact
 def receiverfile_planning(store):
     """
@@ -107,24 +145,7 @@ def receiverfile_planning(store):
     for filex in files:
 
         if not filex.internaltip:
-            log.err("Integrity failure: the file %s"\
-                    "has not an InternalTip assigned (path: %s)" %
-                    (filex.name, filex.file_path) )
-
-            try:
-                os.remove(os.path.join(GLSetting.submission_path, filex.file_path))
-            except OSError as excep:
-                log.err("Unable to remove %s in integrity fixing routine: %s" %
-                    (filex.file_path, excep.strerror) )
-
-            key_id = os.path.basename(filex.file_path).split('.')[0]
-            keypath = os.path.join(GLSetting.ramdisk_path, ("%s%s" % (GLSetting.AES_keyfile_prefix, key_id)))
-
-            try:
-                os.remove(keypath)
-            except OSError as excep:
-                log.err("Unable to delete keyfile %s: %s" % (keypath, excep.strerror))
-
+            # removed by remove_orphan_files
             continue
 
         # here we select the file which deserve to be processed.
@@ -394,6 +415,9 @@ class DeliverySchedule(GLJob):
         #     InternalFile is set as 'locked' status
         #     and would be unlocked at the end.
         # TODO xxx limit of file number per operation
+        orphan_files = yield get_orphan_files()
+        remove_orphan_files(orphan_files)
+
         filemap = yield receiverfile_planning()
         # the function returns a dict of lists with dicts:
         # {
@@ -117,7 +117,6 @@ class NotificationSchedule(GLJob):
             if not receiver_desc['tip_notification']:
                 log.debug("Receiver %s has tip notification disabled" % receiver_tip.receiver.user.username)
                 receiver_tip.mark = models.ReceiverTip._marker[3] # 'disabled'
-                store.commit()
                 continue
 
             tip_desc = serialize_receivertip(receiver_tip)
@@ -507,7 +506,6 @@ class NotificationSchedule(GLJob):
                 log.debug("Receiver %s has file notification disabled: %s skipped" % (
                     rfile.receiver.user.username, rfile.internalfile.name ))
                 rfile.mark = models.ReceiverFile._marker[3] # 'disabled'
-                store.commit()
                 continue
 
             # by ticket https://github.com/globaleaks/GlobaLeaks/issues/444
@@ -516,7 +514,6 @@ class NotificationSchedule(GLJob):
                 rfile.mark = models.ReceiverFile._marker[4] # 'skipped'
                 log.debug("Skipped notification of %s (for %s) because Tip not yet notified" %
                           (rfile.internalfile.name, rfile.receiver.name) )
-                store.commit()
                 continue
 
             tip_desc = serialize_receivertip(rfile.receiver_tip)
@@ -17,6 +17,7 @@ from globaleaks.jobs.base import GLJob
 from globaleaks.models import Receiver
 from globaleaks.settings import GLSetting, transact
 from globaleaks.security import GLBGPG
+from globaleaks.utils.apicache import GLApiCache
 
 __all__ = ['PGPCheckSchedule']
 
@@ -52,6 +53,9 @@ class PGPCheckSchedule(GLJob):
     def operation(self):
         yield self.pgp_validation_check()
 
+        # the key status of the receivers is exposed by the public API
+        GLApiCache.invalidate()
+
 
 untranslated_template ="""
 This is an untranslated message from a GlobaLeaks node.
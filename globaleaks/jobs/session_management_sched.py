@@ -20,6 +20,8 @@ class SessionManagementSchedule(GLJob):
         """
         This scheduler is responsible of:
             - Removal of expired sessions
+            - Removal of expired resumable downloads
+            - Removal of expired upload sessions
             - Reset of failed login attempts counters
         """
 
@@ -46,5 +48,20 @@ class SessionManagementSchedule(GLJob):
             log.err("Exception failure in session cleaning routine (%s)" % excep.message)
             sys.excepthook(*sys.exc_info())
 
+        # Removal of expired resumable downloads
+        for download in GLSetting.resumable_downloads.keys():
+            if is_expired(GLSetting.resumable_downloads[download]['date'],
+                          seconds=GLSetting.download_resume_seconds):
+                del GLSetting.resumable_downloads[download]
+
+        # Removal of expired upload sessions, with their temporary files
+        for upload_id in GLSetting.upload_sessions.keys():
+            upload = GLSetting.upload_sessions[upload_id]
+            if not upload.writing and \
+                    (is_expired(upload.refreshdate, seconds=GLSetting.upload_session_seconds) or
+                     is_expired(upload.creationdate, seconds=GLSetting.upload_session_lifetime_seconds)):
+                del GLSetting.upload_sessions[upload_id]
+                upload.body.close()
+
         # Reset of failed login attempts counters
         GLSetting.failed_login_attempts = 0
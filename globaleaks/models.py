@@ -4,12 +4,115 @@
 #
 # GlobaLeaks ORM Models definition
 
+import json
 import types
+import zlib
 
-from storm.locals import Bool, DateTime, Int, Pickle, Reference, ReferenceSet, Unicode, Storm
+from storm.locals import Bool, DateTime, Int, Reference, ReferenceSet, Unicode, Storm
+from storm.properties import SimpleProperty
+from storm.variables import MutableValueVariable, Undef
 from globaleaks.utils.utility import datetime_now, uuid4
 from globaleaks.utils.validator import shorttext_v, longtext_v, shortlocal_v, longlocal_v, dict_v
 
+# the JSON of the LazyJSON(compress=True) columns is zlib compressed when
+# longer than this threshold, and stored prefixed by the 'z' marker, that
+# can not be the first character of a JSON document.
+json_compression_threshold = 1024
+json_compression_marker = 'z'
+
+class EncodedJSON(object):
+    """
+    The value of a LazyJSON column as read from the database, still
+    to be decoded.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+class LazyJSONVariable(MutableValueVariable):
+    """
+    The value read from the database is decoded on its first access: the
+    columns that are not used do not cost a decode when the rows are
+    loaded, nor an encode when the store is flushed to detect changes.
+    """
+    __slots__ = ('_compress',)
+
+    def __init__(self, *args, **kwargs):
+        self._compress = kwargs.pop('compress', False)
+        MutableValueVariable.__init__(self, *args, **kwargs)
+
+    def _loads(self, data):
+        if data[:1] == json_compression_marker:
+            data = zlib.decompress(data[1:])
+
+        return json.loads(data)
+
+    def _dumps(self, value):
+        # the encoding is canonical, so that an unchanged value is encoded
+        # in the same data read from the database
+        data = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        if self._compress and len(data) > json_compression_threshold:
+            data = json_compression_marker + zlib.compress(data)
+
+        return data
+
+    def parse_set(self, value, from_db):
+        if not from_db:
+            return value
+
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+
+        return EncodedJSON(str(value))
+
+    def parse_get(self, value, to_db):
+        if isinstance(value, EncodedJSON):
+            if to_db:
+                return value.data
+
+            decoded = self._loads(value.data)
+            # Variable.set() decodes the replaced value too: only the
+            # current one is cached
+            if value is self._value:
+                self._value = decoded
+            return decoded
+
+        if to_db:
+            return self._dumps(value)
+
+        return value
+
+    def get_state(self):
+        value = self._value
+
+        if isinstance(value, EncodedJSON):
+            return (self._lazy_value, value.data)
+
+        if value is Undef or value is None:
+            return (self._lazy_value, value)
+
+        return (self._lazy_value, self._dumps(value))
+
+    def set_state(self, state):
+        self._lazy_value, value = state
+
+        if isinstance(value, str):
+            value = EncodedJSON(value)
+
+        self._value = value
+
+class LazyJSON(SimpleProperty):
+    """
+    A JSON column decoded lazily; LazyJSON(compress=True) compresses
+    the large values.
+    """
+    variable_class = LazyJSONVariable
+
+
 class Model(Storm):
     """
     Base class for working the database
@@ -140,13 +243,13 @@ class Context(Model):
     # "required" : bool
     # "type" : unicode
     # "options" : dict (optional!)
-    unique_fields = Pickle()
+    unique_fields = LazyJSON()
 
     # Localized fields is a dict having as keys, the same
     # keys of unique_fields, and as value a dict, containing:
     # 'name' : unicode
     # 'hint' : unicode
-    localized_fields = Pickle()
+    localized_fields = LazyJSON()
 
     selectable_receiver = Bool()
     escalation_threshold = Int()
@@ -157,13 +260,13 @@ class Context(Model):
     tip_timetolive = Int()
     submission_timetolive = Int()
     last_update = DateTime()
-    tags = Pickle()
+    tags = LazyJSON()
 
     # localized stuff
-    name = Pickle(validator=shortlocal_v)
-    description = Pickle(validator=longlocal_v)
-    receiver_introduction = Pickle(validator=longlocal_v)
-    fields_introduction = Pickle(validator=longlocal_v)
+    name = LazyJSON(validator=shortlocal_v)
+    description = LazyJSON(validator=longlocal_v)
+    receiver_introduction = LazyJSON(validator=longlocal_v)
+    fields_introduction = LazyJSON(validator=longlocal_v)
 
     #receivers = ReferenceSet(
     #                         Context.id,
@@ -213,7 +316,7 @@ class InternalTip(Model):
     #internalfiles = ReferenceSet(InternalTip.id, InternalFile.internaltip_id)
     #receivers = ReferenceSet(InternalTip.id, Receiver.id)
 
-    wb_fields = Pickle(validator=dict_v)
+    wb_fields = LazyJSON(validator=dict_v, compress=True)
     pertinence_counter = Int()
     expiration_date = DateTime()
     last_activity = DateTime()
@@ -344,7 +447,7 @@ class Comment(Model):
     content = Unicode(validator=longtext_v)
 
     # In case of system_content usage, content has repr() equiv
-    system_content = Pickle()
+    system_content = LazyJSON()
 
     type = Unicode()
     _types = [ u'receiver', u'whistleblower', u'system' ]
@@ -391,14 +494,14 @@ class Node(Model):
     # this has a dedicated validator in update_node()
     receipt_regexp = Unicode()
 
-    languages_enabled = Pickle()
+    languages_enabled = LazyJSON()
     default_language = Unicode()
 
     # localized string
-    description = Pickle(validator=longlocal_v)
-    presentation = Pickle(validator=longlocal_v)
-    footer = Pickle(validator=longlocal_v)
-    subtitle = Pickle(validator=longlocal_v)
+    description = LazyJSON(validator=longlocal_v)
+    presentation = LazyJSON(validator=longlocal_v)
+    footer = LazyJSON(validator=longlocal_v)
+    subtitle = LazyJSON(validator=longlocal_v)
 
     # Here is set the time frame for the stats publicly exported by the node.
     # Expressed in hours
@@ -453,27 +556,27 @@ class Notification(Model):
     security = Unicode()
     _security_types = [ u'TLS', u'SSL' ]
 
-    encrypted_tip_template = Pickle(validator=longlocal_v)
-    encrypted_tip_mail_title = Pickle(validator=longlocal_v)
-    plaintext_tip_template = Pickle(validator=longlocal_v)
-    plaintext_tip_mail_title = Pickle(validator=longlocal_v)
+    encrypted_tip_template = LazyJSON(validator=longlocal_v, compress=True)
+    encrypted_tip_mail_title = LazyJSON(validator=longlocal_v)
+    plaintext_tip_template = LazyJSON(validator=longlocal_v, compress=True)
+    plaintext_tip_mail_title = LazyJSON(validator=longlocal_v)
 
-    encrypted_file_template = Pickle(validator=longlocal_v)
-    encrypted_file_mail_title = Pickle(validator=longlocal_v)
-    plaintext_file_template = Pickle(validator=longlocal_v)
-    plaintext_file_mail_title = Pickle(validator=longlocal_v)
+    encrypted_file_template = LazyJSON(validator=longlocal_v, compress=True)
+    encrypted_file_mail_title = LazyJSON(validator=longlocal_v)
+    plaintext_file_template = LazyJSON(validator=longlocal_v, compress=True)
+    plaintext_file_mail_title = LazyJSON(validator=longlocal_v)
 
-    encrypted_comment_template = Pickle(validator=longlocal_v)
-    encrypted_comment_mail_title = Pickle(validator=longlocal_v)
-    plaintext_comment_template = Pickle(validator=longlocal_v)
-    plaintext_comment_mail_title = Pickle(validator=longlocal_v)
+    encrypted_comment_template = LazyJSON(validator=longlocal_v, compress=True)
+    encrypted_comment_mail_title = LazyJSON(validator=longlocal_v)
+    plaintext_comment_template = LazyJSON(validator=longlocal_v, compress=True)
+    plaintext_comment_mail_title = LazyJSON(validator=longlocal_v)
 
-    encrypted_message_template = Pickle(validator=longlocal_v)
-    encrypted_message_mail_title = Pickle(validator=longlocal_v)
-    plaintext_message_template = Pickle(validator=longlocal_v)
-    plaintext_message_mail_title = Pickle(validator=longlocal_v)
+    encrypted_message_template = LazyJSON(validator=longlocal_v, compress=True)
+    encrypted_message_mail_title = LazyJSON(validator=longlocal_v)
+    plaintext_message_template = LazyJSON(validator=longlocal_v, compress=True)
+    plaintext_message_mail_title = LazyJSON(validator=longlocal_v)
 
-    zip_description = Pickle(validator=longlocal_v)
+    zip_description = LazyJSON(validator=longlocal_v)
 
     unicode_keys = ['server', 'username', 'password', 'source_name', 'source_email' ]
     localized_strings = [ 'encrypted_tip_template', 'encrypted_tip_mail_title',
@@ -501,7 +604,7 @@ class Receiver(Model):
     name = Unicode(validator=shorttext_v)
 
     # localization string
-    description = Pickle(validator=longlocal_v)
+    description = LazyJSON(validator=longlocal_v)
 
     # of GPG key fields
     gpg_key_info = Unicode()
@@ -526,7 +629,7 @@ class Receiver(Model):
     last_update = DateTime()
 
     # Group which the Receiver is part of
-    tags = Pickle()
+    tags = LazyJSON()
 
     # personal advanced settings
     tip_notification = Bool()
@@ -579,7 +682,7 @@ class ApplicationData(Model):
     __storm_table__ = 'applicationdata'
 
     version = Int()
-    fields = Pickle()
+    fields = LazyJSON(compress=True)
 
 
 class Stats(Model):
@@ -588,7 +691,7 @@ class Stats(Model):
     """
     __storm_table__ = 'stats'
 
-    content = Pickle()
+    content = LazyJSON()
 
 
 #_*_# References tracking below #_*_#
@@ -45,6 +45,11 @@ spec = [
 
     (r'/submission/' + uuid_regexp + '/file', files.FileInstance),
 
+    (r'/submission/' + uuid_regexp + '/file/upload', files.FileUploadInstance),
+
+    #  (Resumable upload of a file)
+    (r'/upload/' + uuid_regexp, files.FileUploadSession),
+
     (r'/authentication', authentication.AuthenticationHandler),
 
     ## Receiver Tip Handlers ##
@@ -73,6 +78,8 @@ spec = [
 
     (r'/wbtip/upload', files.FileAdd),
 
+    (r'/wbtip/upload/session', files.FileUploadAdd),
+
     #  W5 interaction with a single receiver
     (r'/wbtip/messages/' + uuid_regexp, wbtip.WBTipMessageCollection),
 
@@ -92,6 +99,7 @@ spec = [
 
     (r'/admin/anomalies', statistics.AnomaliesCollection),
     (r'/admin/stats', statistics.StatsCollection),
+    (r'/admin/metrics', statistics.MetricsCollection),
 
     (r'/admin/wizard', wizard.FirstSetup),
 
@@ -446,3 +446,57 @@ class FileUploadFlood(FloodException):
         self.reason = "Too many file uploads in %d seconds" % seconds
         self.arguments = []
         self.arguments.append(seconds)
+
+class RequestedRangeNotSatisfiable(GLException):
+    """
+    The Range header of a download request points outside of the content.
+    """
+    reason = "Requested Range Not Satisfiable"
+    error_code = 58
+    status_code = 416
+
+class UploadSessionNotFound(GLException):
+    """
+    The requested upload session does not exists or is expired.
+    """
+    reason = "The requested upload session does not exists or is expired"
+    error_code = 59
+    status_code = 404
+
+class UploadOffsetMismatch(GLException):
+    """
+    The chunk of a resumable upload does not start at the current
+    offset of the upload session.
+    """
+    error_code = 60
+    status_code = 409
+
+    def __init__(self, offset):
+        self.reason = "The upload session is at offset %d" % offset
+        self.arguments = [offset]
+
+class UploadIncomplete(GLException):
+    """
+    A resumable upload has been finalized before receiving all the file.
+    """
+    reason = "The upload session has not received the whole file"
+    error_code = 61
+    status_code = 409
+
+class LoginQueueFull(GLException):
+    """
+    Too many credentials are waiting to be verified: the login is refused
+    instead of being queued behind them.
+    """
+    reason = "Too many login attempts in progress, retry later"
+    error_code = 62
+    status_code = 503 # Service Unavailable
+
+class DatabaseBusy(GLException):
+    """
+    The transaction kept failing on the database locked by the other
+    writers until the retry deadline.
+    """
+    reason = "The database is busy, retry later"
+    error_code = 63
+    status_code = 503 # Service Unavailable
@@ -7,6 +7,8 @@
 # These specifications may be used with rest.validateMessage() inside of the
 # handler to verify if the request is correct.
 
+from globaleaks.rest.validation import compile_templates
+
 uuid_regexp                    = r'^([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})$'
 receiver_img_regexp            = r'^([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}).png$'
 email_regexp                   = r'^([\w-]+\.)*[\w-]+@([\w-]+\.)+[a-z]{2,4}$|^$'
@@ -31,6 +33,12 @@ fileDict = {
     "date": dateType,
     }
 
+uploadSessionDesc = {
+    "name": unicode,
+    "content_type": contentType,
+    "size": int,
+    }
+
 formFieldsDict = {
     "key": unicode,
     "presentation_order": int,
@@ -266,6 +274,12 @@ TipOverview = {
 
 TipsOverview = [ TipOverview ]
 
+TipsOverviewPage = {
+    'total': int,
+    'next': unicode,
+    'elements': TipsOverview,
+}
+
 UserOverview = {
     'receivertips': list,
     'receiverfiles': list,
@@ -276,6 +290,21 @@ UserOverview = {
 
 UsersOverview = [ UserOverview ]
 
+UserOverviewCounters = {
+    'receivertips': dict,
+    'receiverfiles': dict,
+    'downloads': int,
+    'gpg_key_status': unicode,
+    'id': uuid_regexp,
+    'name': unicode,
+}
+
+UsersOverviewPage = {
+    'total': int,
+    'next': unicode,
+    'elements': [ UserOverviewCounters ],
+}
+
 FileOverview = {
     'rfiles': int,
     'stored': bool,
@@ -290,6 +319,12 @@ FileOverview = {
 
 FilesOverview = [ FileOverview ]
 
+FilesOverviewPage = {
+    'total': int,
+    'next': unicode,
+    'elements': FilesOverview,
+}
+
 StatsLine = {
      'file_uploaded': int,
      'new_submission': int,
@@ -397,3 +432,5 @@ internalTipDesc = {
     'escalation_threshold': int,
 }
 
+# the validators of the templates are compiled once, at import time
+compile_templates(dict(globals()))
@@ -0,0 +1,144 @@
+# -*- coding: UTF-8
+#   validation
+#   **********
+#
+# The message templates of globaleaks/rest/requests.py are compiled in
+# functions validating a message with a single pass on it.
+
+import collections
+import re
+
+from globaleaks.settings import GLSetting
+from globaleaks.utils.utility import log
+from globaleaks.rest import errors
+
+def compile_python_type(python_type):
+    """
+    Validator of a python class: 'int' fields are accepted also as 'unicode'
+    but cast on base 10 before validate them, 'bool' fields are accepted also
+    as 'true' 'false' because this happen on angular.js
+    """
+    if python_type == int:
+        def check(value):
+            try:
+                int(value)
+                return True
+            except Exception:
+                return False
+    elif python_type == bool:
+        def check(value):
+            return value == u'true' or value == u'false' or isinstance(value, bool)
+    else:
+        def check(value):
+            return isinstance(value, python_type)
+
+    def validate_python_type(value):
+        if value is None or check(value):
+            return True
+
+        log.err("-- Invalid python_type, in [%s] expected %s" % (value, python_type))
+        return False
+
+    return validate_python_type
+
+def compile_regexp(gl_type):
+    pattern = re.compile(gl_type)
+
+    def validate_regexp(value):
+        if isinstance(value, (str, unicode)) and pattern.match(value):
+            return True
+
+        log.err("-- Failed Match in regexp [%s] against %s" % (value, gl_type))
+        return False
+
+    return validate_regexp
+
+def compile_dict(message_template):
+    fields = [(key, compile_template(value)) for key, value in message_template.iteritems()]
+
+    def validate_dict(jmessage):
+        if not isinstance(jmessage, dict):
+            raise errors.InvalidInputFormat('wrong schema: expected a dict')
+
+        for key, validate in fields:
+            if key not in jmessage:
+                log.err('validate_message: key %s not in %s' % (key, jmessage))
+                raise errors.InvalidInputFormat('wrong schema: missing %s' % key)
+
+            if not validate(jmessage[key]):
+                raise errors.InvalidInputFormat("REST integrity check, fail in %s" % key)
+
+        if GLSetting.loglevel == "DEBUG":
+            # check if wrong keys are reaching the GLBackend
+            for key in jmessage:
+                if key not in message_template:
+                    log.err("[!?] validate_message: key %s not expected" % key)
+
+        return True
+
+    return validate_dict
+
+def compile_list(message_template):
+    validate_element = compile_template(message_template[0])
+
+    def validate_list(value):
+        # empty list is ok
+        for x in value:
+            if not validate_element(x):
+                log.err("-- List validation failed [%s] of %s" % (value, message_template))
+                return False
+
+        return True
+
+    return validate_list
+
+def compile_template(gl_type):
+    """
+    Compile a message template (see globaleaks/rest/requests.py) in a
+    function validating a message with a single pass on it, without
+    having to dispatch again on the template types and to compile the
+    regexps for every message.
+
+    @return: a function returning True if the value matches the template,
+             or raising InvalidInputFormat when a dict does not match it.
+    """
+    # if it's callable, than assumes is a primitive class
+    if callable(gl_type):
+        return compile_python_type(gl_type)
+    # value as "{foo:bar}"
+    elif isinstance(gl_type, collections.Mapping):
+        return compile_dict(gl_type)
+    # regexp
+    elif isinstance(gl_type, str):
+        return compile_regexp(gl_type)
+    # value as "[ type ]"
+    elif isinstance(gl_type, collections.Iterable):
+        return compile_list(gl_type)
+    else:
+        raise AssertionError
+
+# id(template) => (template, validator) of the templates compiled by
+# compile_templates: the template is kept referenced, and compared on
+# lookup, so that a validator is never returned for another object.
+compiled_templates = {}
+
+def compile_templates(templates):
+    """
+    Compiles the validators of the templates of a dict name => template;
+    the ones of globaleaks.rest.requests are compiled at its import.
+    """
+    for name, message_template in templates.iteritems():
+        if not name.startswith('_') and isinstance(message_template, (dict, list)):
+            compiled_templates[id(message_template)] = (message_template,
+                                                        compile_template(message_template))
+
+def template_validator(message_template):
+    """
+    @return: the validator of a template, compiled for this call if it is
+             not one of the templates compiled by compile_templates
+    """
+    compiled = compiled_templates.get(id(message_template))
+    if compiled is not None and compiled[0] is message_template:
+        return compiled[1]
+
+    return compile_template(message_template)
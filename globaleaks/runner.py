@@ -12,7 +12,22 @@ from twisted.internet import reactor
 from globaleaks.utils.utility import log, utc_future_date
 from globaleaks.db import create_tables, check_schema_version, clean_untracked_files
 from globaleaks.db.datainit import import_memory_variables, apply_cli_options
-from globaleaks.settings import GLSetting
+from globaleaks.settings import GLSetting, transact, transact_ro
+from globaleaks.handlers.static import GLStaticAssets
+from globaleaks.security import GLCryptoPool
+from globaleaks.utils.uploads import GLUploadWriter
+from globaleaks.utils import zipstream
+
+def start_thread_pools():
+    """
+    Start the thread pools running the transactions, the cryptography,
+    the writing of the uploads, the loading of the static files and the
+    compression of the archives; they are stopped after the reactor.
+    """
+    for tp in [transact.tp, transact_ro.tp, GLCryptoPool.tp, GLUploadWriter.tp,
+               GLStaticAssets.tp, zipstream.compression_pool]:
+        tp.start()
+        reactor.addSystemEventTrigger('after', 'shutdown', tp.stop)
 
 def start_asynchronous():
     """
@@ -58,6 +73,10 @@ def globaleaks_start():
     GLSetting.drop_privileges()
     GLSetting.check_directories()
 
+    start_thread_pools()
+
+    GLStaticAssets.preload(GLSetting.glclient_path)
+
     if not GLSetting.accepted_hosts:
         log.err("Missing a list of hosts usable to contact GLBackend, abort")
         return False
@@ -11,6 +11,7 @@ import os
 import shutil
 import scrypt
 import pickle
+import time
 import traceback
 
 from cryptography.hazmat.primitives import hashes
@@ -19,6 +20,10 @@ from cryptography.hazmat.backends import default_backend
 
 from gnupg import GPG
 from tempfile import _TemporaryFileWrapper
+from twisted.internet import reactor
+from twisted.internet.defer import fail
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
 
 from globaleaks.rest import errors
 from globaleaks.utils.utility import log, acquire_bool
@@ -208,13 +213,45 @@ def get_salt(salt_input):
     return digest[:SALT_LENGTH * 2]
 
 
-def hash_password(proposed_password, salt_input):
+# the scrypt parameters of the hashes stored before the parameters were
+# recorded alongside them: the ones hashed with these parameters are
+# still stored as the bare hex digest.
+default_scrypt_parameters = (1 << 14, 8, 1)
+
+def scrypt_parameters(base64_stored):
+    """
+    @param base64_stored: a hash returned by hash_password
+
+    @return: the (N, r, p) scrypt parameters of the hash
+    """
+    fields = base64_stored.split('$')
+
+    if len(fields) == 1:
+        return default_scrypt_parameters
+
+    return tuple(int(x) for x in fields[:3])
+
+def scrypt_digest(base64_stored):
+    return base64_stored.split('$')[-1]
+
+def needs_rehash(base64_stored):
+    """
+    @return: True if the hash has not been computed with the configured
+        GLSetting.scrypt_parameters, and is to be replaced on the next login
+    """
+    return scrypt_parameters(base64_stored) != GLSetting.scrypt_parameters
+
+def hash_password(proposed_password, salt_input, parameters=None):
     """
     @param proposed_password: a password, not security enforced.
         is not accepted an empty string.
 
+    @param parameters: the (N, r, p) scrypt parameters,
+        GLSetting.scrypt_parameters if not specified
+
     @return:
-        the scrypt hash in base64 of the password
+        the scrypt hash in base64 of the password, prefixed by the
+        parameters in the form 'N$r$p$' unless they are the defaults
     """
     proposed_password = proposed_password.encode('utf-8')
     salt = get_salt(salt_input)
@@ -223,8 +260,117 @@ def hash_password(proposed_password, salt_input):
         log.err("password string has been not really provided (0 len)")
         raise errors.InvalidInputFormat("Missing password")
 
-    hashed_passwd = scrypt.hash(proposed_password, salt)
-    return binascii.b2a_hex(hashed_passwd)
+    if parameters is None:
+        parameters = GLSetting.scrypt_parameters
+
+    N, r, p = parameters
+    hashed_passwd = binascii.b2a_hex(scrypt.hash(proposed_password, salt, N, r, p))
+
+    if parameters == default_scrypt_parameters:
+        return hashed_passwd
+
+    return "%d$%d$%d$%s" % (N, r, p, hashed_passwd)
+
+# the bytes a scrypt hash may allocate: it needs 128 * N * r of them, and
+# up to GLSetting.crypto_thread_pool_size hashes are computed at once.
+scrypt_memory_budget = 128 * 1024 * 1024
+
+def scrypt_maximum_N(r, memory_budget=scrypt_memory_budget):
+    """
+    @return: the largest power of two N whose scrypt hash with the block
+        size r allocates no more than memory_budget bytes (2^17 for r = 8)
+    """
+    N = 1 << 10
+    while 128 * (N << 1) * r <= memory_budget:
+        N <<= 1
+
+    return N
+
+def calibrate_scrypt_parameters(target_time, r=8, p=1, memory_budget=scrypt_memory_budget):
+    """
+    @param target_time: the seconds a hash computation should last
+
+    @param memory_budget: the bytes a hash may allocate, bounding N also
+        for the hashes computed during the calibration
+
+    @return: the ((N, r, p), seconds) of the largest power of two N whose
+        hash is computed on this host within target_time and memory_budget,
+        with the minimum N = 2^10 returned also when it is slower than that.
+    """
+    N = 1 << 10
+    maximum_N = scrypt_maximum_N(r, memory_budget)
+    calibrated = None
+
+    while N <= maximum_N:
+        start = time.time()
+        scrypt.hash('calibration', get_salt('calibration'), N, r, p)
+        elapsed = time.time() - start
+
+        if calibrated is not None and elapsed > target_time:
+            break
+
+        calibrated = ((N, r, p), elapsed)
+
+        if elapsed > target_time:
+            break
+
+        N <<= 1
+
+    return calibrated
+
+
+class GLCryptoPool(object):
+    """
+    The thread pool computing the scrypt hashes of the credentials, so
+    that a deliberately expensive hash does not hold a DB thread.
+    At most GLSetting.crypto_queue_size computations are in progress:
+    the following ones fail at once with LoginQueueFull, so that a flood
+    of logins is answered with fast 503s instead of stalling the node.
+    """
+    tp = ThreadPool(0, GLSetting.crypto_thread_pool_size)
+
+    # the computations queued or running
+    pending = 0
+
+    @classmethod
+    def run(cls, function, *args):
+        if cls.pending >= GLSetting.crypto_queue_size:
+            log.debug("Refused a scrypt computation: %d in progress" % cls.pending)
+            return fail(errors.LoginQueueFull())
+
+        cls.pending += 1
+
+        def done(result):
+            cls.pending -= 1
+            return result
+
+        return deferToThreadPool(reactor, cls.tp, function, *args).addBoth(done)
+
+def deferred_hash_password(proposed_password, salt_input, parameters=None):
+    """
+    hash_password computed by GLCryptoPool
+    """
+    return GLCryptoPool.run(hash_password, proposed_password, salt_input, parameters)
+
+def hash_password_parameters(proposed_password, salt_input, parameters_list):
+    """
+    @return: the list of the hashes of the password computed with each
+        of the (N, r, p) scrypt parameters of parameters_list
+    """
+    return [hash_password(proposed_password, salt_input, parameters)
+            for parameters in parameters_list]
+
+def deferred_hash_password_parameters(proposed_password, salt_input, parameters_list):
+    """
+    hash_password_parameters computed by GLCryptoPool, as a single computation
+    """
+    return GLCryptoPool.run(hash_password_parameters, proposed_password, salt_input, parameters_list)
+
+def deferred_check_password(guessed_password, base64_stored, salt_input):
+    """
+    check_password computed by GLCryptoPool
+    """
+    return GLCryptoPool.run(check_password, guessed_password, base64_stored, salt_input)
 
 
 def check_password_format(password):
@@ -246,9 +392,10 @@ def check_password(guessed_password, base64_stored, salt_input):
     guessed_password = guessed_password.encode('utf-8')
     salt = get_salt(salt_input)
 
-    hashed_guessed = scrypt.hash(guessed_password, salt)
+    N, r, p = scrypt_parameters(base64_stored)
+    hashed_guessed = scrypt.hash(guessed_password, salt, N, r, p)
 
-    return binascii.b2a_hex(hashed_guessed) == base64_stored
+    return binascii.b2a_hex(hashed_guessed) == scrypt_digest(base64_stored)
 
 
 def change_password(base64_stored, old_password, new_password, salt_input):
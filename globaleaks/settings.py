@@ -9,7 +9,9 @@
 import re
 import os
 import sys
+import time
 import glob
+import random
 import shutil
 import traceback
 import logging
@@ -18,7 +20,9 @@ import pwd
 import grp
 import getpass
 import tempfile
+import threading
 import transaction
+import multiprocessing
 
 from ConfigParser import ConfigParser
 from optparse import OptionParser
@@ -27,12 +31,17 @@ from ctypes import CDLL
 from twisted.python.threadpool import ThreadPool
 from twisted.internet import reactor
 from twisted.internet.threads import deferToThreadPool
+from twisted.internet.defer import Deferred
 from storm import exceptions, tracer
+from storm.database import register_scheme
+from storm.databases.sqlite import SQLite, SQLiteConnection, SQLiteResult
 from storm.zope.zstorm import ZStorm
 from cyclone.web import HTTPError
 from cyclone.util import ObjectDict as OD
 
 from globaleaks import __version__, DATABASE_VERSION
+from globaleaks.utils.metrics import current_request, request_context, current_profile, transaction_metrics, \
+    transaction_profile, transaction_profiles, TransactionProfile, TransactionTracer
 
 verbosity_dict = {
     'DEBUG': logging.DEBUG,
@@ -84,8 +93,31 @@ class GLSettingsClass:
         # daemon
         self.nodaemon = False
 
-        # threads sizes
+        # threads sizes: the transactions writing the database are
+        # serialized on db_thread_pool_size threads (a single writer),
+        # while the read only ones run on db_reader_thread_pool_size threads
         self.db_thread_pool_size = 1
+        self.db_reader_thread_pool_size = 4
+
+        # the SQLite database is used in WAL mode, so that the readers
+        # are not blocked by the writer and do not block it
+        self.db_sqlite_options = OD()
+        self.db_sqlite_options.foreign_keys = 'ON'
+        self.db_sqlite_options.journal_mode = 'WAL'
+        self.db_sqlite_options.synchronous = 'NORMAL'
+        self.db_sqlite_options.cache_size = -16000 # KiB
+        self.db_sqlite_options.mmap_size = 64 * 1024 * 1024
+        # seconds waited by SQLite for a lock before failing the statement
+        self.db_sqlite_options.timeout = 1
+
+        # the transactions failed by a locked database (or by a lost
+        # connection) are run again after a random delay, up to a backoff
+        # doubled at every retry, until db_retry_deadline seconds from the
+        # start of the transaction; the delays are waited on the reactor,
+        # without holding the thread of the transaction
+        self.db_retry_backoff = 0.01
+        self.db_retry_maximum_backoff = 1
+        self.db_retry_deadline = 10
 
         self.bind_addresses = '127.0.0.1'
 
@@ -106,8 +138,18 @@ class GLSettingsClass:
 
         # debug defaults
         self.storm_debug = False
+        # the transactions running for more than slow_transaction_threshold
+        # seconds are logged with their first slow_transaction_statements
+        # statements (0 disables the log)
+        self.slow_transaction_threshold = 1
+        self.slow_transaction_statements = 100
         self.http_log = -1
         self.http_log_counter = 0
+        # the --io log is written by a thread in batches of http_log_batch_size
+        # records; at most http_log_queue_bytes of records wait to be written,
+        # the following ones are dropped.
+        self.http_log_queue_bytes = 8 * 1024 * 1024
+        self.http_log_batch_size = 100
         self.loglevel = "CRITICAL"
 
         # files and paths
@@ -133,6 +175,18 @@ class GLSettingsClass:
         # download tocken trackin
         self.download_tokens = dict()
 
+        # downloads that can be resumed with a Range request without being
+        # counted again: (receiver_id, rfile_id or rtip_id) => dict with
+        # the 'date' of the counted request (see BaseHandler.resume_validator)
+        self.resumable_downloads = dict()
+        self.download_resume_seconds = 60 * 60
+
+        # resumable uploads: upload_id => session (see handlers/files.py);
+        # a session expires when idle or anyhow after its maximum lifetime
+        self.upload_sessions = dict()
+        self.upload_session_seconds = 60 * 60
+        self.upload_session_lifetime_seconds = 24 * 60 * 60
+
         # static file rules
         self.staticfile_regexp = r'(.*)'
         self.staticfile_overwrite = False
@@ -156,6 +210,54 @@ class GLSettingsClass:
 
         self.www_form_urlencoded_maximum_size = 1024
 
+        # size of the chunks read from the disk and flushed to the client
+        # by the streaming producers used in the downloads
+        self.download_chunk_size = 64 * 1024
+
+        # threads used to deflate the zip collections (1 disables the
+        # parallel compression)
+        self.zip_compression_workers = min(multiprocessing.cpu_count(), 4)
+
+        # the uploads are encrypted and written on the disk by a pool of
+        # threads, in batches of upload_batch_size bytes; the transport
+        # of an upload is paused when more than upload_queue_size bytes
+        # are waiting to be written.
+        self.upload_writer_threads = 4
+        self.upload_batch_size = 256 * 1024
+        self.upload_queue_size = 1024 * 1024
+
+        # the scrypt hashes of the credentials are computed by a pool of
+        # crypto_thread_pool_size threads, out of the DB threads; the logins
+        # finding crypto_queue_size computations in progress are refused.
+        self.crypto_thread_pool_size = min(multiprocessing.cpu_count(), 4)
+        self.crypto_queue_size = 32
+
+        # the (N, r, p) scrypt parameters of the new hashes of the
+        # credentials; the ones hashed with different parameters are
+        # rehashed on the next successful login.
+        self.scrypt_parameters = (1 << 14, 8, 1)
+
+        # the number of the stored receipt hashes by their scrypt parameters
+        # different from scrypt_parameters, loaded on the first failed
+        # whistleblower login and then updated when one of them is rehashed
+        # (see authentication.login_wb)
+        self.receipt_parameters = None
+
+        # maximum number of the legacy scrypt parameters a receipt is hashed
+        # with, by a single crypto computation, on a failed whistleblower login
+        self.receipt_legacy_parameters_maximum = 2
+
+        # maximum number of elements of a page of the /admin/overview/*
+        # endpoints, requested with ?limit=N
+        self.overview_page_maximum_size = 500
+
+        # maximum size of a chunk of a resumable upload, kept in memory
+        self.upload_chunk_maximum_size = 1024 * 1024
+
+        # the static files up to this size are kept in memory, gzipped
+        # when useful, and reloaded when they change on the disk
+        self.static_asset_maximum_size = 4 * 1024 * 1024
+
         self.defaults = OD()
         # Default values, used to initialize DB at the first start,
         # or whenever the value is not supply by client.
@@ -194,6 +296,7 @@ class GLSettingsClass:
         self.memory_copy.exception_email = self.defaults.exception_email
         # updated by globaleaks/db/__init__.import_memory_variables
         self.memory_copy.default_language = 'en'
+        self.memory_copy.languages_enabled = self.defaults.languages_enabled
         self.memory_copy.notif_server = None
         self.memory_copy.notif_port = None
         self.memory_copy.notif_username = None
@@ -211,6 +314,9 @@ class GLSettingsClass:
 
         # Default delay threshold
         self.delay_threshold = 0.800
+        # the delayed answers are released in batches, every
+        # delay_granularity seconds
+        self.delay_granularity = 0.025
 
         # a dict to keep track of the lifetime of the session. at the moment
         # not exported in the UI.
@@ -323,7 +429,8 @@ class GLSettingsClass:
         if self.db_type == 'sqlite':
             self.db_uri = 'sqlite:' + \
                                  os.path.abspath(os.path.join(self.gldb_path,
-                                     'glbackend-%d.db?foreign_keys=ON' % DATABASE_VERSION))
+                                     'glbackend-%d.db' % DATABASE_VERSION)) + \
+                                 '?' + '&'.join('%s=%s' % option for option in self.db_sqlite_options.iteritems())
         elif self.db_type == 'mysql':
             self.db_uri = "mysql://%s:%s@%s/%s" % (self.db_username, self.db_password, self.db_hostname, self.db_name)
 
@@ -385,6 +492,8 @@ class GLSettingsClass:
 
         self.storm_debug = self.cmdline_options.storm_debug
 
+        self.slow_transaction_threshold = self.cmdline_options.slow_transactions / 1000.0
+
         self.loglevel = verbosity_dict[self.cmdline_options.loglevel]
 
         self.bind_addresses = self.cmdline_options.ip.replace(" ", "").split(",")
@@ -418,6 +527,16 @@ class GLSettingsClass:
             print "Invalid delay inserted, a number of milliseconds is required"
             quit(-1)
 
+        try:
+            N, r, p = [int(x) for x in self.cmdline_options.scrypt_parameters.split(",")]
+
+            if N < 2 or N & (N - 1) or r < 1 or p < 1:
+                raise ValueError
+
+            self.scrypt_parameters = (N, r, p)
+        except ValueError:
+            print "Invalid scrypt parameters inserted, N,r,p with N a power of two is required"
+            quit(-1)
 
         if self.cmdline_options.ramdisk:
             self.ramdisk_path = self.cmdline_options.ramdisk
@@ -750,18 +869,94 @@ class GLSettingsClass:
 # GLSetting is a singleton class exported once
 GLSetting = GLSettingsClass()
 
+class GLSQLite(SQLite):
+    """
+    The SQLite database of Storm, also applying to the connections
+    the pragmas not supported by the URI options of Storm.
+    """
+    pragmas = ('cache_size', 'mmap_size')
+
+    def __init__(self, uri):
+        SQLite.__init__(self, uri)
+        self._pragmas = [(pragma, uri.options[pragma]) for pragma in self.pragmas
+                         if pragma in uri.options]
+
+    def raw_connect(self):
+        raw_connection = SQLite.raw_connect(self)
+
+        for pragma, value in self._pragmas:
+            raw_connection.execute("PRAGMA %s = %d" % (pragma, int(value)))
+
+        return raw_connection
+
+register_scheme('sqlite', GLSQLite)
+
+
+class GLSQLiteResult(SQLiteResult):
+    """
+    The Result of SQLite, also counting the rows fetched by the transaction
+    of the thread.
+    """
+    @staticmethod
+    def from_database(row):
+        profile = current_profile()
+        if profile is not None:
+            profile.rows += 1
+
+        return SQLiteResult.from_database(row)
+
+
+class GLSQLiteConnection(SQLiteConnection):
+    result_factory = GLSQLiteResult
+
+GLSQLite.connection_factory = GLSQLiteConnection
+
+
+def is_retriable(excep):
+    """
+    @return: True if the transaction failed by an error that can go away
+        running it again: the database locked by another writer, or the
+        connection lost, that Storm reopens on the next statement.
+    """
+    if isinstance(excep, exceptions.DisconnectionError):
+        return True
+
+    if isinstance(excep, exceptions.OperationalError):
+        message = str(excep).lower()
+        return 'locked' in message or 'busy' in message
+
+    return False
+
+
 class transact(object):
     """
     Class decorator for managing transactions.
     Because Storm sucks.
+
+    The transactions are run by a single writer thread, while the read
+    only ones (transact_ro) run concurrently on a pool of reader threads,
+    each with its own store: the store of a thread is opened by its first
+    transaction and reused by the following ones, with its cache reset.
+
+    A transaction failed by a locked database is run again from the start
+    (see _retry): the decorated functions must be idempotent, with no side
+    effects out of the database (files, notifications, ...), that are to
+    be performed by the caller once the transaction is committed, and must
+    not commit the store themselves, as the work committed before a
+    failure would be done again by the retry.
     """
     tp = ThreadPool(0, GLSetting.db_thread_pool_size)
-    
+
     readonly = False
 
+    zstorm = ZStorm()
+    stores = threading.local()
+    # incremented by reset_stores() when the database is replaced
+    stores_generation = 0
+
     def __init__(self, method):
-        self.store = None
         self.method = method
+        self.name = '%s.%s' % (method.__module__, method.__name__)
         self.instance = None
         self.debug = GLSetting.storm_debug
 
@@ -773,37 +968,171 @@ class transact(object):
         return self
 
     def __call__(self,  *args, **kwargs):
-        return self.run(self._wrap, self.method, *args, **kwargs)
+        start = time.time()
+        d = self._retry(start, self.instance, args, kwargs)
 
-    @staticmethod
-    def run(function, *args, **kwargs):
+        # the time waited for the transaction is accounted to the request,
+        # that is still the current one for the callbacks of the transaction
+        request = current_request()
+        if request is None:
+            return d
+
+        result = Deferred()
+
+        def account_db_time(value):
+            request.db_time += time.time() - start
+            request_context(request, result.callback, value)
+
+        d.addBoth(account_db_time)
+
+        return result
+
+    def run(self, function, *args, **kwargs):
         """
-        Defer provided function to thread
+        Defer provided function to the thread pool of the transaction
         """
-        return deferToThreadPool(reactor, transact.tp,
+        return deferToThreadPool(reactor, self.tp,
                                  function, *args, **kwargs)
 
+    def _retry(self, start, instance, args, kwargs):
+        """
+        Runs the transaction on its thread pool; when failed by a retriable
+        error, it is run again from the start after a random delay, up to a
+        backoff doubled at every retry. The delay is waited on the reactor,
+        without holding the thread: when the retry deadline is reached,
+        DatabaseBusy is raised.
+        """
+        result = Deferred()
+
+        def attempt(retries):
+            d = self.run(self._profile, time.time(), self.method, instance, *args, **kwargs)
+            d.addCallbacks(succeeded, failed, callbackArgs=(retries,), errbackArgs=(retries,))
+
+        def succeeded(value, retries):
+            if retries:
+                transaction_metrics.record(retries, time.time() - start, False)
+
+            result.callback(value)
+
+        def failed(failure, retries):
+            if not failure.check(exceptions.OperationalError, exceptions.DisconnectionError) or \
+                    not is_retriable(failure.value):
+                result.errback(failure)
+                return
+
+            backoff = min(GLSetting.db_retry_maximum_backoff,
+                          GLSetting.db_retry_backoff * 2 ** retries)
+            delay = random.uniform(0, backoff)
+
+            if time.time() + delay - start > GLSetting.db_retry_deadline:
+                transaction_metrics.record(retries, time.time() - start, True)
+
+                # errors imports the settings
+                from globaleaks.rest import errors
+                result.errback(errors.DatabaseBusy())
+                return
+
+            reactor.callLater(delay, attempt, retries + 1)
+
+        attempt(0)
+
+        return result
+
+    @staticmethod
+    def reset_stores():
+        """
+        Makes every thread reopen its store on its next transaction, as
+        needed when the database file is created or replaced.
+        """
+        transact.stores_generation += 1
+
+    @staticmethod
+    def close_store():
+        """
+        Closes the store of the current thread, if any
+        """
+        store = getattr(transact.stores, 'store', None)
+        if store is None:
+            return
+
+        transact.stores.store = None
+        # the store is detached from the transaction still open on it
+        transaction.abort()
+        transact.zstorm.remove(store)
+        store.close()
+
     @staticmethod
     def get_store():
         """
-        Returns a reference to Storm Store
+        Returns a reference to the Storm Store of the current thread
         """
-        zstorm = ZStorm()
-        zstorm.set_default_uri(GLSetting.store_name, GLSetting.db_uri)
-        return zstorm.get(GLSetting.store_name)
+        key = (transact.stores_generation, GLSetting.db_uri)
+
+        store = getattr(transact.stores, 'store', None)
+        if store is not None and \
+                (transact.stores.key != key or store._connection._closed):
+            transact.close_store()
+            store = None
 
-    def _wrap(self, function, *args, **kwargs):
+        if store is None:
+            store = transact.zstorm.create(None, GLSetting.db_uri)
+            transact.stores.store = store
+            transact.stores.key = key
+
+        return store
+
+    def _profile(self, start, function, instance, *args, **kwargs):
         """
-        Wrap provided function calling it inside a thread and
-        passing the store to it.
+        Runs the transaction recording its profile: the time waited for
+        the thread since start, the time run, the statements executed and
+        the rows fetched. The slow transactions are logged.
         """
-        self.store = self.get_store()
+        queue = time.time() - start
+        profile = TransactionProfile(GLSetting.slow_transaction_statements)
+
+        outer_profile = current_profile()
+        transaction_profile.profile = profile
         try:
-            if self.instance:
-                result = function(self.instance, self.store, *args, **kwargs)
+            return self._attempt(function, instance, *args, **kwargs)
+        finally:
+            transaction_profile.profile = outer_profile
+
+            wall = time.time() - start
+            slow = GLSetting.slow_transaction_threshold and \
+                   wall - queue > GLSetting.slow_transaction_threshold
+
+            transaction_profiles.record(self.name, profile, wall, queue, slow)
+            if slow:
+                self.log_slow_transaction(profile, wall, queue)
+
+    def log_slow_transaction(self, profile, wall, queue):
+        # utility imports the settings
+        from globaleaks.utils.utility import log
+
+        log.err("Slow transaction %s: %.3fs (%.3fs waiting for the thread), "
+                "%d statements in %.3fs, %d rows" %
+                (self.name, wall, queue, profile.statements, profile.sql_time, profile.rows))
+
+        for statement, elapsed in profile.log:
+            log.err("  %.1fms %s" % (elapsed * 1000, statement))
+
+        if profile.statements > len(profile.log):
+            log.err("  ... %d more statements" % (profile.statements - len(profile.log)))
+
+    def _attempt(self, function, instance, *args, **kwargs):
+        """
+        Runs the function in a transaction on the store of the thread.
+
+        The same transaction can run concurrently on the reader threads:
+        the store and the instance are not kept in the decorator.
+        """
+        store = self.get_store()
+        try:
+            if instance:
+                result = function(instance, store, *args, **kwargs)
             else:
-                result = function(self.store, *args, **kwargs)
-        except (exceptions.IntegrityError, exceptions.DisconnectionError):
+                result = function(store, *args, **kwargs)
+        except exceptions.IntegrityError:
             transaction.abort()
             result = None
         except HTTPError as excep:
@@ -811,24 +1140,33 @@ class transact(object):
             raise excep
         except Exception as excep:
             transaction.abort()
-            _, exception_value, exception_tb = sys.exc_info()
-            traceback.print_tb(exception_tb, 10)
-            self.store.close()
+            if not is_retriable(excep):
+                _, exception_value, exception_tb = sys.exc_info()
+                traceback.print_tb(exception_tb, 10)
             # propagate the exception
             raise excep
         else:
-            if not self.readonly:
-                self.store.commit()
-            else:
-                self.store.flush()
-                self.store.invalidate()
+            try:
+                if not self.readonly:
+                    transaction.commit()
+                else:
+                    # the read only transactions are never committed: the
+                    # rollback also ends the snapshot read by the thread
+                    store.flush()
+                    transaction.abort()
+            except:
+                transaction.abort()
+                raise
         finally:
-            self.store.close()
+            # the objects of the transaction are not reused by the next one
+            if not store._connection._closed:
+                store.reset()
 
         return result
 
 class transact_ro(transact):
+    tp = ThreadPool(0, GLSetting.db_reader_thread_pool_size)
+
     readonly = True
 
-transact.tp.start()
-reactor.addSystemEventTrigger('after', 'shutdown', transact.tp.stop)
+tracer.install_tracer(TransactionTracer())
@@ -60,6 +60,24 @@ class TestLanguageFileHandler(helpers.TestHandler):
 
         self.assertNotEqual(self.responses[0], first_response)
 
+    @inlineCallbacks
+    def test_get_custom_translation_not_modified(self):
+        yield self.test_post()
+
+        handler = self.request({}, kwargs={'path': GLSetting.static_path})
+        yield handler.get(lang='en')
+        etag = handler._headers['Etag']
+        self.assertEqual(handler._headers['Cache-control'], 'no-cache, must-revalidate')
+
+        self.responses = []
+
+        handler = self.request({}, kwargs={'path': GLSetting.static_path},
+                               headers={'If-None-Match': etag})
+        yield handler.get(lang='en')
+
+        self.assertEqual(handler._status_code, 304)
+        self.assertEqual(self.responses, [])
+
     def test_delete_not_existent_custom_lang(self):
         handler = self.request({}, role='admin', kwargs={'path': GLSetting.static_path})
         self.assertRaises(errors.LangFileNotFound, handler.delete, lang='en')
@@ -2,9 +2,11 @@ from cyclone.util import ObjectDict
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.tests import helpers
+from globaleaks import security
 from globaleaks.handlers import authentication, admin, base
 from globaleaks.rest import errors
-from globaleaks.settings import GLSetting
+from globaleaks.models import User, WhistleblowerTip
+from globaleaks.settings import GLSetting, transact_ro
 from globaleaks.utils import utility
 
 class ClassToTestUnauthenticatedDecorator(base.BaseHandler):
@@ -459,3 +461,90 @@ class TestAuthentication(helpers.TestHandler):
         expected_expiration = utility.get_future_epoch(GLSetting.defaults.lifetimes[auth_request['role']])
         expiration_date = self.responses[0]['session_expiration']
         self.assertApproximates(expected_expiration, expiration_date, 2)
+
+    def test_021_login_queue_full(self):
+        self.patch(security.GLCryptoPool, 'pending', GLSetting.crypto_queue_size)
+
+        handler = self.request({
+           'username': 'admin',
+           'password': 'globaleaks',
+           'role': 'admin'
+        })
+        d = handler.post()
+        self.assertFailure(d, errors.LoginQueueFull)
+        return d
+
+class TestRehashOnLogin(helpers.TestHandler):
+    _handler = authentication.AuthenticationHandler
+
+    parameters = (1 << 10, 8, 1)
+
+    @transact_ro
+    def get_admin_password(self, store):
+        return store.find(User, User.username == u'admin').one().password
+
+    @transact_ro
+    def get_receipt_hash(self, store, wbtip_id):
+        return store.find(WhistleblowerTip, WhistleblowerTip.id == wbtip_id).one().receipt_hash
+
+    @inlineCallbacks
+    def test_001_admin_password_rehashed(self):
+        self.patch(GLSetting, 'scrypt_parameters', self.parameters)
+
+        username = yield authentication.login_admin(u'admin', u'globaleaks')
+        self.assertEqual(username, u'admin')
+
+        password = yield self.get_admin_password()
+        self.assertEqual(security.scrypt_parameters(password), self.parameters)
+
+        username = yield authentication.login_admin(u'admin', u'globaleaks')
+        self.assertEqual(username, u'admin')
+
+        username = yield authentication.login_admin(u'admin', u'INVALIDPASSWORD')
+        self.assertFalse(username)
+
+    @inlineCallbacks
+    def test_002_receipt_rehashed(self):
+        self.patch(GLSetting, 'scrypt_parameters', self.parameters)
+
+        wbtip_id = yield authentication.login_wb(self.dummyWBTip)
+        self.assertTrue(wbtip_id)
+
+        receipt_hash = yield self.get_receipt_hash(wbtip_id)
+        self.assertEqual(security.scrypt_parameters(receipt_hash), self.parameters)
+
+        # no legacy receipt hash remains
+        self.assertEqual(GLSetting.receipt_parameters, {})
+
+        self.assertEqual((yield authentication.login_wb(self.dummyWBTip)), wbtip_id)
+        self.assertFalse((yield authentication.login_wb(u'1234567890123456')))
+
+    @inlineCallbacks
+    def test_003_receipt_parameters_loaded_once(self):
+        self.assertFalse((yield authentication.login_wb(u'1234567890123456')))
+
+        # the following failed logins do not read the whistleblower tips
+        self.patch(authentication, 'load_receipt_parameters', lambda: 1 / 0)
+        self.assertFalse((yield authentication.login_wb(u'1234567890123456')))
+        self.assertEqual(GLSetting.receipt_parameters, {})
+
+    @inlineCallbacks
+    def test_004_failed_login_hashes_bounded(self):
+        hashed = []
+        hash_password = security.hash_password
+        def counting_hash_password(*args):
+            hashed.append(args)
+            return hash_password(*args)
+        self.patch(security, 'hash_password', counting_hash_password)
+
+        # without legacy receipt hashes only the configured parameters are tried
+        self.assertFalse((yield authentication.login_wb(u'1234567890123456')))
+        self.assertEqual(len(hashed), 1)
+
+        del hashed[:]
+        self.patch(GLSetting, 'receipt_parameters', {
+            (1 << 10, 8, 1): 3, (1 << 11, 8, 1): 2, (1 << 12, 8, 1): 1
+        })
+        self.assertFalse((yield authentication.login_wb(u'1234567890123456')))
+        self.assertEqual([args[2] for args in hashed[1:]],
+                         [(1 << 10, 8, 1), (1 << 11, 8, 1)])
@@ -1,9 +1,21 @@
+import os
 import json
+import zlib
 
+from cyclone.util import ObjectDict as OD
 from twisted.trial import unittest
-
-from globaleaks.handlers import base
-from globaleaks.rest.errors import InvalidInputFormat
+from twisted.test import proto_helpers
+from twisted.python.failure import Failure
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue, Deferred, succeed
+from twisted.internet.task import deferLater
+
+from globaleaks.handlers import base, static
+from globaleaks.rest import requests, validation
+from globaleaks.settings import GLSetting
+from globaleaks.utils import apicache, streaming, uploads, utility
+from globaleaks.rest.errors import InvalidInputFormat, RequestedRangeNotSatisfiable
+from globaleaks.tests import helpers
 
 class MockHandler(base.BaseHandler):
 
@@ -88,16 +100,466 @@ class TestValidate(unittest.TestCase):
 
         handler = MockHandler()
 
-        self.assertTrue( handler.validate_python_type('foca', str) )
-        self.assertTrue( handler.validate_python_type(True, bool) )
-        self.assertTrue( handler.validate_python_type(4, int) )
-        self.assertTrue( handler.validate_python_type(u'foca', unicode) )
-        self.assertTrue( handler.validate_python_type(None, dict) )
+        self.assertTrue( handler.validate_type('foca', str) )
+        self.assertTrue( handler.validate_type(True, bool) )
+        self.assertTrue( handler.validate_type(u'true', bool) )
+        self.assertTrue( handler.validate_type(4, int) )
+        self.assertTrue( handler.validate_type(u'4', int) )
+        self.assertTrue( handler.validate_type(u'foca', unicode) )
+        self.assertTrue( handler.validate_type(None, dict) )
 
     def test_validate_GLtype_valid(self):
 
         handler = MockHandler()
-        self.assertTrue( handler.validate_GLtype('Foca', '\w+') )
-        self.assertFalse( handler.validate_GLtype('Foca', '\d+') )
+        self.assertTrue( handler.validate_type('Foca', '\w+') )
+        self.assertFalse( handler.validate_type('Foca', '\d+') )
+
+    def test_compiled_templates(self):
+        # the templates of the REST requests are compiled at import time
+        validator = validation.template_validator(requests.actorsCommentDesc)
+        self.assertTrue(validator is validation.template_validator(requests.actorsCommentDesc))
+
+        # a template equal to a compiled one is not mistaken for it
+        template = dict(requests.actorsCommentDesc)
+        self.assertFalse(validation.template_validator(template) is validator)
+
+        handler = MockHandler()
+        self.assertTrue(handler.validate_jmessage({'content': u'antani'}, requests.actorsCommentDesc))
+
+        # a missing key of a nested dict is reported
+        self.assertRaises(InvalidInputFormat, handler.validate_jmessage,
+                          {'fields': {'nest': {}}}, {'fields': {'nest': {'key': unicode}}})
+
+        self.assertRaises(InvalidInputFormat, handler.validate_jmessage,
+                          {'fields': [1, 2]}, {'fields': {'key': unicode}})
+
+class MockStreamHandler(object):
+
+    def __init__(self):
+        self.request = OD(connection=OD(transport=proto_helpers.StringTransport()))
+        self.written = []
+        self.flushes = 0
+
+    def write(self, chunk):
+        self.written.append(chunk)
+
+    def flush(self):
+        self.flushes += 1
+
+class TestStreamProducer(unittest.TestCase):
+
+    @inlineCallbacks
+    def test_stream_all_chunks(self):
+        handler = MockStreamHandler()
+        chunks = ['A' * 10, 'B' * 10, 'C' * 10]
+
+        yield streaming.GLStreamProducer(handler, chunks).start()
+
+        self.assertEqual(handler.written, chunks)
+        self.assertEqual(handler.flushes, 3)
+        self.assertEqual(handler.request.connection.transport.producer, None)
+
+    def test_pause_and_stop(self):
+        handler = MockStreamHandler()
+        producer = streaming.GLStreamProducer(handler, iter(['A', 'B']))
+        d = producer.start()
+
+        producer.pauseProducing()
+        producer.produce()
+        self.assertEqual(handler.written, [])
+
+        producer.stopProducing()
+        self.assertTrue(d.called)
+        self.assertEqual(handler.written, [])
+
+    def test_file_chunks(self):
+        with open(self.mktemp(), 'w+b') as fp:
+            fp.write('X' * 10)
+            fp.seek(0)
+            self.assertEqual(list(streaming.file_chunks(fp, 4)), ['XXXX', 'XXXX', 'XX'])
+            self.assertTrue(fp.closed)
+
+
+class TestRanges(unittest.TestCase):
+
+    def test_parse_range_header(self):
+        self.assertEqual(streaming.parse_range_header(None, 100), None)
+        self.assertEqual(streaming.parse_range_header('bytes=0-9', 100), (0, 9))
+        self.assertEqual(streaming.parse_range_header('bytes=10-', 100), (10, 99))
+        self.assertEqual(streaming.parse_range_header('bytes=-10', 100), (90, 99))
+        self.assertEqual(streaming.parse_range_header('bytes=-1000', 100), (0, 99))
+        self.assertEqual(streaming.parse_range_header('bytes=90-1000', 100), (90, 99))
+
+        # ignored ranges
+        self.assertEqual(streaming.parse_range_header('bytes=0-9,20-29', 100), None)
+        self.assertEqual(streaming.parse_range_header('bytes=9-0', 100), None)
+        self.assertEqual(streaming.parse_range_header('bytes=a-b', 100), None)
+        self.assertEqual(streaming.parse_range_header('pages=0-9', 100), None)
+
+        self.assertRaises(RequestedRangeNotSatisfiable,
+                          streaming.parse_range_header, 'bytes=100-', 100)
+        self.assertRaises(RequestedRangeNotSatisfiable,
+                          streaming.parse_range_header, 'bytes=-0', 100)
+
+    def test_range_chunks(self):
+        content = ''.join(chr(ord('a') + x) for x in range(26))
+        chunks = [content[i:i + 5] for i in range(0, 26, 5)]
+
+        for start, end in [(0, 25), (0, 0), (3, 7), (5, 9), (24, 25), (12, 12)]:
+            self.assertEqual(''.join(streaming.range_chunks(chunks, start, end)),
+                             content[start:end + 1])
+
+
+class MockDestination(object):
+    filepath = 'mock'
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+class ManualThreadPool(object):
+    """
+    ThreadPool running the jobs only when requested by the test
+    """
+    def __init__(self):
+        self.jobs = []
+
+    def callInThreadWithCallback(self, onResult, func, *args, **kw):
+        self.jobs.append((onResult, func, args, kw))
+
+    def run_next(self):
+        onResult, func, args, kw = self.jobs.pop(0)
+        try:
+            onResult(True, func(*args, **kw))
+        except:
+            onResult(False, Failure())
+        # let the reactor deliver the result of the 'thread'
+        return deferLater(reactor, 0, lambda: None)
+
+class TestUploadWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(GLSetting, 'upload_batch_size', 10)
+        self.patch(GLSetting, 'upload_queue_size', 20)
+        self.tp = ManualThreadPool()
+        self.patch(uploads.GLUploadWriter, 'tp', self.tp)
+
+    def connect(self):
+        transport = proto_helpers.StringTransport()
+        protocol = base.GLHTTPServer()
+        protocol.factory = MockApplication()
+        protocol.makeConnection(transport)
+        return protocol, transport
+
+    @inlineCallbacks
+    def test_batches_and_backpressure(self):
+        destination = MockDestination()
+        protocol, transport = self.connect()
+        writer = uploads.GLUploadWriter(destination, protocol)
+
+        # the writes are collected in batches of at least 10 bytes
+        for x in range(5):
+            writer.write('A' * 4)
+        self.assertEqual(len(self.tp.jobs), 1)
+
+        for x in range(5):
+            writer.write('B' * 10)
+        self.assertEqual(transport.producerState, 'paused')
+
+        d = writer.close()
+        self.assertFalse(d.called)
+
+        while self.tp.jobs:
+            yield self.tp.run_next()
+
+        self.assertEqual(transport.producerState, 'producing')
+        self.assertTrue(d.called)
+        self.assertEqual(''.join(destination.written), 'A' * 20 + 'B' * 50)
+        self.assertEqual(destination.written[0], 'A' * 12)
+
+    @inlineCallbacks
+    def test_backpressure_keeps_the_connection_pause(self):
+        destination = MockDestination()
+        protocol, transport = self.connect()
+        writer = uploads.GLUploadWriter(destination, protocol)
+
+        for x in range(3):
+            writer.write('A' * 10)
+        self.assertEqual(transport.producerState, 'paused')
+
+        # the body is complete while the writer has paused the reading
+        protocol.pause_reading('upload')
+
+        while self.tp.jobs:
+            yield self.tp.run_next()
+
+        # the writer resumes only its own pause
+        self.assertEqual(transport.producerState, 'paused')
+
+        protocol.resume_reading('upload')
+        self.assertEqual(transport.producerState, 'producing')
+
+    @inlineCallbacks
+    def test_write_failure(self):
+        destination = MockDestination()
+        destination.write = lambda data: 1 / 0
+        writer = uploads.GLUploadWriter(destination)
+
+        writer.write('A' * 10)
+        yield self.tp.run_next()
+        writer.write('B' * 10)
+
+        yield self.assertFailure(writer.close(), ZeroDivisionError)
+        self.assertEqual(self.tp.jobs, [])
+
+
+class TestChunkedBodyDecoder(unittest.TestCase):
+
+    body = '5\r\nhello\r\n6;name=value\r\n world\r\n0\r\nTrailer: ignored\r\n\r\n'
+
+    def test_decode(self):
+        decoder = uploads.ChunkedBodyDecoder()
+        self.assertEqual(decoder.feed(self.body + 'NEXT'), ('hello world', 'NEXT'))
+        self.assertTrue(decoder.finished)
+
+    def test_decode_byte_by_byte(self):
+        decoder = uploads.ChunkedBodyDecoder()
+        decoded = ''
+        for c in self.body:
+            self.assertFalse(decoder.finished)
+            data, rest = decoder.feed(c)
+            decoded += data
+            self.assertEqual(rest, '')
+
+        self.assertTrue(decoder.finished)
+        self.assertEqual(decoded, 'hello world')
+
+    def test_malformed(self):
+        for body in ['X\r\n', '5\r\nhelloXX', '-1\r\n', '1' * 2000]:
+            self.assertRaises(base._BadRequestException,
+                              uploads.ChunkedBodyDecoder().feed, body)
+
+
+class MockApplication(object):
+    settings = {}
+
+    def __init__(self):
+        self.requests = []
+        self.received = Deferred()
+
+    def __call__(self, request):
+        self.requests.append(request)
+        self.received.callback(request)
+
+class TestGLHTTPServer(helpers.TestGL):
+
+    def tearDown(self):
+        # every spooled body has to be deleted by its test or by the server
+        self.assertEqual(os.listdir(GLSetting.tmp_upload_path), [])
+        return helpers.TestGL.tearDown(self)
+
+    def connect(self):
+        self.application = MockApplication()
+        self.transport = proto_helpers.StringTransport()
+        protocol = base.GLHTTPServer()
+        protocol.factory = self.application
+        protocol.makeConnection(self.transport)
+        return protocol
+
+    @inlineCallbacks
+    def test_chunked_upload(self):
+        protocol = self.connect()
+
+        request = 'POST /upload HTTP/1.1\r\n' \
+                  'Content-Disposition: attachment; filename="antani.txt"\r\n' \
+                  'Transfer-Encoding: chunked\r\n\r\n' + \
+                  TestChunkedBodyDecoder.body
+
+        for i in range(0, len(request), 3):
+            protocol.dataReceived(request[i:i + 3])
+
+        request = yield self.application.received
+
+        self.assertEqual(request.body['filename'], 'antani.txt')
+        self.assertEqual(request.body['body_len'], 11)
+        self.assertEqual(request.body['body'].read(), 'hello world')
+        request.body['body'].close()
+
+    @inlineCallbacks
+    def test_chunked_upload_too_large(self):
+        self.patch(GLSetting.memory_copy, 'maximum_filesize', 1)
+        protocol = self.connect()
+
+        protocol.dataReceived('POST /upload HTTP/1.1\r\n'
+                              'Content-Disposition: attachment; filename="antani.txt"\r\n'
+                              'Transfer-Encoding: chunked\r\n\r\n')
+
+        chunk = 'A' * (1024 * 1024)
+        protocol.dataReceived('%x\r\n%s\r\n' % (len(chunk), chunk))
+
+        self.assertFalse(self.transport.disconnecting)
+
+        protocol.dataReceived('%x\r\n%s\r\n' % (len(chunk), chunk))
+
+        self.assertTrue(self.transport.disconnecting)
+        self.assertEqual(self.application.requests, [])
+
+        # the spooled body is deleted once its pending writes are done
+        while os.listdir(GLSetting.tmp_upload_path):
+            yield deferLater(reactor, 0, lambda: None)
+
+
+class TestEtagMatches(unittest.TestCase):
+
+    def test_etag_matches(self):
+        etag = apicache.strong_etag('antani')
+        self.assertFalse(apicache.etag_matches(None, etag))
+        self.assertTrue(apicache.etag_matches(etag, etag))
+        self.assertTrue(apicache.etag_matches('"x", %s' % etag, etag))
+        self.assertTrue(apicache.etag_matches('W/%s' % etag, etag))
+        self.assertTrue(apicache.etag_matches('*', etag))
+        self.assertFalse(apicache.etag_matches('"x"', etag))
+
+
+class TestGLApiCache(unittest.TestCase):
+
+    def setUp(self):
+        apicache.GLApiCache.invalidate()
+
+    @inlineCallbacks
+    def test_get(self):
+        calls = []
+        def serialize(language):
+            calls.append(language)
+            return succeed({'language': language})
+
+        for x in range(2):
+            for language in ['en', 'it']:
+                cached, etag = yield apicache.GLApiCache.get('resource', language, serialize, language)
+                self.assertEqual(json.loads(cached), {'language': language})
+                self.assertEqual(etag, apicache.strong_etag(cached))
+
+        self.assertEqual(calls, ['en', 'it'])
+
+        apicache.GLApiCache.invalidate()
+        yield apicache.GLApiCache.get('resource', 'en', serialize, 'en')
+        self.assertEqual(calls, ['en', 'it', 'en'])
+
+    @inlineCallbacks
+    def test_invalidation_during_serialization(self):
+        d = Deferred()
+        result = apicache.GLApiCache.get('resource', 'en', lambda: d)
+
+        # the data changes while the answer is being serialized
+        apicache.GLApiCache.invalidate()
+        d.callback({'old': True})
+
+        cached, etag = yield result
+        self.assertEqual(json.loads(cached), {'old': True})
+        self.assertEqual(apicache.GLApiCache.memory_cache_dict, {})
+
+
+class TestAcceptsEncoding(unittest.TestCase):
+
+    def test_accepts_encoding(self):
+        self.assertFalse(static.accepts_encoding(None, 'gzip'))
+        self.assertTrue(static.accepts_encoding('gzip, deflate', 'gzip'))
+        self.assertTrue(static.accepts_encoding('deflate, GZIP;q=0.5', 'gzip'))
+        self.assertTrue(static.accepts_encoding('*', 'gzip'))
+        self.assertFalse(static.accepts_encoding('deflate', 'gzip'))
+        self.assertFalse(static.accepts_encoding('gzip;q=0', 'gzip'))
+        self.assertFalse(static.accepts_encoding('*, gzip;q=0', 'gzip'))
+
+
+class TestStaticFileHandler(helpers.TestHandler):
+    _handler = base.BaseStaticFileHandler
+
+    script = "var antani = 'antani';\n" * 100
+
+    def setUp(self):
+        self.static_path = os.path.abspath(self.mktemp())
+        os.makedirs(self.static_path)
+
+        with open(os.path.join(self.static_path, 'index.html'), 'w') as f:
+            f.write('<html></html>')
+
+        with open(os.path.join(self.static_path, 'app.js'), 'w') as f:
+            f.write(self.script)
+
+        return helpers.TestHandler.setUp(self)
+
+    @inlineCallbacks
+    def get(self, path, headers=None):
+        self.responses = []
+        handler = self.request(kwargs={'path': self.static_path,
+                                       'default_filename': 'index.html'},
+                               headers=headers)
+        yield handler.get(path)
+        returnValue(handler)
+
+    @inlineCallbacks
+    def test_get_gzip(self):
+        handler = yield self.get('app.js', {'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(handler._headers['Content-Encoding'], 'gzip')
+        self.assertEqual(handler._headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(zlib.decompress(self.responses[0], 16 + zlib.MAX_WBITS), self.script)
+        gzip_etag = handler._headers['Etag']
+
+        handler = yield self.get('app.js')
+        self.assertNotIn('Content-Encoding', handler._headers)
+        self.assertEqual(self.responses[0], self.script)
+        self.assertNotEqual(handler._headers['Etag'], gzip_etag)
+
+    @inlineCallbacks
+    def test_get_not_compressed(self):
+        # compressing a tiny file would make it bigger
+        handler = yield self.get('index.html', {'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', handler._headers)
+        self.assertEqual(self.responses[0], '<html></html>')
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        handler = yield self.get('app.js')
+        handler = yield self.get('app.js', {'If-None-Match': handler._headers['Etag']})
+        self.assertEqual(handler._status_code, 304)
+        self.assertEqual(self.responses, [])
+
+    @inlineCallbacks
+    def test_get_reloaded(self):
+        yield self.get('app.js')
+
+        with open(os.path.join(self.static_path, 'app.js'), 'a') as f:
+            f.write('antani();\n')
+
+        # the file is loaded and compressed again out of the reactor
+        tp = ManualThreadPool()
+        self.patch(static.GLStaticAssets, 'tp', tp)
+
+        d = self.get('app.js')
+        self.assertFalse(d.called)
+
+        yield tp.run_next()
+        yield d
+        self.assertEqual(self.responses[0], self.script + 'antani();\n')
+
+    def test_get_not_found(self):
+        return self.assertFailure(self.get('missing.js'), base.HTTPError)
+
+
+class TestHTTPLog(helpers.TestHandler):
+    _handler = base.BaseHandler
+
+    def test_request_logged(self):
+        records = []
+        self.patch(GLSetting, 'http_log', 0)
+        self.patch(utility.http_log_writer, 'thread', object())
+        self.patch(utility.http_log_writer, 'write', records.append)
 
+        handler = self.request(body='antani')
+        handler.prepare()
 
+        self.assertEqual(len(records), 1)
+        self.assertIn('Request %d' % GLSetting.http_log_counter, records[0])
+        self.assertTrue(records[0].endswith('body:\nantani\n'))
@@ -2,14 +2,34 @@
 from twisted.internet.defer import inlineCallbacks
 
 import json
-
+import os
 import shutil
+import tarfile
+import StringIO
 
 from globaleaks.rest import requests
-from globaleaks.settings import GLSetting, transact_ro
+from globaleaks.settings import GLSetting, transact, transact_ro
 from globaleaks.tests import helpers
 from globaleaks.handlers import collection
-from globaleaks.models import ReceiverTip
+from globaleaks.models import ReceiverTip, ReceiverFile, InternalTip
+
+class TestTarStream(helpers.TestGL):
+
+    def test_tar_stream(self):
+        path = os.path.join(GLSetting.submission_path, 'antani')
+        with open(path, 'wb') as f:
+            f.write('A' * (GLSetting.download_chunk_size * 2 + 1))
+
+        files = [{'path': path, 'name': 'antani.txt'},
+                 {'path': '/unexistent', 'name': 'unexistent.txt'},
+                 {'buf': 'COLLECTION', 'name': 'COLLECTION_INFO.txt'}]
+
+        for compression_type in ['', 'gz', 'bz2']:
+            data = ''.join(collection.tar_stream(files, compression_type))
+            tar = tarfile.open(fileobj=StringIO.StringIO(data), mode='r:' + compression_type)
+            self.assertEqual(tar.getnames(), ['antani.txt', 'COLLECTION_INFO.txt'])
+            self.assertEqual(tar.extractfile('antani.txt').read(), 'A' * (GLSetting.download_chunk_size * 2 + 1))
+            self.assertEqual(tar.extractfile('COLLECTION_INFO.txt').read(), 'COLLECTION')
 
 class TestCollectionDownload(helpers.TestHandler):
     _handler = collection.CollectionDownload
@@ -23,6 +43,15 @@ class TestCollectionDownload(helpers.TestHandler):
 
         return rtips_desc
 
+    @transact_ro
+    def get_downloads(self, store):
+        return sorted(store.find(ReceiverFile).values(ReceiverFile.id, ReceiverFile.downloads))
+
+    @transact
+    def set_download_limit(self, store, download_limit):
+        for itip in store.find(InternalTip):
+            itip.download_limit = download_limit
+
     @inlineCallbacks
     def download(self, compression):
         rtips_desc = yield self.get_rtips()
@@ -76,3 +105,54 @@ class TestCollectionDownload(helpers.TestHandler):
     def test_010_post_download_tarbz2_with_files_removed_due_to_whatever(self):
         shutil.rmtree(GLSetting.submission_path)
         yield self.download('tarbz2')
+
+    @inlineCallbacks
+    def test_011_post_download_zipstored_range(self):
+        yield self.set_download_limit(1)
+        rtips_desc = yield self.get_rtips()
+        rtip_desc = rtips_desc[0]
+
+        handler = self.request({}, role='receiver')
+        handler.current_user['user_id'] = rtip_desc['receiver_id']
+        yield handler.post(rtip_desc['rtip_id'], 'zipstored')
+
+        self.assertEqual(handler.get_status(), 200)
+        collection_zip = ''.join(self.responses)
+        self.assertEqual(int(handler._headers['Content-Length']), len(collection_zip))
+        downloads = yield self.get_downloads()
+
+        self.responses = []
+        handler = self.request({}, role='receiver',
+                               headers={'Range': 'bytes=10-99',
+                                        'If-Range': handler._headers['Etag']})
+        handler.current_user['user_id'] = rtip_desc['receiver_id']
+        yield handler.post(rtip_desc['rtip_id'], 'zipstored')
+
+        self.assertEqual(handler.get_status(), 206)
+        self.assertEqual(handler._headers['Content-Range'], 'bytes 10-99/%d' % len(collection_zip))
+        self.assertEqual(''.join(self.responses), collection_zip[10:100])
+
+        # the resumption is not counted, and it gets the same archive
+        # even if the files have reached their download limit
+        self.assertEqual((yield self.get_downloads()), downloads)
+
+    @inlineCallbacks
+    def test_012_post_download_zipstored_file_unreadable(self):
+        rtips_desc = yield self.get_rtips()
+        rtip_desc = rtips_desc[0]
+
+        def zip_file(*args):
+            raise IOError
+            yield
+
+        aborted = []
+        self.patch(collection.ZipStream, 'zip_file', zip_file)
+
+        handler = self.request({}, role='receiver')
+        handler.current_user['user_id'] = rtip_desc['receiver_id']
+        handler.request.connection.transport.abortConnection = lambda: aborted.append(True)
+        yield handler.post(rtip_desc['rtip_id'], 'zipstored')
+
+        # the answer would be shorter than its Content-Length
+        self.assertEqual(aborted, [True])
+        self.assertFalse(handler._finished)
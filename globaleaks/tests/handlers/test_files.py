@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from twisted.internet import defer
 from twisted.internet.defer import inlineCallbacks
 
 import json
@@ -6,8 +7,10 @@ import json
 from globaleaks.rest import requests, errors
 from globaleaks.tests import helpers
 from globaleaks.handlers import files
-from globaleaks.settings import GLSetting
-from globaleaks.security import GLSecureTemporaryFile
+from globaleaks.settings import GLSetting, transact, transact_ro
+from globaleaks.models import InternalTip, InternalFile, ReceiverFile
+from globaleaks.security import GLSecureTemporaryFile, GLSecureFile
+from globaleaks.utils.utility import datetime_null
 
 class TestFileInstance(helpers.TestHandler):
     _handler = files.FileInstance
@@ -36,9 +39,143 @@ class TestFileAdd(helpers.TestHandler):
             handler.current_user['user_id'] = wbtip_desc['wbtip_id']
             yield handler.post()
 
+class TestFileUploadSession(helpers.TestHandler):
+    _handler = files.FileHandler
+
+    def session_request(self, handler_class, **kwargs):
+        self._handler = handler_class
+        self.responses = []
+        return self.request(**kwargs)
+
+    @inlineCallbacks
+    def patch_chunk(self, upload_id, offset, chunk):
+        handler = self.session_request(files.FileUploadSession, body=chunk,
+                                       headers={'Upload-Offset': str(offset)})
+        yield handler.patch(upload_id)
+        defer.returnValue(handler)
+
+    @inlineCallbacks
+    def test_001_resumable_upload(self):
+        handler = self.session_request(files.FileUploadInstance,
+                                       jbody={'name': u'antani.txt',
+                                              'content_type': u'text/plain',
+                                              'size': 10})
+        yield handler.post(self.dummySubmissionNotFinalized['id'])
+        self.assertEqual(handler.get_status(), 201)
+        upload_id = self.responses[0]['id']
+        self.assertEqual(self.responses[0]['offset'], 0)
+
+        handler = yield self.patch_chunk(upload_id, 0, 'A' * 5)
+        self.assertEqual(handler.get_status(), 204)
+        self.assertEqual(handler._headers['Upload-Offset'], '5')
+
+        # a retried chunk is rejected, telling the current offset
+        yield self.assertFailure(self.patch_chunk(upload_id, 0, 'A' * 5),
+                                 errors.UploadOffsetMismatch)
+
+        handler = self.session_request(files.FileUploadSession)
+        yield self.assertFailure(handler.post(upload_id), errors.UploadIncomplete)
+
+        handler = self.session_request(files.FileUploadSession)
+        handler.get(upload_id)
+        self.assertEqual(self.responses[0]['offset'], 5)
+
+        yield self.assertFailure(self.patch_chunk(upload_id, 5, 'B' * 6),
+                                 errors.InvalidInputFormat)
+        yield self.patch_chunk(upload_id, 5, 'B' * 5)
+
+        handler = self.session_request(files.FileUploadSession)
+        yield handler.post(upload_id)
+        self.assertEqual(handler.get_status(), 201)
+        self.assertEqual(self.responses[0]['files'][0]['size'], 10)
+        self.assertEqual(GLSetting.upload_sessions, {})
+
+        internalfile = self.responses[0]['files'][0]
+        filepath = yield self.get_internalfile_path(internalfile['id'])
+        self.assertEqual(GLSecureFile(filepath).read(), 'A' * 5 + 'B' * 5)
+
+    @transact_ro
+    def get_internalfile_path(self, store, internalfile_id):
+        return store.find(InternalFile, InternalFile.id == internalfile_id).one().file_path
+
+    @inlineCallbacks
+    def test_002_upload_session_bound_to_wbtip(self):
+        wbtips_desc = yield self.get_wbtips()
+        wbtip_desc = wbtips_desc[0]
+
+        handler = self.session_request(files.FileUploadAdd, role='wb',
+                                       user_id=wbtip_desc['wbtip_id'],
+                                       jbody={'name': u'antani.txt',
+                                              'content_type': u'text/plain',
+                                              'size': 10})
+        yield handler.post()
+        upload_id = self.responses[0]['id']
+
+        handler = self.session_request(files.FileUploadSession, role='wb',
+                                       user_id=wbtip_desc['wbtip_id'])
+        handler.get(upload_id)
+        self.assertEqual(self.responses[0]['offset'], 0)
+
+        handler = self.session_request(files.FileUploadSession)
+        self.assertRaises(errors.UploadSessionNotFound, handler.get, upload_id)
+
+    def test_003_unexistent_upload_session(self):
+        handler = self.session_request(files.FileUploadSession)
+        self.assertRaises(errors.UploadSessionNotFound, handler.get, u'unexistent')
+
+    @transact
+    def conclude_submission(self, store, itip_id):
+        store.find(InternalTip, InternalTip.id == itip_id).one().mark = InternalTip._marker[1]
+
+    @inlineCallbacks
+    def open_upload_session(self, size):
+        handler = self.session_request(files.FileUploadInstance,
+                                       jbody={'name': u'antani.txt',
+                                              'content_type': u'text/plain',
+                                              'size': size})
+        yield handler.post(self.dummySubmissionNotFinalized['id'])
+        defer.returnValue(self.responses[0]['id'])
+
+    @inlineCallbacks
+    def test_004_upload_session_of_concluded_submission(self):
+        upload_id = yield self.open_upload_session(5)
+        yield self.patch_chunk(upload_id, 0, 'A' * 5)
+
+        yield self.conclude_submission(self.dummySubmissionNotFinalized['id'])
+
+        handler = self.session_request(files.FileUploadSession)
+        yield self.assertFailure(handler.post(upload_id), errors.SubmissionConcluded)
+        self.assertEqual(GLSetting.upload_sessions, {})
+
+    @inlineCallbacks
+    def test_005_upload_session_lifetime(self):
+        upload_id = yield self.open_upload_session(10)
+
+        # the activity does not extend the session after its lifetime
+        GLSetting.upload_sessions[upload_id].creationdate = datetime_null()
+        yield self.assertFailure(self.patch_chunk(upload_id, 0, 'A' * 5),
+                                 errors.UploadSessionNotFound)
+
 class TestDownload(helpers.TestHandler):
     _handler = files.Download
 
+    @transact
+    def set_download_limit(self, store, download_limit):
+        for itip in store.find(InternalTip):
+            itip.download_limit = download_limit
+
+    @transact_ro
+    def get_downloads(self, store, rfile_id):
+        return store.find(ReceiverFile, ReceiverFile.id == rfile_id).one().downloads
+
+    @inlineCallbacks
+    def download(self, rtip_desc, rfile_id, headers=None):
+        self.responses = []
+        handler = self.request(role='receiver', headers=headers)
+        handler.current_user['user_id'] = rtip_desc['receiver_id']
+        yield handler.post(rtip_desc['rtip_id'], rfile_id)
+        defer.returnValue(handler)
+
     @inlineCallbacks
     def test_001_post(self):
         rtips_desc = yield self.get_rtips()
@@ -48,3 +185,76 @@ class TestDownload(helpers.TestHandler):
                 handler = self.request(role='receiver')
                 handler.current_user['user_id'] = rtip_desc['receiver_id']
                 yield handler.post(rtip_desc['rtip_id'], rfile_desc['rfile_id'])
+                self.assertEqual(handler.get_status(), 200)
+
+    @inlineCallbacks
+    def test_002_post_range_resumes_download(self):
+        yield self.set_download_limit(1)
+        rtips_desc = yield self.get_rtips()
+        rtip_desc = rtips_desc[0]
+        rfiles_desc = yield self.get_rfiles(rtip_desc['rtip_id'])
+        rfile_id = rfiles_desc[0]['rfile_id']
+
+        handler = yield self.download(rtip_desc, rfile_id)
+        self.assertEqual(handler.get_status(), 200)
+        content = ''.join(self.responses)
+        etag = handler._headers['Etag']
+
+        # the download limit has been reached, but the interrupted
+        # download can be resumed without being counted again
+        handler = yield self.download(rtip_desc, rfile_id,
+                                      {'Range': 'bytes=2-', 'If-Range': etag})
+        self.assertEqual(handler.get_status(), 206)
+        self.assertEqual(handler._headers['Content-Range'],
+                         'bytes 2-%d/%d' % (len(content) - 1, len(content)))
+        self.assertEqual(''.join(self.responses), content[2:])
+
+        downloads = yield self.get_downloads(rfile_id)
+        self.assertEqual(downloads, 1)
+
+        yield self.assertFailure(self.download(rtip_desc, rfile_id),
+                                 errors.DownloadLimitExceeded)
+
+    @inlineCallbacks
+    def test_002_post_range_not_resuming_is_counted(self):
+        yield self.set_download_limit(2)
+        rtips_desc = yield self.get_rtips()
+        rtip_desc = rtips_desc[0]
+        rfiles_desc = yield self.get_rfiles(rtip_desc['rtip_id'])
+        rfile_id = rfiles_desc[0]['rfile_id']
+
+        handler = yield self.download(rtip_desc, rfile_id)
+        etag = handler._headers['Etag']
+        download = (rtip_desc['receiver_id'], rfile_id)
+        counted = GLSetting.resumable_downloads[download]['date']
+
+        # a resumed request does not extend the window of the resumptions
+        yield self.download(rtip_desc, rfile_id, {'Range': 'bytes=2-', 'If-Range': etag})
+        self.assertEqual(GLSetting.resumable_downloads[download]['date'], counted)
+
+        # a range from the first byte, or not validated by the etag, is a
+        # new download
+        yield self.download(rtip_desc, rfile_id, {'Range': 'bytes=0-', 'If-Range': etag})
+        downloads = yield self.get_downloads(rfile_id)
+        self.assertEqual(downloads, 2)
+
+        for headers in [{'Range': 'bytes=0-', 'If-Range': etag},
+                        {'Range': 'bytes=2-', 'If-Range': '"antani"'},
+                        {'Range': 'bytes=2-'}]:
+            yield self.assertFailure(self.download(rtip_desc, rfile_id, headers),
+                                     errors.DownloadLimitExceeded)
+
+    @inlineCallbacks
+    def test_003_post_range_not_satisfiable(self):
+        rtips_desc = yield self.get_rtips()
+        rtip_desc = rtips_desc[0]
+        rfiles_desc = yield self.get_rfiles(rtip_desc['rtip_id'])
+        rfile_id = rfiles_desc[0]['rfile_id']
+
+        handler = yield self.download(rtip_desc, rfile_id)
+        size = int(handler._headers['Content-Length'])
+
+        yield self.assertFailure(self.download(rtip_desc, rfile_id,
+                                               {'Range': 'bytes=%d-' % size,
+                                                'If-Range': handler._headers['Etag']}),
+                                 errors.RequestedRangeNotSatisfiable)
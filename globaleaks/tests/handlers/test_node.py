@@ -5,7 +5,8 @@ import json
 
 from globaleaks.rest import requests
 from globaleaks.tests import helpers
-from globaleaks.handlers import node
+from globaleaks.handlers import node, admin
+from globaleaks.utils.apicache import GLApiCache
 from globaleaks.settings import GLSetting
 
 class TestInfoCollection(helpers.TestHandler):
@@ -18,8 +19,76 @@ class TestInfoCollection(helpers.TestHandler):
 
         self.assertTrue(isinstance(self.responses, list))
         self.assertEqual(len(self.responses), 1)
-        self.assertEqual(len(self.responses[0]), 28)
-        self._handler.validate_message(json.dumps(self.responses[0]), requests.anonNodeDesc)
+        self.assertEqual(len(json.loads(self.responses[0])), 28)
+        self._handler.validate_message(self.responses[0], requests.anonNodeDesc)
+
+
+    @inlineCallbacks
+    def test_get_cached(self):
+        handler = self.request({})
+        yield handler.get()
+
+        # the following anonymous requests do not touch the database
+        self.patch(node, 'anon_serialize_node', lambda language: 1 / 0)
+
+        handler = self.request({})
+        yield handler.get()
+        self.assertEqual(self.responses[0], self.responses[1])
+
+    @inlineCallbacks
+    def test_get_unknown_language(self):
+        for language in ['xx', 'yy']:
+            handler = self.request({}, headers={'GL-Language': language})
+            yield handler.get()
+            self.assertEqual(handler.request.language, GLSetting.memory_copy.default_language)
+
+        # the answers are cached only with the enabled languages
+        self.assertEqual(GLApiCache.memory_cache_dict['node'].keys(),
+                         [GLSetting.memory_copy.default_language])
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        handler = self.request({})
+        yield handler.get()
+        etag = handler._headers['Etag']
+        self.assertEqual(handler._headers['Cache-control'], 'no-cache, must-revalidate')
+
+        handler = self.request({}, headers={'If-None-Match': etag})
+        yield handler.get()
+        self.assertEqual(handler._status_code, 304)
+        self.assertEqual(len(self.responses), 1)
+
+        # the entity tag changes with the content
+        self.dummyNode['name'] = u'a new node name'
+        self._handler = admin.NodeInstance
+        handler = self.request(self.dummyNode, role='admin')
+        yield handler.put()
+
+        self.responses = []
+        self._handler = node.InfoCollection
+        handler = self.request({}, headers={'If-None-Match': etag})
+        yield handler.get()
+        self.assertEqual(handler._status_code, 200)
+        self.assertNotEqual(handler._headers['Etag'], etag)
+        self.assertEqual(len(self.responses), 1)
+
+    @inlineCallbacks
+    def test_get_invalidated_by_admin(self):
+        handler = self.request({})
+        yield handler.get()
+        self.assertNotEqual(json.loads(self.responses[0])['name'], u'a new node name')
+
+        self.dummyNode['name'] = u'a new node name'
+        self.responses = []
+        self._handler = admin.NodeInstance
+        handler = self.request(self.dummyNode, role='admin')
+        yield handler.put()
+
+        self.responses = []
+        self._handler = node.InfoCollection
+        handler = self.request({})
+        yield handler.get()
+        self.assertEqual(json.loads(self.responses[0])['name'], u'a new node name')
 
 
 class TestAhmiaDescriptionHandler(helpers.TestHandler):
@@ -32,8 +101,8 @@ class TestAhmiaDescriptionHandler(helpers.TestHandler):
 
         self.assertTrue(isinstance(self.responses, list))
         self.assertEqual(len(self.responses), 1)
-        self.assertEqual(len(self.responses[0]), 7)
-        self._handler.validate_message(json.dumps(self.responses[0]), requests.ahmiaDesc)
+        self.assertEqual(len(json.loads(self.responses[0])), 7)
+        self._handler.validate_message(self.responses[0], requests.ahmiaDesc)
 
 
 class TestContextsCollection(helpers.TestHandler):
@@ -46,8 +115,8 @@ class TestContextsCollection(helpers.TestHandler):
 
         self.assertTrue(isinstance(self.responses, list))
         self.assertEqual(len(self.responses), 1)
-        self.assertEqual(len(self.responses[0]), 1)
-        self._handler.validate_message(json.dumps(self.responses[0]), requests.nodeContextCollection)
+        self.assertEqual(len(json.loads(self.responses[0])), 1)
+        self._handler.validate_message(self.responses[0], requests.nodeContextCollection)
 
 
 class TestReceiversCollection(helpers.TestHandler):
@@ -60,5 +129,5 @@ class TestReceiversCollection(helpers.TestHandler):
 
         self.assertTrue(isinstance(self.responses, list))
         self.assertEqual(len(self.responses), 1)
-        self.assertEqual(len(self.responses[0]), 2)
-        self._handler.validate_message(json.dumps(self.responses[0]), requests.nodeReceiverCollection)
+        self.assertEqual(len(json.loads(self.responses[0])), 2)
+        self._handler.validate_message(self.responses[0], requests.nodeReceiverCollection)
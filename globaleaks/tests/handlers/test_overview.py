@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 import json
 
-from globaleaks.rest import requests
+from storm.database import Connection
+
+from globaleaks.rest import requests, errors
+from globaleaks.settings import transact
 from globaleaks.tests import helpers
 from globaleaks.handlers import overview
+from globaleaks.models import InternalTip
+from globaleaks.utils.utility import datetime_now
 
 class TestUsersOverview(helpers.TestHandler):
     _handler = overview.Users
@@ -34,6 +39,39 @@ class TestTipsOverview(helpers.TestHandler):
         self.assertEqual(len(self.responses[0]), 1)
         self._handler.validate_message(json.dumps(self.responses[0]), requests.TipsOverview)
 
+    @transact
+    def add_internaltips(self, store, count):
+        for _ in range(count):
+            itip = InternalTip()
+            itip.context_id = self.dummyContext['id']
+            itip.wb_fields = {}
+            itip.access_limit = itip.download_limit = itip.pertinence_counter = 0
+            itip.expiration_date = datetime_now()
+            itip.mark = InternalTip._marker[1]
+            store.add(itip)
+
+    @inlineCallbacks
+    def test_get_more_tips_than_sqlite_variables(self):
+        yield self.add_internaltips(1000)
+
+        # the variables bound to each statement, as the SQLite builds
+        # limited to 999 of them do not support more
+        params_lengths = []
+        raw_execute = Connection.raw_execute
+        def recording_raw_execute(connection, statement, params=None):
+            params_lengths.append(len(params or ()))
+            return raw_execute(connection, statement, params)
+        self.patch(Connection, 'raw_execute', recording_raw_execute)
+
+        handler = self.request({}, role='admin')
+        yield handler.get()
+
+        self.assertTrue(max(params_lengths) <= 999)
+
+        self.assertEqual(len(self.responses[0]), 1001)
+        tips = dict((tip['id'], tip) for tip in self.responses[0])
+        self.assertEqual(len(tips[self.dummySubmission['id']]['receivertips']), 2)
+
 
 class TestFilesOverview(helpers.TestHandler):
     _handler = overview.Files
@@ -47,3 +85,87 @@ class TestFilesOverview(helpers.TestHandler):
         self.assertEqual(len(self.responses), 1)
         self._handler.validate_message(json.dumps(self.responses[0]), requests.FilesOverview)
 
+
+
+class OverviewPagesMixin(object):
+
+    @inlineCallbacks
+    def get_page(self, **arguments):
+        handler = self.request({}, role='admin')
+        for key, value in arguments.iteritems():
+            handler.request.arguments[key] = [value]
+
+        yield handler.get()
+        returnValue(self.responses.pop())
+
+    @inlineCallbacks
+    def walk_pages(self, message_template, **arguments):
+        elements = []
+        page = yield self.get_page(limit='1', **arguments)
+
+        while True:
+            self._handler.validate_message(json.dumps(page), message_template)
+            self.assertTrue(len(page['elements']) <= 1)
+            elements += page['elements']
+
+            if page['next'] is None:
+                break
+
+            page = yield self.get_page(limit='1', after=page['next'], **arguments)
+
+        self.assertEqual(len(elements), page['total'])
+        returnValue(elements)
+
+
+class TestUsersOverviewPages(OverviewPagesMixin, helpers.TestHandler):
+    _handler = overview.Users
+
+    @inlineCallbacks
+    def test_get(self):
+        elements = yield self.walk_pages(requests.UsersOverviewPage)
+
+        self.assertEqual(set(user['id'] for user in elements),
+                         set([self.dummyReceiver_1['id'], self.dummyReceiver_2['id']]))
+
+        for user in elements:
+            self.assertEqual(sum(user['receivertips'].values()), 1)
+            self.assertEqual(sum(user['receiverfiles'].values()), 2)
+
+
+class TestTipsOverviewPages(OverviewPagesMixin, helpers.TestHandler):
+    _handler = overview.Tips
+
+    @inlineCallbacks
+    def test_get(self):
+        elements = yield self.walk_pages(requests.TipsOverviewPage)
+        self.assertEqual([tip['id'] for tip in elements], [self.dummySubmission['id']])
+        self.assertEqual(len(elements[0]['receivertips']), 2)
+
+    @inlineCallbacks
+    def test_get_filtered(self):
+        elements = yield self.walk_pages(requests.TipsOverviewPage,
+                                         context_id=self.dummyContext['id'], status=u'second')
+        self.assertEqual(elements, [])
+
+    def test_invalid_limit(self):
+        handler = self.request({}, role='admin')
+        handler.request.arguments['limit'] = ['0']
+        return self.assertFailure(handler.get(), errors.InvalidInputFormat)
+
+    def test_invalid_cursor(self):
+        handler = self.request({}, role='admin')
+        handler.request.arguments['limit'] = ['1']
+        handler.request.arguments['after'] = ['invalid']
+        return self.assertFailure(handler.get(), errors.InvalidInputFormat)
+
+
+class TestFilesOverviewPages(OverviewPagesMixin, helpers.TestHandler):
+    _handler = overview.Files
+
+    @inlineCallbacks
+    def test_get(self):
+        elements = yield self.walk_pages(requests.FilesOverviewPage)
+        self.assertEqual(len(set(ifile['id'] for ifile in elements)), 2)
+
+        for ifile in elements:
+            self.assertEqual(ifile['rfiles'], 2)
@@ -3,6 +3,8 @@ from twisted.internet.defer import inlineCallbacks
 
 import json
 
+from storm.database import Connection
+
 from globaleaks.rest import requests
 from globaleaks.tests import helpers
 from globaleaks.handlers import receiver, admin
@@ -63,3 +65,34 @@ class TestTipsCollection(helpers.TestHandler):
         #       so that very few code is covered. 
         handler = self.request(role='receiver')
         yield handler.get()
+
+    @inlineCallbacks
+    def test_get_tip_summary(self):
+        handler = self.request(role='receiver')
+        handler.current_user['user_id'] = self.dummyReceiver_1['id']
+        yield handler.get()
+
+        self.assertEqual(len(self.responses[0]), 1)
+        tip_summary = self.responses[0][0]
+        self.assertEqual(tip_summary['comments_number'], 3)
+        self.assertEqual(tip_summary['your_messages'], 1)
+        self.assertEqual(tip_summary['unread_messages'], 1)
+        self.assertEqual(tip_summary['read_messages'], 0)
+        self.assertEqual(tip_summary['files_number'], 2) # emulate_file_upload
+        self.assertEqual(tip_summary['context_name'], self.dummyContext['name'])
+
+    @inlineCallbacks
+    def test_tip_list_queries(self):
+        statements = []
+
+        raw_execute = Connection.raw_execute
+        def counting_raw_execute(connection, statement, params=None):
+            if statement.startswith('SELECT'):
+                statements.append(statement)
+            return raw_execute(connection, statement, params)
+
+        self.patch(Connection, 'raw_execute', counting_raw_execute)
+
+        # a fixed number of SELECT, independent from the number of tips
+        yield receiver.get_receiver_tip_list(self.dummyReceiver_1['id'])
+        self.assertEqual(len(statements), 7)
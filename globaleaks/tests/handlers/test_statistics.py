@@ -5,8 +5,9 @@ import json
 
 from globaleaks.rest import requests
 from globaleaks.tests import helpers
-from globaleaks.handlers import statistics
+from globaleaks.handlers import statistics, node
 from globaleaks.settings import GLSetting
+from globaleaks.utils.metrics import request_context
 from globaleaks.jobs.statistics_sched import AnomaliesSchedule, StatisticsSchedule
 
 class TestAnomaliesCollection(helpers.TestHandler):
@@ -44,3 +45,54 @@ class TestStatsCollection(helpers.TestHandler):
         self.assertEqual(len(self.responses), 1)
         self.assertEqual(len(self.responses[0]), 1)
         self._handler.validate_message(json.dumps(self.responses[0]), requests.StatsCollection)
+
+
+class TestMetricsCollection(helpers.TestHandler):
+    _handler = statistics.MetricsCollection
+
+    @inlineCallbacks
+    def served_request(self):
+        self.patch(node.InfoCollection, 'finish', lambda *args, **kwargs: None)
+
+        self._handler = node.InfoCollection
+        handler = self.request({})
+        yield request_context(handler.request, handler.get)
+        handler.on_finish()
+
+        self._handler = statistics.MetricsCollection
+        self.responses = []
+
+    @inlineCallbacks
+    def test_get(self):
+        yield self.served_request()
+
+        handler = self.request({}, role='admin')
+        yield handler.get()
+
+        metrics = self.responses[0]['handlers']['InfoCollection']
+        self.assertEqual(metrics['requests'], 1)
+        self.assertEqual(metrics['status'], {'200': 1})
+        self.assertEqual(metrics['latency']['total']['count'], 1)
+        self.assertEqual(metrics['latency']['total']['buckets']['+Inf'], 1)
+
+        # the transaction serializing the node is accounted to the request
+        self.assertTrue(metrics['latency']['db']['sum'] > 0)
+        self.assertEqual(metrics['latency']['delay']['sum'], 0)
+
+        self.assertEqual(self.responses[0]['uniform_delay']['parked'], 0)
+        self.assertEqual(self.responses[0]['transactions']['retries'], 0)
+        self.assertTrue(self.responses[0]['transaction_profiles']['globaleaks.handlers.node.anon_serialize_node']['calls'] >= 1)
+
+    @inlineCallbacks
+    def test_get_prometheus(self):
+        yield self.served_request()
+
+        handler = self.request({}, role='admin')
+        handler.request.arguments['format'] = ['prometheus']
+        yield handler.get()
+
+        lines = self.responses[0].splitlines()
+        self.assertIn('globaleaks_requests_total{handler="InfoCollection",status="200"} 1', lines)
+        self.assertIn('globaleaks_request_seconds_count{handler="InfoCollection",phase="db"} 1', lines)
+        self.assertIn('globaleaks_request_seconds_bucket{handler="InfoCollection",phase="total",le="+Inf"} 1', lines)
+        self.assertIn('globaleaks_transaction_retries_total 0', lines)
@@ -16,13 +16,19 @@ from storm.twisted.testing import FakeThreadPool
 from globaleaks import db, models, security
 from globaleaks.settings import GLSetting, transact, transact_ro
 from globaleaks.handlers import files, rtip, wbtip
+from globaleaks.handlers.static import GLStaticAssets
 from globaleaks.handlers.admin import create_context, create_receiver
 from globaleaks.handlers.submission import create_submission, update_submission, create_whistleblower_tip
 from globaleaks.models import Receiver, ReceiverTip, ReceiverFile, WhistleblowerTip, InternalTip
 from globaleaks.jobs import delivery_sched, notification_sched, pgp_check_sched
 from globaleaks.plugins import notification
+from globaleaks.utils.metrics import request_metrics, transaction_metrics, \
+    transaction_profiles
 from globaleaks.utils.utility import datetime_null, datetime_now, uuid4, log
 from globaleaks.utils.structures import Fields
+from globaleaks.utils.uploads import GLUploadWriter
+from globaleaks.utils.apicache import GLApiCache
+from globaleaks.utils import zipstream
 from globaleaks.third_party import rstr
 from globaleaks.db.datainit import opportunistic_appdata_init
 from globaleaks.security import GLSecureTemporaryFile
@@ -59,6 +65,11 @@ PL4QgDcz+ocengVlXpZVcoRcLfDs5bJybyyvSMAaqUinYZBX125HSLxNCaPCMKY7
 """
 
 transact.tp = FakeThreadPool()
+transact_ro.tp = FakeThreadPool()
+GLUploadWriter.tp = FakeThreadPool()
+GLStaticAssets.tp = FakeThreadPool()
+security.GLCryptoPool.tp = FakeThreadPool()
+zipstream.compression_pool = FakeThreadPool()
 
 class UTlog():
 
@@ -82,6 +93,14 @@ class TestGL(unittest.TestCase):
         GLSetting.scheduler_threadpool = FakeThreadPool()
         GLSetting.memory_copy.allow_unencrypted = True
         GLSetting.sessions = {}
+        GLSetting.resumable_downloads = {}
+        GLSetting.upload_sessions = {}
+        GLSetting.receipt_parameters = None
+        GLApiCache.invalidate()
+        GLStaticAssets.reset()
+        request_metrics.reset()
+        transaction_metrics.reset()
+        transaction_profiles.reset()
         GLSetting.failed_login_attempts = 0
         GLSetting.working_path = './working_path'
         GLSetting.ramdisk_path = './working_path/ramdisk'
@@ -208,6 +227,9 @@ class TestGL(unittest.TestCase):
         for i in range(0,2): # we emulate a constant upload of 2 files
 
             dummyFile = self.get_dummy_file()
+            # as FileHandler.handle_file_upload, the file is closed to be
+            # complete on the disk before it is moved
+            dummyFile['body'].close()
 
             relationship = yield threads.deferToThread(files.dump_file_fs, dummyFile)
             registered_file = yield files.register_file_db(
@@ -476,8 +498,15 @@ class TestHandler(TestGLWithPopulatedDB):
                                          remote_ip=remote_ip,
                                          connection=connection)
 
+        # as done by cyclone in HTTPConnection._on_headers
+        connection._request = request
+
         handler = self._handler(application, request, **kwargs)
 
+        # the output transforms are set by cyclone in _execute(),
+        # that is skipped when the handlers methods are called directly
+        handler._transforms = []
+
         def mock_pass(cls, *args):
             pass
         # so that we don't complain about XSRF
@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
+import os
+
 from twisted.internet.defer import inlineCallbacks
 
 from cyclone.util import ObjectDict as OD
 
 from globaleaks.tests import helpers
 from globaleaks.settings import GLSetting
-from globaleaks.utils.utility import datetime_null
+from globaleaks.utils.utility import datetime_null, datetime_now
 
 from globaleaks.jobs import session_management_sched
+from globaleaks.security import GLSecureTemporaryFile
 
 class TestSessionManagementSched(helpers.TestGL):
 
@@ -28,3 +31,25 @@ class TestSessionManagementSched(helpers.TestGL):
         yield session_management_sched.SessionManagementSchedule().operation()
 
         self.assertEqual(len(GLSetting.sessions), 0)
+
+    @inlineCallbacks
+    def test_resumable_downloads_cleaning(self):
+        GLSetting.resumable_downloads[('receiver', 'expired')] = {'date': datetime_null()}
+        GLSetting.resumable_downloads[('receiver', 'recent')] = {'date': datetime_now()}
+
+        yield session_management_sched.SessionManagementSchedule().operation()
+
+        self.assertEqual(GLSetting.resumable_downloads.keys(), [('receiver', 'recent')])
+
+    @inlineCallbacks
+    def test_upload_sessions_cleaning(self):
+        body = GLSecureTemporaryFile(GLSetting.tmp_upload_path)
+        GLSetting.upload_sessions['expired'] = OD(writing=False,
+                                                  creationdate=datetime_null(),
+                                                  refreshdate=datetime_null(),
+                                                  body=body)
+
+        yield session_management_sched.SessionManagementSchedule().operation()
+
+        self.assertEqual(GLSetting.upload_sessions, {})
+        self.assertFalse(os.path.exists(body.filepath))
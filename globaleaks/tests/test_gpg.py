@@ -235,7 +235,7 @@ class TestReceiverSetKey(TestHandler):
         new_subm_output = yield create_submission(new_subm, False)
         # self.submission_assertion(new_subm, new_subm_output)
 
-        self.emulate_file_upload(new_subm_output['id'])
+        yield self.emulate_file_upload(new_subm_output['id'])
 
         new_file = self.get_dummy_file()
 
@@ -255,9 +255,10 @@ class TestReceiverSetKey(TestHandler):
         rfilist = yield get_receiverfile_by_itip(new_subm_output['id'])
 
         self.assertTrue(isinstance(ifilist, list))
-        self.assertEqual(len(rfilist), 2)
+        # the two files for each of the two receivers
+        self.assertEqual(len(rfilist), 4)
 
-        for i in range(0, 2):
+        for i in range(0, 4):
             self.assertLess(ifilist[0]['size'], rfilist[i]['size'])
 
         self.assertEqual(rfilist[0]['status'], u"encrypted" )
@@ -1,9 +1,11 @@
 import os
 import shutil
+import sqlite3
 
 from globaleaks.tests import helpers
 from globaleaks.db import check_db_files
 from globaleaks.settings import GLSetting
+from globaleaks import DATABASE_VERSION
 
 """
 
@@ -34,6 +36,13 @@ def test_dbs_migration(directory):
 
             check_db_files()
 
+            # the indexes of the schema are created by the last migration
+            db = sqlite3.connect('db_test/glbackend-%d.db' % DATABASE_VERSION)
+            indexes = db.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                 "AND name LIKE 'idx_%'").fetchall()
+            db.close()
+            assert len(indexes) == 21, "Missing indexes in %s: %s" % (f, indexes)
+
             shutil.rmtree('db_test/')
 
 
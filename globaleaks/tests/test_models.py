@@ -1,4 +1,7 @@
 from twisted.internet.defer import inlineCallbacks
+from storm.databases.sqlite import compile
+from storm.expr import State
+from storm.info import get_obj_info
 
 from globaleaks.tests import helpers
 
@@ -236,3 +239,128 @@ class TestModels(helpers.TestGL):
     def test_invalid_receiver_description_oversize(self):
         self.assertFailure(self.do_invalid_receiver_description_oversize(),
                            errors.InvalidInputFormat)
+
+
+class TestIndexes(helpers.TestGL):
+
+    @transact_ro
+    def query_plan(self, store, model, *args):
+        state = State()
+        statement = compile(store.find(model, *args)._get_select(), state)
+        plan = store.execute("EXPLAIN QUERY PLAN " + statement, state.parameters).get_all()
+        return ' '.join(row[-1] for row in plan)
+
+    @inlineCallbacks
+    def test_hot_queries_use_the_indexes(self):
+        hot_queries = [
+            ('idx_receivertip_receiver_id', ReceiverTip, ReceiverTip.receiver_id == u'x'),
+            ('idx_receiverfile_internaltip_id', ReceiverFile, ReceiverFile.internaltip_id == u'x'),
+            ('idx_internalfile_mark', InternalFile, InternalFile.mark == u'not processed'),
+            ('idx_internaltip_mark', InternalTip, InternalTip.mark == u'submission'),
+            ('idx_message_receivertip_id', Message, Message.receivertip_id == u'x'),
+            ('idx_comment_internaltip_id', Comment, Comment.internaltip_id == u'x'),
+            ('idx_whistleblowertip_receipt_hash', WhistleblowerTip, WhistleblowerTip.receipt_hash == u'x'),
+            ('sqlite_autoindex_user', User, User.username == u'x'),
+        ]
+
+        for index, model, condition in hot_queries:
+            plan = yield self.query_plan(model, condition)
+            self.assertIn('USING INDEX %s' % index, plan)
+
+
+class TestLazyJSON(helpers.TestGLWithPopulatedDB):
+
+    @transact
+    def store_wb_fields(self, store, wb_fields):
+        context = store.find(Context).one()
+        itip = InternalTip()
+        itip.context_id = context.id
+        itip.wb_fields = wb_fields
+        itip.pertinence_counter = 0
+        itip.expiration_date = context.creation_date
+        itip.last_activity = context.creation_date
+        itip.escalation_threshold = 0
+        itip.access_limit = 1
+        itip.download_limit = 1
+        itip.mark = u'submission'
+        store.add(itip)
+        return itip.id
+
+    @transact_ro
+    def load_wb_fields(self, store, itip_id):
+        itip = store.find(InternalTip, InternalTip.id == itip_id).one()
+        raw = store.execute("SELECT wb_fields FROM internaltip WHERE id = ?",
+                            (itip_id,)).get_one()[0]
+        return str(raw), itip.wb_fields
+
+    @transact_ro
+    def flush_untouched_rows(self, store):
+        updates = []
+        raw_execute = store._connection.raw_execute
+
+        def tracking_raw_execute(statement, params=None, **kwargs):
+            if statement.startswith('UPDATE'):
+                updates.append(statement)
+            return raw_execute(statement, params, **kwargs)
+
+        store._connection.raw_execute = tracking_raw_execute
+        try:
+            for context in store.find(Context):
+                context.name, context.description
+            for itip in store.find(InternalTip):
+                itip.wb_fields
+            store.flush()
+        finally:
+            del store._connection.raw_execute
+
+        return updates
+
+    @inlineCallbacks
+    def test_round_trip(self):
+        wb_fields = {u'Short title': {u'value': u'\xe8\xf2', u'answer_order': 0}}
+        itip_id = yield self.store_wb_fields(wb_fields)
+        raw, loaded = yield self.load_wb_fields(itip_id)
+        self.assertEqual(loaded, wb_fields)
+        self.assertTrue(raw.startswith('{'))
+
+    @inlineCallbacks
+    def test_large_values_are_compressed(self):
+        wb_fields = {u'Full description': {u'value': u'x' * 4096, u'answer_order': 0}}
+        itip_id = yield self.store_wb_fields(wb_fields)
+        raw, loaded = yield self.load_wb_fields(itip_id)
+        self.assertEqual(loaded, wb_fields)
+        self.assertTrue(raw.startswith(json_compression_marker))
+        self.assertTrue(len(raw) < 4096)
+
+    @transact_ro
+    def decode_on_access(self, store):
+        context = store.find(Context).one()
+        variable = get_obj_info(context).variables[Context.name]
+        before = isinstance(variable._value, EncodedJSON)
+        context.name
+        after = isinstance(variable._value, EncodedJSON)
+        return before, after
+
+    @inlineCallbacks
+    def test_values_are_decoded_on_access(self):
+        before, after = yield self.decode_on_access()
+        self.assertTrue(before)
+        self.assertFalse(after)
+
+    @inlineCallbacks
+    def test_unchanged_values_are_not_updated(self):
+        yield self.store_wb_fields({u'a': {u'value': u'b' * 2048, u'answer_order': 0}})
+        updates = yield self.flush_untouched_rows()
+        self.assertEqual(updates, [])
+
+    @transact_ro
+    def replace_undecoded_value(self, store):
+        context = store.find(Context).one()
+        context.tags = []
+        context.tags.append(u'replaced')
+        return context.tags
+
+    @inlineCallbacks
+    def test_replace_undecoded_value(self):
+        tags = yield self.replace_undecoded_value()
+        self.assertEqual(tags, [u'replaced'])
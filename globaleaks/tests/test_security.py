@@ -8,7 +8,9 @@ from twisted.trial import unittest
 
 from globaleaks.tests import helpers
 from globaleaks.security import get_salt, hash_password, check_password, change_password, check_password_format, SALT_LENGTH, \
-                                directory_traversal_check, GLSecureTemporaryFile, GLSecureFile, crypto_backend
+                                directory_traversal_check, GLSecureTemporaryFile, GLSecureFile, crypto_backend, \
+                                scrypt_parameters, default_scrypt_parameters, needs_rehash, calibrate_scrypt_parameters, \
+                                scrypt_maximum_N
 
 from globaleaks.settings import GLSetting
 from globaleaks.rest import errors
@@ -146,3 +148,33 @@ class TestGLSecureFiles(helpers.TestGL):
         self.assertTrue(os.path.exists(a.filepath))
         os.remove(a.keypath)
         self.assertRaises(IOError, GLSecureFile, a.filepath)
+
+    def test_008_pass_hash_with_parameters(self):
+        dummy_password = "focaccina"
+        dummy_salt_input = "vecna@focaccina.net"
+
+        sure = binascii.b2a_hex(scrypt.hash(dummy_password, get_salt(dummy_salt_input), 1 << 10, 4, 2))
+        hashed = hash_password(dummy_password, dummy_salt_input, (1 << 10, 4, 2))
+
+        self.assertEqual(hashed, "1024$4$2$%s" % sure)
+        self.assertEqual(scrypt_parameters(hashed), (1 << 10, 4, 2))
+        self.assertTrue(check_password(dummy_password, hashed, dummy_salt_input))
+        self.assertFalse(check_password("focaccia", hashed, dummy_salt_input))
+
+    def test_009_needs_rehash(self):
+        legacy = hash_password("focaccina", "vecna@focaccina.net")
+        self.assertEqual(scrypt_parameters(legacy), default_scrypt_parameters)
+        self.assertFalse(needs_rehash(legacy))
+
+        self.patch(GLSetting, 'scrypt_parameters', (1 << 10, 8, 1))
+        self.assertTrue(needs_rehash(legacy))
+        self.assertFalse(needs_rehash(hash_password("focaccina", "vecna@focaccina.net")))
+
+    def test_010_calibrate_scrypt_parameters(self):
+        (N, r, p), elapsed = calibrate_scrypt_parameters(0)
+        self.assertEqual((N, r, p), (1 << 10, 8, 1))
+
+        (N, r, p), elapsed = calibrate_scrypt_parameters(10, memory_budget=128 * (1 << 12) * 8)
+        self.assertEqual((N, r, p), (1 << 12, 8, 1))
+
+        self.assertEqual(scrypt_maximum_N(8), 1 << 17)
@@ -1,15 +1,26 @@
 
+import random
+
 from twisted.internet.defer import inlineCallbacks
 from storm import exceptions
+from cyclone.util import ObjectDict as OD
 
 from globaleaks.tests import helpers
 
-from globaleaks.settings import transact, transact_ro
+from globaleaks.rest import errors
+from globaleaks.settings import GLSetting, transact, transact_ro
 from globaleaks.models import *
+from globaleaks.utils import utility
+from globaleaks.utils.metrics import transaction_metrics, transaction_profiles, request_context, \
+    TransactionProfile
 from globaleaks.utils.structures import Fields
 
 class TestTransaction(helpers.TestGLWithPopulatedDB):
 
+    def set_retry_deadline(self, deadline):
+        self.addCleanup(setattr, GLSetting, 'db_retry_deadline', GLSetting.db_retry_deadline)
+        GLSetting.db_retry_deadline = deadline
+
     @transact
     def _transaction_with_exception(self, store):
         raise Exception
@@ -43,9 +54,11 @@ class TestTransaction(helpers.TestGLWithPopulatedDB):
 
     @inlineCallbacks
     def test_transact_with_stuff_failing(self):
-        receiver_id = yield self._transact_with_stuff_failing()
+        self.set_retry_deadline(0.05)
+        yield self.assertFailure(self._transact_with_stuff_failing(), errors.DatabaseBusy)
         store = transact.get_store()
-        self.assertEqual(list(store.find(Receiver, Receiver.id == receiver_id)), [])
+        self.assertEqual(store.find(Receiver).count(), 2)
+        self.assertEqual(transaction_metrics.failed, 1)
 
     @inlineCallbacks
     def test_transact_decorate_function(self):
@@ -112,4 +125,150 @@ class TestTransaction(helpers.TestGLWithPopulatedDB):
     @inlineCallbacks
     def test_transact_ro(self):
         created_id = yield self._transact_ro_add_context()
-        yield self._transact_ro_context_bla_bla(created_id)
\ No newline at end of file
+        yield self._transact_ro_context_bla_bla(created_id)
+    @transact_ro
+    def _get_store_and_context(self, store):
+        return store, store.find(Context).one()
+
+    @inlineCallbacks
+    def test_store_reused_with_cache_reset(self):
+        store_1, context_1 = yield self._get_store_and_context()
+        store_2, context_2 = yield self._get_store_and_context()
+        self.assertIdentical(store_1, store_2)
+        self.assertEqual(context_1.id, context_2.id)
+        self.assertNotIdentical(context_1, context_2)
+
+    @inlineCallbacks
+    def test_store_reopened_after_reset(self):
+        store_1, _ = yield self._get_store_and_context()
+        transact.reset_stores()
+        store_2, _ = yield self._get_store_and_context()
+        self.assertNotIdentical(store_1, store_2)
+        self.assertTrue(store_1._connection._closed)
+
+    @inlineCallbacks
+    def test_store_reopened_after_close(self):
+        store_1, _ = yield self._get_store_and_context()
+        yield self._transaction_with_commit_close()
+        store_2, _ = yield self._get_store_and_context()
+        self.assertNotIdentical(store_1, store_2)
+
+    @transact
+    def _transaction_locked(self, store, failures, message='database is locked'):
+        store.find(Context).count()
+        if len(failures):
+            failures.pop()
+            raise exceptions.OperationalError(message)
+
+        return store.find(Context).count()
+
+    @inlineCallbacks
+    def test_transaction_retried_while_locked(self):
+        contexts = yield self._transaction_locked([1, 1, 1])
+        self.assertEqual(contexts, 1)
+        self.assertEqual(transaction_metrics.retries, 3)
+        self.assertEqual(transaction_metrics.retried, 1)
+        self.assertEqual(transaction_metrics.failed, 0)
+        self.assertEqual(transaction_metrics.lock_wait.count, 1)
+
+    @inlineCallbacks
+    def test_transaction_locked_until_the_deadline(self):
+        self.set_retry_deadline(0.05)
+        yield self.assertFailure(self._transaction_locked([1] * 1000), errors.DatabaseBusy)
+        self.assertEqual(transaction_metrics.failed, 1)
+        self.assertTrue(transaction_metrics.retries > 0)
+
+    @inlineCallbacks
+    def test_transaction_retry_does_not_hold_the_thread(self):
+        self.addCleanup(setattr, GLSetting, 'db_retry_backoff', GLSetting.db_retry_backoff)
+        GLSetting.db_retry_backoff = 0.1
+        self.patch(random, 'uniform', lambda a, b: b)
+
+        completed = []
+        d1 = self._transaction_locked([1]).addCallback(lambda _: completed.append(1))
+        d2 = self._transaction_locked([]).addCallback(lambda _: completed.append(2))
+        yield d1
+        yield d2
+
+        # the other transactions run while the locked one waits for its retry
+        self.assertEqual(completed, [2, 1])
+
+    @inlineCallbacks
+    def test_operational_error_not_retried(self):
+        yield self.assertFailure(self._transaction_locked([1], 'no such table: x'),
+                                 exceptions.OperationalError)
+        self.assertEqual(transaction_metrics.retries, 0)
+
+    @transact_ro
+    def _read_contexts_and_receivers(self, store):
+        return store.find(Context).count(), list(store.find(Receiver))
+
+    @inlineCallbacks
+    def test_transaction_profile(self):
+        yield self._read_contexts_and_receivers()
+        yield self._read_contexts_and_receivers()
+
+        profiles = transaction_profiles.serialize()
+        stats = profiles['globaleaks.tests.test_transaction._read_contexts_and_receivers']
+        self.assertEqual(stats['calls'], 2)
+        self.assertEqual(stats['slow'], 0)
+        # the count and the two receivers, fetched by two statements, and
+        # the rollback ending the read only transaction
+        self.assertEqual(stats['max']['statements'], 3)
+        self.assertEqual(stats['max']['rows'], 3)
+        self.assertEqual(stats['sum']['rows'], 6)
+        self.assertTrue(stats['sum']['wall'] >= stats['sum']['sql'])
+
+    def test_transaction_profile_prometheus(self):
+        profile = TransactionProfile(0)
+        profile.statements = 1234567
+        for function in ('a', 'b'):
+            for _ in range(3):
+                transaction_profiles.record(function, profile, 0.5, 0.25, False)
+
+        lines = transaction_profiles.prometheus().splitlines()
+        self.assertIn('globaleaks_transaction_statements_total{function="a"} 3703701', lines)
+        self.assertIn('globaleaks_transaction_seconds_total{function="b",phase="wall"} 1.500000', lines)
+
+        # every family is one contiguous group of samples
+        families = [line.split('{')[0] for line in lines if not line.startswith('#')]
+        self.assertEqual(len(set(families)), 5)
+        for family in set(families):
+            first = families.index(family)
+            self.assertEqual(families[first:first + families.count(family)],
+                             [family] * families.count(family))
+
+    @inlineCallbacks
+    def test_slow_transaction_logged(self):
+        logged = []
+        self.addCleanup(setattr, GLSetting, 'slow_transaction_threshold', GLSetting.slow_transaction_threshold)
+        self.addCleanup(setattr, utility.log, 'err', utility.log.err)
+        GLSetting.slow_transaction_threshold = 0.000001
+        utility.log.err = logged.append
+
+        yield self._read_contexts_and_receivers()
+
+        stats = transaction_profiles.serialize()['globaleaks.tests.test_transaction._read_contexts_and_receivers']
+        self.assertEqual(stats['slow'], 1)
+        self.assertIn('Slow transaction globaleaks.tests.test_transaction._read_contexts_and_receivers', logged[0])
+        self.assertIn('SELECT COUNT(*) FROM context', logged[1])
+        self.assertIn('ROLLBACK', logged[3])
+        self.assertEqual(len(logged), 4)
+
+    @inlineCallbacks
+    def test_transactions_accounted_to_the_request(self):
+        request = OD(db_time=0.0)
+        db_times = []
+
+        @inlineCallbacks
+        def handle():
+            yield self._read_contexts_and_receivers()
+            db_times.append(request.db_time)
+
+            # the request is still the current one after a transaction
+            yield self._read_contexts_and_receivers()
+            db_times.append(request.db_time)
+
+        yield request_context(request, handle)
+
+        self.assertTrue(0 < db_times[0] < db_times[1])
@@ -1,5 +1,7 @@
 from twisted.trial import unittest
+from twisted.internet.task import Clock
 
+import os
 import re
 import time
 
@@ -146,3 +148,107 @@ class TestUtility(unittest.TestCase):
     def test_019_start_logging(self):
         GLSetting.logfile = 'test_logfile'
         utility.log.start_logging()
+
+
+class TestGLLogWriter(unittest.TestCase):
+
+    def read_log(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_write(self):
+        path = os.path.abspath(self.mktemp())
+        writer = utility.GLLogWriter(100, 2, str.upper)
+        writer.start(path)
+
+        for record in ['a\n', 'b\n', 'c\n']:
+            writer.write(record)
+
+        writer.stop()
+        self.assertFalse(writer.running)
+        self.assertEqual(self.read_log(path), 'A\nB\nC\n')
+
+    def test_dropped_records(self):
+        path = os.path.abspath(self.mktemp())
+        writer = utility.GLLogWriter(6, 10)
+
+        # the writer is not running yet: the queue fills up, and a
+        # large record is dropped even when a smaller one still fits
+        for record in ['a\n', 'b\n', 'large\n', 'c\n']:
+            writer.write(record)
+
+        self.assertEqual(writer.dropped, 1)
+        self.assertEqual(writer.queued_bytes, 6)
+
+        writer.start(path)
+        writer.stop()
+
+        self.assertEqual(writer.queued_bytes, 0)
+        content = self.read_log(path)
+        self.assertTrue(content.startswith('a\nb\nc\n'))
+        self.assertIn('1 records have been dropped', content)
+
+    def test_rotation(self):
+        self.patch(GLSetting, 'log_file_size', 10)
+
+        path = os.path.abspath(self.mktemp())
+        writer = utility.GLLogWriter(100, 1)
+        writer.start(path)
+
+        for x in range(3):
+            writer.write('%d' % x * 8)
+
+        writer.stop()
+        self.assertTrue(os.path.exists(path + '.1'))
+
+
+class TestGLTimerWheel(unittest.TestCase):
+
+    def test_sleep(self):
+        clock = Clock()
+        clock.advance(1000.01)
+        wheel = utility.GLTimerWheel(0.1, slots=4, clock=clock)
+
+        released = []
+        for timeout in [0.05, 0.08, 0.35, 0.8]:
+            d = wheel.sleep(timeout)
+            d.addCallback(lambda x, timeout=timeout: released.append((timeout, clock.seconds())))
+
+        self.assertEqual(wheel.stats()['parked'], 4)
+        self.assertEqual(len(clock.getDelayedCalls()), 1)
+
+        for x in range(10):
+            clock.advance(0.1)
+
+        # the answers are released together and never before their deadline
+        self.assertEqual([timeout for timeout, when in released], [0.05, 0.08, 0.35, 0.8])
+        for timeout, when in released:
+            self.assertTrue(when >= 1000.01 + timeout)
+            self.assertTrue(when < 1000.01 + timeout + 0.2)
+
+        self.assertEqual(released[0][1], released[1][1])
+
+        stats = wheel.stats()
+        self.assertEqual(stats['parked'], 0)
+        self.assertEqual(stats['released'], 4)
+        self.assertEqual(sum(stats['latency_ms'].values()), 4)
+        self.assertEqual(clock.getDelayedCalls(), [])
+
+    def test_late_tick(self):
+        clock = Clock()
+        wheel = utility.GLTimerWheel(0.1, slots=4, clock=clock)
+
+        released = []
+        wheel.sleep(0.2).addCallback(released.append)
+        wheel.sleep(2.2).addCallback(released.append)
+
+        # a busy reactor runs the tick after several rounds of the wheel;
+        # the second deadline falls in the same slot, some rounds later.
+        clock.advance(2)
+        self.assertEqual(released, [True])
+
+        clock.advance(0.1)
+        self.assertEqual(released, [True])
+
+        clock.advance(0.1)
+        self.assertEqual(released, [True, True])
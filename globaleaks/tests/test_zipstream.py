@@ -0,0 +1,113 @@
+# -*- encoding: utf-8 -*-
+import os
+import StringIO
+import zipfile
+
+from twisted.internet.defer import inlineCallbacks, returnValue, Deferred
+from twisted.python.threadpool import ThreadPool
+from twisted.trial import unittest
+
+from globaleaks.utils import zipstream
+from globaleaks.utils.zipstream import ZipStream, ZIP_STORED, ZIP_DEFLATED
+
+class TestZipStream(unittest.TestCase):
+
+    def setUp(self):
+        # the compression pool is started by the application at startup
+        pool = ThreadPool(0, 4)
+        pool.start()
+        self.addCleanup(pool.stop)
+        self.patch(zipstream, 'compression_pool', pool)
+
+        self.files = []
+        self.contents = {}
+
+        sizes = [0, 10,
+                 zipstream.DEFLATE_BLOCK_SIZE,
+                 zipstream.DEFLATE_BLOCK_SIZE * 2 + 1]
+
+        for i, size in enumerate(sizes):
+            name = 'file%d.txt' % i
+            path = self.mktemp()
+            content = (('ANTANI%d' % i) * (size / 7 + 1))[:size]
+            with open(path, 'wb') as f:
+                f.write(content)
+
+            self.files.append({'path': path, 'name': name})
+            self.contents[name] = content
+
+        self.files.append({'path': '/unexistent', 'name': 'unexistent.txt'})
+        self.files.append({'buf': 'COLLECTION', 'name': 'COLLECTION_INFO.txt'})
+        self.contents['COLLECTION_INFO.txt'] = 'COLLECTION'
+
+    @inlineCallbacks
+    def read_archive(self, zipstream_obj):
+        chunks = []
+        for chunk in zipstream_obj.chunks():
+            if isinstance(chunk, Deferred):
+                chunk = yield chunk
+            chunks.append(chunk)
+
+        returnValue(''.join(chunks))
+
+    @inlineCallbacks
+    def check_archive(self, compression, workers):
+        data = yield self.read_archive(ZipStream(self.files, compression, workers))
+
+        zf = zipfile.ZipFile(StringIO.StringIO(data), 'r')
+        self.assertEqual(zf.testzip(), None)
+        self.assertEqual(sorted(zf.namelist()), sorted(self.contents.keys()))
+        for name, content in self.contents.iteritems():
+            self.assertEqual(zf.read(name), content)
+
+    def test_zip_stored(self):
+        return self.check_archive(ZIP_STORED, 1)
+
+    def test_zip_deflated(self):
+        return self.check_archive(ZIP_DEFLATED, 1)
+
+    @inlineCallbacks
+    def test_zip_deflated_parallel(self):
+        yield self.check_archive(ZIP_DEFLATED, 2)
+        yield self.check_archive(ZIP_DEFLATED, 4)
+
+    def test_zip_deflated_parallel_does_not_block(self):
+        # the first block is still being deflated when it has to be emitted
+        chunks = ZipStream(self.files[3:4], ZIP_DEFLATED, 2).chunks()
+        chunks.next() # the local header
+        d = chunks.next()
+        self.assertTrue(isinstance(d, Deferred))
+        return d
+
+    def test_zip_deflated_iterated(self):
+        # the plain iteration compresses in the calling thread, also
+        # when the parallel compression is configured
+        data = ''.join(ZipStream(self.files, ZIP_DEFLATED, 2))
+
+        zf = zipfile.ZipFile(StringIO.StringIO(data), 'r')
+        self.assertEqual(zf.testzip(), None)
+        for name, content in self.contents.iteritems():
+            self.assertEqual(zf.read(name), content)
+
+    def test_zip_stored_size(self):
+        zipstream_obj = ZipStream(self.files, ZIP_STORED)
+        self.assertEqual(zipstream_obj.size(), len(''.join(zipstream_obj)))
+
+    @inlineCallbacks
+    def test_zip64(self):
+        # a small limit forces the Zip64 extension on the larger files
+        # and on the end of central directory record
+        self.patch(zipstream, 'ZIP64_LIMIT', 100)
+
+        yield self.check_archive(ZIP_STORED, 1)
+        yield self.check_archive(ZIP_DEFLATED, 1)
+        yield self.check_archive(ZIP_DEFLATED, 2)
+
+        zipstream_obj = ZipStream(self.files, ZIP_STORED)
+        self.assertEqual(zipstream_obj.size(), len(''.join(zipstream_obj)))
+
+    def test_zip_stored_sized_file_removed(self):
+        zipstream_obj = ZipStream(self.files, ZIP_STORED)
+        zipstream_obj.size()
+        os.remove(self.files[1]['path'])
+        self.assertRaises(IOError, ''.join, zipstream_obj)
@@ -0,0 +1,80 @@
+# -*- coding: UTF-8
+#   apicache
+#   ********
+#
+# The entity tags of the answers and the cache of the public API.
+
+import hashlib
+
+from twisted.internet.defer import inlineCallbacks, returnValue
+
+from cyclone import escape
+
+
+def strong_etag(data):
+    """
+    @return: a strong entity tag identifying data
+    """
+    return '"%s"' % hashlib.sha256(data).hexdigest()
+
+def etag_matches(if_none_match, etag):
+    """
+    Evaluate an If-None-Match header against the current entity tag;
+    the comparison is the weak one mandated for If-None-Match.
+    """
+    if if_none_match is None:
+        return False
+
+    if if_none_match.strip() == '*':
+        return True
+
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+
+    return False
+
+
+class GLApiCache(object):
+    """
+    Cache of the JSON answers of the public API, by resource and language,
+    so that the anonymous requests do not hit the database. The handlers
+    changing the data exposed by the public API invalidate the cache once
+    their transaction is committed.
+    """
+    memory_cache_dict = {}
+
+    # incremented by every invalidation: an answer serialized while the
+    # data was being updated is not cached.
+    generation = 0
+
+    @classmethod
+    @inlineCallbacks
+    def get(cls, resource, language, function, *args, **kwargs):
+        """
+        @return: the JSON serialization of the value returned by
+                 function(*args, **kwargs), computed once per language,
+                 and its strong entity tag
+        """
+        cached = cls.memory_cache_dict.get(resource, {}).get(language)
+        if cached is not None:
+            returnValue(cached)
+
+        generation = cls.generation
+
+        value = yield function(*args, **kwargs)
+        serialized = escape.json_encode(value)
+        cached = (serialized, strong_etag(serialized))
+
+        if generation == cls.generation:
+            cls.memory_cache_dict.setdefault(resource, {})[language] = cached
+
+        returnValue(cached)
+
+    @classmethod
+    def invalidate(cls):
+        cls.generation += 1
+        cls.memory_cache_dict.clear()
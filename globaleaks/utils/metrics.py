@@ -0,0 +1,363 @@
+# -*- coding: UTF-8
+#   metrics
+#   *******
+#
+# In-memory metrics of the requests served by the handlers and of the
+# transactions, exposed to the admin by /admin/metrics as JSON or in the
+# Prometheus text format.
+
+import threading
+import time
+from bisect import bisect_left
+
+from twisted.python import context
+
+# upper bounds, in seconds, of the buckets of the latency histograms
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# the latency of a request is split in the time spent waiting for the
+# transactions, the artificial delay of uniform_answers_delay, and the
+# remaining time, spent in the reactor.
+latency_phases = ('total', 'reactor', 'db', 'delay')
+
+
+def format_bound(bound):
+    return '%g' % bound
+
+
+class Histogram(object):
+    def __init__(self, buckets=latency_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_buckets(self):
+        """
+        @return: the list of (upper bound, observations up to the bound)
+        """
+        bounds = [format_bound(bound) for bound in self.buckets] + ['+Inf']
+
+        cumulative, total = [], 0
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            cumulative.append((bound, total))
+
+        return cumulative
+
+    def serialize(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(self.cumulative_buckets())
+        }
+
+
+class HandlerMetrics(object):
+    def __init__(self):
+        self.requests = 0
+        self.status = {}
+        self.latency = dict((phase, Histogram()) for phase in latency_phases)
+
+    def serialize(self):
+        return {
+            'requests': self.requests,
+            'status': dict((str(status), count) for status, count in self.status.iteritems()),
+            'latency': dict((phase, histogram.serialize())
+                            for phase, histogram in self.latency.iteritems())
+        }
+
+
+class RequestMetrics(object):
+    """
+    The metrics of the requests, by handler: the routes of rest/api.py
+    are identified by the name of their handler class.
+    """
+    def __init__(self):
+        self.handlers = {}
+
+    def record(self, handler, status, total, db, delay):
+        metrics = self.handlers.get(handler)
+        if metrics is None:
+            metrics = self.handlers[handler] = HandlerMetrics()
+
+        metrics.requests += 1
+        metrics.status[status] = metrics.status.get(status, 0) + 1
+
+        metrics.latency['total'].observe(total)
+        metrics.latency['reactor'].observe(max(0, total - db - delay))
+        metrics.latency['db'].observe(db)
+        metrics.latency['delay'].observe(delay)
+
+    def serialize(self):
+        return dict((handler, metrics.serialize())
+                    for handler, metrics in self.handlers.iteritems())
+
+    def prometheus(self):
+        """
+        @return: the metrics in the Prometheus text exposition format
+        """
+        lines = ['# HELP globaleaks_requests_total Requests served, by handler and status code.',
+                 '# TYPE globaleaks_requests_total counter']
+
+        for handler, metrics in sorted(self.handlers.iteritems()):
+            for status, count in sorted(metrics.status.iteritems()):
+                lines.append('globaleaks_requests_total{handler="%s",status="%d"} %d' %
+                             (handler, status, count))
+
+        lines += ['# HELP globaleaks_request_seconds Latency of the requests, by handler and phase.',
+                  '# TYPE globaleaks_request_seconds histogram']
+
+        for handler, metrics in sorted(self.handlers.iteritems()):
+            for phase in latency_phases:
+                histogram = metrics.latency[phase]
+                labels = 'handler="%s",phase="%s"' % (handler, phase)
+
+                for bound, count in histogram.cumulative_buckets():
+                    lines.append('globaleaks_request_seconds_bucket{%s,le="%s"} %d' %
+                                 (labels, bound, count))
+
+                lines.append('globaleaks_request_seconds_sum{%s} %f' % (labels, histogram.sum))
+                lines.append('globaleaks_request_seconds_count{%s} %d' % (labels, histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        self.handlers.clear()
+
+request_metrics = RequestMetrics()
+
+
+class TransactionMetrics(object):
+    """
+    The retries of the transactions failed by a locked database: updated
+    by the threads of the transactions.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def record(self, retries, lock_wait, failed):
+        """
+        Records a transaction run again retries times, ending lock_wait
+        seconds after its first attempt, failed if it was given up.
+        """
+        with self.lock:
+            self.retries += retries
+            self.retried += 1
+            self.failed += int(failed)
+            self.lock_wait.observe(lock_wait)
+
+    def serialize(self):
+        with self.lock:
+            return {
+                'retries': self.retries,
+                'retried': self.retried,
+                'failed': self.failed,
+                'lock_wait': self.lock_wait.serialize()
+            }
+
+    def prometheus(self):
+        """
+        @return: the metrics in the Prometheus text exposition format
+        """
+        with self.lock:
+            lines = ['# HELP globaleaks_transaction_retries_total Attempts of the transactions run again.',
+                     '# TYPE globaleaks_transaction_retries_total counter',
+                     'globaleaks_transaction_retries_total %d' % self.retries,
+                     '# HELP globaleaks_transaction_failures_total Transactions given up at the retry deadline.',
+                     '# TYPE globaleaks_transaction_failures_total counter',
+                     'globaleaks_transaction_failures_total %d' % self.failed,
+                     '# HELP globaleaks_transaction_lock_wait_seconds Time waited by the retried transactions.',
+                     '# TYPE globaleaks_transaction_lock_wait_seconds histogram']
+
+            for bound, count in self.lock_wait.cumulative_buckets():
+                lines.append('globaleaks_transaction_lock_wait_seconds_bucket{le="%s"} %d' % (bound, count))
+
+            lines.append('globaleaks_transaction_lock_wait_seconds_sum %f' % self.lock_wait.sum)
+            lines.append('globaleaks_transaction_lock_wait_seconds_count %d' % self.lock_wait.count)
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        self.retries = 0
+        self.retried = 0
+        self.failed = 0
+        self.lock_wait = Histogram()
+
+transaction_metrics = TransactionMetrics()
+
+
+class TransactionProfile(object):
+    """
+    The profile of a transaction run by the current thread: its statements
+    are counted by the TransactionTracer and its rows by the Result of the
+    database.
+    """
+    def __init__(self, maximum_statements):
+        self.maximum_statements = maximum_statements
+        self.statements = 0
+        self.rows = 0
+        self.sql_time = 0.0
+        # (statement, seconds) of the first maximum_statements statements
+        self.log = []
+        self.statement_start = None
+
+    def executed(self, statement):
+        elapsed = time.time() - self.statement_start
+        self.statement_start = None
+        self.statements += 1
+        self.sql_time += elapsed
+
+        if len(self.log) < self.maximum_statements:
+            self.log.append((statement, elapsed))
+
+# the TransactionProfile of the transaction run by the thread, if any
+transaction_profile = threading.local()
+
+
+def current_profile():
+    return getattr(transaction_profile, 'profile', None)
+
+
+class TransactionTracer(object):
+    """
+    The Storm tracer accounting the statements to the transaction of the
+    thread executing them.
+    """
+    def connection_raw_execute(self, connection, raw_cursor, statement, params):
+        profile = current_profile()
+        if profile is not None:
+            profile.statement_start = time.time()
+
+    def connection_raw_execute_success(self, connection, raw_cursor, statement, params):
+        profile = current_profile()
+        if profile is not None and profile.statement_start is not None:
+            profile.executed(statement)
+
+    def connection_raw_execute_error(self, connection, raw_cursor, statement, params, error):
+        self.connection_raw_execute_success(connection, raw_cursor, statement, params)
+
+
+# the time of a transaction is split in the time waited for a thread of its
+# pool and the time run by the thread, of which sql is spent executing the
+# statements.
+transaction_stats_keys = ('wall', 'queue', 'sql', 'statements', 'rows')
+
+
+class TransactionStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.slow = 0
+        self.sums = dict((key, 0) for key in transaction_stats_keys)
+        self.maximums = dict((key, 0) for key in transaction_stats_keys)
+
+    def serialize(self):
+        return {
+            'calls': self.calls,
+            'slow': self.slow,
+            'sum': dict(self.sums),
+            'max': dict(self.maximums)
+        }
+
+class TransactionProfiles(object):
+    """
+    The aggregated profiles of the transactions, by function: updated by
+    the threads of the transactions.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.functions = {}
+
+    def record(self, function, profile, wall, queue, slow):
+        values = {
+            'wall': wall,
+            'queue': queue,
+            'sql': profile.sql_time,
+            'statements': profile.statements,
+            'rows': profile.rows
+        }
+
+        with self.lock:
+            stats = self.functions.get(function)
+            if stats is None:
+                stats = self.functions[function] = TransactionStats()
+
+            stats.calls += 1
+            stats.slow += int(slow)
+            for key, value in values.iteritems():
+                stats.sums[key] += value
+                stats.maximums[key] = max(stats.maximums[key], value)
+
+    def serialize(self):
+        with self.lock:
+            return dict((function, stats.serialize())
+                        for function, stats in self.functions.iteritems())
+
+    def prometheus(self):
+        """
+        @return: the metrics in the Prometheus text exposition format
+        """
+        with self.lock:
+            functions = sorted((function, stats.serialize())
+                               for function, stats in self.functions.iteritems())
+
+        # every metric family is a contiguous group of samples
+        lines = ['# HELP globaleaks_transactions_total Transactions run, by function.',
+                 '# TYPE globaleaks_transactions_total counter']
+        for function, stats in functions:
+            lines.append('globaleaks_transactions_total{function="%s"} %d' % (function, stats['calls']))
+
+        lines += ['# HELP globaleaks_transactions_slow_total Transactions over the slow threshold, by function.',
+                  '# TYPE globaleaks_transactions_slow_total counter']
+        for function, stats in functions:
+            lines.append('globaleaks_transactions_slow_total{function="%s"} %d' % (function, stats['slow']))
+
+        lines += ['# HELP globaleaks_transaction_seconds_total Time of the transactions, by function and phase.',
+                  '# TYPE globaleaks_transaction_seconds_total counter']
+        for function, stats in functions:
+            for phase in ('wall', 'queue', 'sql'):
+                lines.append('globaleaks_transaction_seconds_total{function="%s",phase="%s"} %.6f' %
+                             (function, phase, stats['sum'][phase]))
+
+        lines += ['# HELP globaleaks_transaction_statements_total Statements executed by the transactions, by function.',
+                  '# TYPE globaleaks_transaction_statements_total counter']
+        for function, stats in functions:
+            lines.append('globaleaks_transaction_statements_total{function="%s"} %d' %
+                         (function, stats['sum']['statements']))
+
+        lines += ['# HELP globaleaks_transaction_rows_total Rows fetched by the transactions, by function.',
+                  '# TYPE globaleaks_transaction_rows_total counter']
+        for function, stats in functions:
+            lines.append('globaleaks_transaction_rows_total{function="%s"} %d' %
+                         (function, stats['sum']['rows']))
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.functions.clear()
+
+transaction_profiles = TransactionProfiles()
+
+
+def current_request():
+    """
+    @return: the request handled by the reactor when called, if any,
+             as set by request_context.
+    """
+    return context.get('request')
+
+
+def request_context(request, function, *args, **kwargs):
+    """
+    Call function with request as the current request: the transactions
+    started by it, and by the callbacks of those transactions, account
+    their time to the request.
+    """
+    return context.call({'request': request}, function, *args, **kwargs)
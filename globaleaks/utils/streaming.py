@@ -0,0 +1,222 @@
+# -*- coding: UTF-8
+#   streaming
+#   *********
+#
+# Streaming of the downloads: the reading of files and of the byte ranges
+# one chunk at time, and the producer writing them into a BaseHandler.
+
+from zope.interface import implements
+from twisted.python.failure import Failure
+from twisted.internet.defer import Deferred
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet import reactor
+
+from globaleaks.settings import GLSetting
+from globaleaks.rest import errors
+
+
+def file_chunks(fp, chunk_size=None):
+    """
+    Generator reading an opened file one chunk at time, so that only
+    chunk_size bytes are kept in memory during a download.
+    The file is closed when the generator is exhausted or closed.
+    """
+    if chunk_size is None:
+        chunk_size = GLSetting.download_chunk_size
+
+    try:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fp.close()
+
+
+def parse_range_header(range_header, total_size):
+    """
+    Parse an HTTP Range header with a single bytes range, in one of the forms
+    "bytes=start-end", "bytes=start-", "bytes=-suffix_length".
+
+    @return: the (start, end) positions, inclusive, or None when the whole
+             content has to be sent (no header, a multiple range, or a
+             syntax error: RFC 2616 asks to ignore it).
+    @raise RequestedRangeNotSatisfiable: if the range is out of the content
+    """
+    if range_header is None:
+        return None
+
+    unit, _, byte_range = range_header.strip().partition('=')
+    if unit.strip() != 'bytes' or ',' in byte_range:
+        return None
+
+    start, sep, end = byte_range.strip().partition('-')
+
+    try:
+        if not sep:
+            return None
+        elif start == '':
+            # suffix range: the last 'end' bytes
+            suffix_length = int(end)
+            if suffix_length == 0:
+                raise errors.RequestedRangeNotSatisfiable
+            start = max(total_size - suffix_length, 0)
+            end = total_size - 1
+        else:
+            start = int(start)
+            end = int(end) if end != '' else total_size - 1
+    except ValueError:
+        return None
+
+    if start >= total_size:
+        raise errors.RequestedRangeNotSatisfiable
+
+    if start > end:
+        return None
+
+    return start, min(end, total_size - 1)
+
+
+def range_start(range_header):
+    """
+    @return: the first position of a "bytes=start-[end]" Range header, or
+             None for the other forms of the header and the syntax errors.
+    """
+    if range_header is None:
+        return None
+
+    unit, _, byte_range = range_header.strip().partition('=')
+    if unit.strip() != 'bytes' or ',' in byte_range:
+        return None
+
+    try:
+        return int(byte_range.strip().partition('-')[0])
+    except ValueError:
+        return None
+
+
+def range_chunks(chunks, start, end):
+    """
+    Generator filtering the chunks of a content to the bytes
+    from position start to position end, inclusive.
+    """
+    position = 0
+
+    for chunk in chunks:
+        chunk_start = position
+        position += len(chunk)
+
+        if position <= start:
+            continue
+
+        yield chunk[max(start - chunk_start, 0):end + 1 - chunk_start]
+
+        if position > end:
+            break
+
+
+class GLStreamProducer(object):
+    """
+    Push producer streaming the chunks returned by an iterator into a
+    BaseHandler. A new chunk is flushed on the transport only when the
+    transport has not asked us to pause, and every chunk is produced in a
+    different reactor iteration, so that a large download:
+        - keeps at most one chunk in the handler buffer;
+        - follows the speed of the client (backpressure);
+        - does not block the reactor while the other requests are served.
+    A chunk can also be a Deferred, fired with the data generated out of
+    the reactor thread: the next chunk is requested only after it.
+    """
+    implements(IPushProducer)
+
+    def __init__(self, handler, chunks):
+        self.handler = handler
+        self.chunks = iter(chunks)
+        self.transport = handler.request.connection.transport
+        self.deferred = Deferred()
+        self.paused = False
+        self.stopped = False
+        self.waiting = False
+        self.delayed_call = None
+
+    def start(self):
+        """
+        @return: a Deferred fired when all the chunks has been written or
+                 when the client has closed the connection.
+        """
+        self.transport.registerProducer(self, True)
+        self.schedule()
+        return self.deferred
+
+    def schedule(self):
+        if self.delayed_call is None and not self.paused and not self.stopped \
+                and not self.waiting:
+            self.delayed_call = reactor.callLater(0, self.produce)
+
+    def produce(self):
+        self.delayed_call = None
+
+        if self.paused or self.stopped or self.waiting:
+            return
+
+        try:
+            chunk = self.chunks.next()
+        except StopIteration:
+            self.done()
+            return
+        except Exception:
+            self.done(Failure())
+            return
+
+        if isinstance(chunk, Deferred):
+            self.waiting = True
+            chunk.addCallbacks(self.produced, self.failed)
+        else:
+            self.produced(chunk)
+
+    def produced(self, chunk):
+        self.waiting = False
+
+        if self.stopped:
+            return
+
+        if chunk:
+            self.handler.write(chunk)
+            self.handler.flush()
+
+        self.schedule()
+
+    def failed(self, failure):
+        self.waiting = False
+
+        if not self.stopped:
+            self.done(failure)
+
+    def done(self, failure=None):
+        if self.delayed_call is not None:
+            self.delayed_call.cancel()
+            self.delayed_call = None
+
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+        self.stopped = True
+        self.transport.unregisterProducer()
+
+        if not self.deferred.called:
+            if failure is None:
+                self.deferred.callback(None)
+            else:
+                self.deferred.errback(failure)
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.schedule()
+
+    def stopProducing(self):
+        # the client has closed the connection
+        self.done()
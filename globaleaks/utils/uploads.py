@@ -0,0 +1,222 @@
+# -*- coding: UTF-8
+#   uploads
+#   *******
+#
+# Reading of the request bodies streamed by GLHTTPServer: the decoding of
+# the chunked transfer encoding and the encrypted writing on the disk.
+
+import collections
+
+from twisted.python.threadpool import ThreadPool
+from twisted.internet.defer import Deferred, succeed, fail
+from twisted.internet.threads import deferToThreadPool
+from twisted.internet import reactor
+
+from cyclone.httpserver import _BadRequestException
+
+from globaleaks.settings import GLSetting
+from globaleaks.utils.utility import log
+
+
+class GLUploadWriter(object):
+    """
+    Writer of the body of a request into a GLSecureTemporaryFile.
+
+    The data received by the reactor is collected in batches that are
+    encrypted and written on the disk by the threads of GLUploadWriter.tp,
+    one batch at time for every file (AES-CTR needs the data in order).
+    When the batches waiting to be written exceed upload_queue_size
+    the reading of the connection is paused, so that a client faster than
+    the disk can't make the backend buffer the whole upload in memory.
+    """
+    tp = ThreadPool(0, GLSetting.upload_writer_threads)
+
+    def __init__(self, destination, connection=None):
+        self.destination = destination
+        self.connection = connection
+
+        self.batch = []
+        self.batch_size = 0
+
+        self.queue = collections.deque()
+        self.queue_size = 0
+
+        self.writing = False
+        self.paused = False
+        self.failure = None
+        self.waiting = []
+
+    def write(self, data):
+        if self.failure is not None:
+            return
+
+        self.batch.append(data)
+        self.batch_size += len(data)
+
+        if self.batch_size >= GLSetting.upload_batch_size:
+            self.enqueue()
+
+    def enqueue(self):
+        if not self.batch_size:
+            return
+
+        data = ''.join(self.batch)
+        self.batch = []
+        self.batch_size = 0
+
+        self.queue.append(data)
+        self.queue_size += len(data)
+
+        if self.queue_size > GLSetting.upload_queue_size and \
+                not self.paused and self.connection is not None:
+            self.paused = True
+            self.connection.pause_reading(self)
+
+        if not self.writing:
+            self.write_next()
+
+    def write_next(self):
+        data = self.queue.popleft()
+        self.writing = True
+
+        d = deferToThreadPool(reactor, self.tp, self.destination.write, data)
+        d.addCallbacks(self.written, self.write_failed, callbackArgs=(len(data),))
+
+    def written(self, _, size):
+        self.writing = False
+        self.queue_size -= size
+
+        if self.paused and self.queue_size <= GLSetting.upload_queue_size:
+            self.paused = False
+            self.connection.resume_reading(self)
+
+        if self.queue:
+            self.write_next()
+        elif not self.batch_size:
+            self.notify()
+
+    def write_failed(self, failure):
+        log.err("Unable to write the upload in %s: %s" %
+                (self.destination.filepath, failure.getErrorMessage()))
+        self.writing = False
+        self.failure = failure
+        self.batch = []
+        self.batch_size = 0
+        self.queue.clear()
+        self.queue_size = 0
+
+        # the rest of the upload is discarded
+        if self.paused:
+            self.paused = False
+            self.connection.resume_reading(self)
+
+        self.notify()
+
+    def notify(self):
+        waiting, self.waiting = self.waiting, []
+        for d in waiting:
+            if self.failure is None:
+                d.callback(self.destination)
+            else:
+                d.errback(self.failure)
+
+    def close(self):
+        """
+        Write the data still in memory.
+
+        @return: a Deferred fired with the destination file when all
+                 the data has been written.
+        """
+        if self.failure is not None:
+            return fail(self.failure)
+
+        self.enqueue()
+
+        if not self.writing:
+            return succeed(self.destination)
+
+        d = Deferred()
+        self.waiting.append(d)
+        return d
+
+
+class ChunkedBodyDecoder(object):
+    """
+    Incremental decoder of a request body sent with
+    "Transfer-Encoding: chunked" (RFC 2616, 3.6.1); the chunk
+    extensions and the trailer headers are ignored.
+    """
+    maximum_line_size = 1024
+
+    def __init__(self):
+        self.state = 'size'
+        self.buffer = ''
+        self.remaining = 0
+        self.finished = False
+
+    def readline(self, data):
+        eol = data.find('\r\n')
+        if eol == -1:
+            if len(data) > self.maximum_line_size:
+                raise _BadRequestException("Malformed chunked body")
+            self.buffer = data
+            return None, ''
+
+        return data[:eol], data[eol + 2:]
+
+    def feed(self, data):
+        """
+        @return: a tuple with the body data decoded and, once the body is
+                 finished, the data following it on the connection
+        @raise _BadRequestException: if the body is not correctly encoded
+        """
+        decoded = []
+        data, self.buffer = self.buffer + data, ''
+
+        while data and not self.finished:
+            if self.state == 'size':
+                line, data = self.readline(data)
+                if line is None:
+                    break
+
+                try:
+                    size = int(line.split(';', 1)[0].strip(), 16)
+                except ValueError:
+                    raise _BadRequestException("Malformed chunk size")
+
+                if size < 0:
+                    raise _BadRequestException("Malformed chunk size")
+                elif size == 0:
+                    self.state = 'trailer'
+                else:
+                    self.remaining = size
+                    self.state = 'data'
+
+            elif self.state == 'data':
+                chunk, data = data[:self.remaining], data[self.remaining:]
+                decoded.append(chunk)
+                self.remaining -= len(chunk)
+                if not self.remaining:
+                    self.state = 'data_end'
+
+            elif self.state == 'data_end':
+                if len(data) < 2:
+                    self.buffer = data
+                    break
+
+                if data[:2] != '\r\n':
+                    raise _BadRequestException("Malformed chunked body")
+
+                data = data[2:]
+                self.state = 'size'
+
+            elif self.state == 'trailer':
+                line, data = self.readline(data)
+                if line is None:
+                    break
+
+                # an empty line terminates the trailer
+                if not line:
+                    self.finished = True
+
+        return ''.join(decoded), data if self.finished else ''
@@ -8,11 +8,14 @@ import cgi
 import codecs
 import inspect
 import logging
+import math
 import re
 import os
 import sys
 import time
+import threading
 import traceback
+import Queue
 from uuid import UUID
 from datetime import datetime, timedelta
 
@@ -83,6 +86,92 @@ def deferred_sleep(timeout):
     reactor.callLater(timeout, callbackDeferred)
     return d
 
+class GLTimerWheel(object):
+    """
+    A hashed timer wheel releasing the Deferreds parked by sleep() with a
+    single DelayedCall: the deadlines are rounded up to the following tick
+    of granularity seconds, so that a Deferred is never released before
+    its deadline, and the ones sharing a tick are released together.
+    The wheel ticks only while something is parked.
+    """
+    # upper bounds, in milliseconds, of the buckets of the parking times
+    latency_buckets = (50, 100, 200, 400, 800, 1600)
+
+    def __init__(self, granularity, slots=256, clock=reactor):
+        self.granularity = granularity
+        self.slots = [[] for x in range(slots)]
+        self.clock = clock
+        self.tick_call = None
+        self.current_tick = 0
+        self.parked = 0
+        self.released = 0
+        self.latency_histogram = [0] * (len(self.latency_buckets) + 1)
+
+    def sleep(self, timeout):
+        now = self.clock.seconds()
+        deadline_tick = int(math.ceil((now + timeout) / self.granularity))
+
+        d = Deferred()
+        self.slots[deadline_tick % len(self.slots)].append((deadline_tick, now, d))
+        self.parked += 1
+
+        if self.tick_call is None:
+            self.current_tick = int(now / self.granularity)
+            self.schedule_tick()
+
+        return d
+
+    def schedule_tick(self):
+        next_tick_time = (self.current_tick + 1) * self.granularity
+        self.tick_call = self.clock.callLater(max(0, next_tick_time - self.clock.seconds()),
+                                              self.tick)
+
+    def tick(self):
+        self.tick_call = None
+        now = self.clock.seconds()
+        now_tick = int(now / self.granularity)
+
+        while self.current_tick < now_tick:
+            self.current_tick += 1
+            slot = self.slots[self.current_tick % len(self.slots)]
+
+            due = [entry for entry in slot if entry[0] <= self.current_tick]
+            if not due:
+                continue
+
+            slot[:] = [entry for entry in slot if entry[0] > self.current_tick]
+
+            for deadline_tick, parking_time, d in due:
+                self.parked -= 1
+                self.released += 1
+                self.record_latency(now - parking_time)
+                d.callback(True)
+
+        if self.parked:
+            self.schedule_tick()
+
+    def record_latency(self, seconds):
+        milliseconds = seconds * 1000
+        for i, bound in enumerate(self.latency_buckets):
+            if milliseconds <= bound:
+                self.latency_histogram[i] += 1
+                return
+
+        self.latency_histogram[-1] += 1
+
+    def stats(self):
+        """
+        @return: the number of parked and released Deferreds, and the
+                 histogram of the parking times, by upper bound in ms.
+        """
+        bounds = [str(bound) for bound in self.latency_buckets] + ['+Inf']
+
+        return {
+            'parked': self.parked,
+            'released': self.released,
+            'latency_ms': dict(zip(bounds, self.latency_histogram))
+        }
+
 def log_encode_html(s):
     """
     This function encodes the following characters
@@ -151,6 +240,118 @@ class GLLogObserver(twlog.FileLogObserver):
             GLLogObserver.last_exception_msg = str(excep)
 
 
+class GLLogWriter(object):
+    """
+    A log file written by a dedicated thread, in batches, and rotated by
+    size as the main log. The records are queued without blocking the
+    caller: once the records waiting take queue_bytes, the new ones are
+    dropped and counted, and the count is reported in the log.
+    """
+    def __init__(self, queue_bytes, batch_size, format_record=None):
+        self.queue = Queue.Queue()
+        self.queue_bytes = queue_bytes
+        self.queued_bytes = 0
+        self.lock = threading.Lock()
+        self.batch_size = batch_size
+        self.format_record = format_record
+        self.logfile = None
+        self.thread = None
+        self.dropped = 0
+        self.reported_dropped = 0
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, path):
+        self.logfile = twlogfile.LogFile(os.path.basename(path),
+                                         os.path.dirname(path),
+                                         rotateLength=GLSetting.log_file_size,
+                                         maxRotatedFiles=GLSetting.maximum_rotated_log_files)
+
+        self.thread = threading.Thread(target=self.run, name='GLLogWriter')
+        self.thread.daemon = True
+        self.thread.start()
+
+        reactor.addSystemEventTrigger('during', 'shutdown', self.stop)
+
+    def stop(self):
+        if self.thread is None:
+            return
+
+        # the writer exits when it finds None, after the records queued before it;
+        # the queue is not bounded, so this never waits for the writer.
+        self.queue.put_nowait(None)
+        self.thread.join()
+        self.thread = None
+
+        self.logfile.close()
+
+    def write(self, record):
+        with self.lock:
+            if self.queued_bytes + len(record) > self.queue_bytes:
+                self.dropped += 1
+                return
+
+            self.queued_bytes += len(record)
+
+        self.queue.put_nowait(record)
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                break
+
+        with self.lock:
+            self.queued_bytes -= sum(len(record) for record in batch if record is not None)
+
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+
+            # the drops are counted by the writing threads under the lock
+            with self.lock:
+                dropped = self.dropped - self.reported_dropped
+                self.reported_dropped = self.dropped
+
+            if dropped:
+                batch.append("!! %d records have been dropped: the log was not written fast enough\n" % dropped)
+
+            if self.format_record is not None:
+                batch = [self.format_record(record) for record in batch]
+
+            try:
+                self.logfile.write("".join(batch))
+                self.logfile.flush()
+            except Exception as excep:
+                twlog.err("[!] Unable to write %s: %s" % (self.logfile.path, excep))
+
+            if stop:
+                return
+
+
+def format_http_log_record(content):
+    return log_encode_html(log_remove_escapes(content)) + "\n"
+
+# the answers delayed by BaseHandler.uniform_answers_delay
+uniform_delay_wheel = GLTimerWheel(GLSetting.delay_granularity)
+
+# the log of the HTTP requests, started by BaseHandler at the first record
+http_log_writer = GLLogWriter(GLSetting.http_log_queue_bytes,
+                              GLSetting.http_log_batch_size,
+                              format_http_log_record)
+
+
 class Logger(object):
     """
     Customized LogPublisher
@@ -14,6 +14,13 @@ import os
 import time
 import binascii
 
+from collections import deque
+
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from globaleaks.settings import GLSetting
 from globaleaks.utils.utility import log
 
 try:
@@ -32,6 +39,9 @@ ZIP_STORED = 0
 ZIP_DEFLATED = 8
 # Other ZIP compression methods not supported
 
+# size of the blocks independently deflated by the compression workers
+DEFLATE_BLOCK_SIZE = 1024 * 1024
+
 # Here are some struct module formats for reading headers
 structEndArchive = "<4s4H2lH"            # 9 items, end of archive, 22 bytes
 stringEndArchive = "PK\005\006"          # magic number for end of archive record
@@ -102,6 +112,7 @@ class ZipInfo (object):
             'CRC',
             'compress_size',
             'file_size',
+            'zip64',
         )
 
     def __init__(self, filename="NoName", date_time=(1980,1,1,0,0,0), compression=ZIP_STORED):
@@ -150,9 +161,12 @@ class ZipInfo (object):
         self.CRC = 0
         self.compress_size = 0
         self.file_size = 0
+        self.zip64 = False               # Use the Zip64 extension for this member
 
     def DataDescriptor(self):
-        if self.compress_size > ZIP64_LIMIT or self.file_size > ZIP64_LIMIT:
+        # the sizes are 8 bytes long when the local header
+        # declares the Zip64 extension
+        if self.zip64:
             fmt = "<4slQQ"
         else:
             fmt = "<4slLL"
@@ -173,9 +187,10 @@ class ZipInfo (object):
 
         extra = self.extra
 
-        if file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
+        if self.zip64 or file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
             # File is larger than what fits into a 4 byte integer,
             # fall back to the ZIP64 extension
+            self.zip64 = True
             fmt = '<hhqq'
             extra = extra + struct.pack(fmt,
                     1, struct.calcsize(fmt)-4, file_size, compress_size)
@@ -198,44 +213,285 @@ class ZipInfo (object):
         return header + self.filename + extra
 
 
+# the pool of compression threads shared by all the ZipStreams
+compression_pool = ThreadPool(0, GLSetting.zip_compression_workers)
+
+
+def deflate_block(data, last):
+    """
+    Deflate a block independently from the others (zlib releases the GIL
+    while compressing, so more blocks are compressed at the same time).
+
+    Non-last blocks are terminated by a sync flush, that byte-aligns the
+    output without marking the final deflate block: the concatenation of
+    the blocks in order is a single valid raw deflate stream.
+    """
+    cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+
+    if last:
+        return cmpr.compress(data) + cmpr.flush()
+    else:
+        return cmpr.compress(data) + cmpr.flush(zlib.Z_SYNC_FLUSH)
+
+
 class ZipStream:
     """
+    Iterable generating a ZIP archive chunk by chunk.
+
+    The iteration compresses the files in the calling thread; chunks()
+    deflates them in parallel by the compression pool, for the consumers
+    waiting for its Deferreds (GLStreamProducer).
     """
 
-    def __init__(self, files, compression=ZIP_STORED):
+    def __init__(self, files, compression=ZIP_STORED, workers=None, date_time=None):
         """
-        @param path:
-        @param arc_path:
-        @param compression:
+        @param files: a list of dict with 'name' and 'path' or 'buf'
+        @param compression: ZIP_STORED or ZIP_DEFLATED
+        @param workers: when more than one the files are deflated in
+               parallel by the compression pool, with up to workers * 2
+               blocks in memory.
+        @param date_time: the time assigned to all the files, by default now.
         @return:
         """
 
-        self.files = files
+        # the size of every file is known before starting, so that the
+        # Zip64 extension can be enabled in the local headers where needed,
+        # and the size of a ZIP_STORED archive can be computed.
+        self.files = []
+        for f in files:
+            if 'path' in f:
+                try:
+                    f = dict(f, size=os.path.getsize(f['path']))
+                except OSError as excpd:
+                    log.err("OSError while adding %s to files collection: %s" % (f['path'], excpd))
+                    continue
+            elif 'buf' in f:
+                f = dict(f, size=len(f['buf']))
+            else:
+                continue
+
+            self.files.append(f)
+
         self.compression = compression
 
+        if workers is None:
+            workers = GLSetting.zip_compression_workers
+        self.workers = workers
+
         self.filelist = []              # List of ZipInfo instances for archive
         self.data_ptr = 0               # Keep track of location inside archive
 
-        self.time = time.localtime()[0:6] # Security: Forced Time
+        if date_time is None:
+            date_time = time.localtime()[0:6]
+        self.time = date_time # Security: Forced Time
+
+        # once the size has been announced a file can't be skipped anymore
+        self.sized = False
 
 
     def __iter__(self):
+        return self.archive(self.zip_serial())
+
+
+    def chunks(self):
+        """
+        @return: an iterator of the archive chunks. With the parallel
+                 compression some chunks are Deferreds, fired with the data
+                 when its block has been deflated by the compression pool:
+                 the consumer has to wait for each of them before getting
+                 the next chunk (as done by GLStreamProducer).
+        """
+        if self.compression == ZIP_DEFLATED and zlib and self.workers > 1:
+            return self.archive(self.zip_parallel())
+
+        return iter(self)
+
+
+    def archive(self, members):
+        for data in members:
+            yield data
+
+        yield self.archive_footer()
+
+
+    def zip_serial(self):
         for f in self.files:
 
             log.debug("Compressing (%s)" % f['name'])
 
             if 'path' in f:
                 try:
-                    for data in self.zip_file(f['path'], f['name']):
+                    for data in self.zip_file(f['path'], f['name'], f['size']):
                         yield data
                 except (OSError, IOError) as excpd:
                     log.err("IOError while adding %s to files collection: %s" % (f['path'], excpd))
+                    if self.sized:
+                        raise
 
             elif 'buf' in f:
                 for data in self.zip_buf(f['buf'], f['name']):
                     yield data
 
-        yield self.archive_footer()
+
+    def zip_parallel(self):
+        """
+        Generates the archive members deflating the files in blocks of
+        DEFLATE_BLOCK_SIZE bytes, dispatched to the compression pool.
+
+        The blocks are read in a fixed set of reusable buffers: one buffer
+        is released when its compressed block is emitted, so at most
+        (workers * 2) blocks are in memory. The CRC is computed while the
+        blocks are read, the output keeps the same members layout (header,
+        data, data descriptor) of the serial compression.
+
+        A block still being deflated when it has to be emitted is yielded
+        as a Deferred, instead of waiting for it on the reactor thread.
+        """
+        free_buffers = [bytearray(DEFLATE_BLOCK_SIZE) for _ in range(self.workers * 2)]
+        pending = deque()
+
+        def ready(job):
+            return job[0] != 'block' or job[2]['data'] is not None
+
+        def emit_block(job):
+            _, zinfo, block, buf = job
+            zinfo.compress_size += len(block['data'])
+            if buf is not None:
+                free_buffers.append(buf)
+            return self.update_data_ptr(block['data'])
+
+        def emit(job):
+            if job[0] == 'header':
+                zinfo = job[1]
+                zinfo.header_offset = self.data_ptr
+                return self.update_data_ptr(zinfo.FileHeader())
+
+            elif job[0] == 'block':
+                if ready(job):
+                    return emit_block(job)
+
+                return job[2]['deferred'].addCallback(lambda _: emit_block(job))
+
+            else: # 'end'
+                zinfo = job[1]
+                self.filelist.append(zinfo)
+                return self.update_data_ptr(zinfo.DataDescriptor())
+
+        for job in self.deflate_jobs(free_buffers):
+            pending.append(job)
+
+            # the next read needs a free buffer: the oldest jobs are waited
+            while pending and (not free_buffers or ready(pending[0])):
+                yield emit(pending.popleft())
+
+        while pending:
+            yield emit(pending.popleft())
+
+
+    def deflate_block(self, data, last):
+        """
+        @return: the block dispatched to the compression pool, as a dict
+                 with the 'deferred' of the job and the deflated 'data',
+                 set when it is available.
+        """
+        block = {'data': None}
+
+        def deflated(data):
+            block['data'] = data
+
+        block['deferred'] = deferToThreadPool(reactor, compression_pool,
+                                              deflate_block, data, last)
+        block['deferred'].addCallback(deflated)
+
+        return block
+
+
+    def deflate_jobs(self, free_buffers):
+        """
+        Generates, in archive order, the jobs composing each member:
+            ('header', zinfo)
+            ('block', zinfo, block, buffer) for every block
+            ('end', zinfo)
+        """
+        for f in self.files:
+
+            log.debug("Compressing (%s)" % f['name'])
+
+            zinfo = ZipInfo(f['name'], self.time, self.compression)
+            zinfo.zip64 = self.needs_zip64(f['size'])
+
+            if 'path' in f:
+                try:
+                    fp = open(f['path'], "rb")
+                except (OSError, IOError) as excpd:
+                    log.err("IOError while adding %s to files collection: %s" % (f['path'], excpd))
+                    continue
+
+                yield ('header', zinfo)
+
+                with fp:
+                    last = False
+                    while not last:
+                        buf = free_buffers.pop()
+                        size = fp.readinto(buf)
+                        last = size < len(buf)
+
+                        block = buffer(buf, 0, size)
+                        zinfo.file_size += size
+                        zinfo.CRC = binascii.crc32(block, zinfo.CRC)
+
+                        yield ('block', zinfo, self.deflate_block(block, last), buf)
+
+            elif 'buf' in f:
+                yield ('header', zinfo)
+
+                zinfo.file_size = len(f['buf'])
+                zinfo.CRC = binascii.crc32(f['buf'], zinfo.CRC)
+
+                yield ('block', zinfo, self.deflate_block(f['buf'], True), None)
+
+            else:
+                continue
+
+            yield ('end', zinfo)
+
+
+    def needs_zip64(self, file_size):
+        """
+        The data size of a deflated member may be slightly bigger than the
+        file size, when the content is not compressible.
+        """
+        if self.compression == ZIP_DEFLATED:
+            return file_size * 1.05 > ZIP64_LIMIT
+
+        return file_size > ZIP64_LIMIT
+
+
+    def size(self):
+        """
+        Returns the exact size of a ZIP_STORED archive, computed from the
+        sizes of the files, without reading them: the same headers, data
+        descriptors and central directory generated during the streaming
+        are built without the CRCs (that do not change their length).
+        """
+        assert self.compression == ZIP_STORED
+
+        self.sized = True
+
+        archive = ZipStream([], self.compression, date_time=self.time)
+
+        for f in self.files:
+            zinfo = ZipInfo(f['name'], self.time, self.compression)
+            zinfo.zip64 = self.needs_zip64(f['size'])
+            zinfo.header_offset = archive.data_ptr
+            zinfo.file_size = zinfo.compress_size = f['size']
+
+            archive.data_ptr += len(zinfo.FileHeader()) + f['size'] + len(zinfo.DataDescriptor())
+            archive.filelist.append(zinfo)
+
+        archive.archive_footer()
+
+        return archive.data_ptr
 
 
     def update_data_ptr(self, data):
@@ -251,7 +507,7 @@ class ZipStream:
         return data
 
 
-    def zip_file(self, filename, archive_name):
+    def zip_file(self, filename, archive_name, file_size):
         """
         Generates data to add the file 'filename' with name 'archive_name'
 
@@ -265,6 +521,7 @@ class ZipStream:
         http://www.pkware.com/business_and_developers/developer/appnote/
         """
         zinfo = ZipInfo(archive_name, self.time, self.compression)
+        zinfo.zip64 = self.needs_zip64(file_size)
         zinfo.header_offset = self.data_ptr
         yield self.update_data_ptr(zinfo.FileHeader())
 
@@ -275,7 +532,7 @@ class ZipStream:
 
         with open(filename, "rb") as fp:
             while 1:
-                buf = fp.read(1024 * 8)
+                buf = fp.read(GLSetting.download_chunk_size)
                 if not buf:
                    break
                 zinfo.file_size += len(buf)
@@ -311,6 +568,7 @@ class ZipStream:
         http://www.pkware.com/business_and_developers/developer/appnote/
         """
         zinfo = ZipInfo(archive_name, self.time, self.compression)
+        zinfo.zip64 = self.needs_zip64(len(filebuf))
         zinfo.header_offset = self.data_ptr
 
         yield self.update_data_ptr(zinfo.FileHeader())
@@ -408,7 +666,7 @@ class ZipStream:
 
         pos2 = self.data_ptr
         # Write end-of-zip-archive record
-        if pos1 > ZIP64_LIMIT:
+        if pos1 > ZIP64_LIMIT or pos2 - pos1 > ZIP64_LIMIT or count >= 0xFFFF:
             # Need to write the ZIP64 end-of-archive records
             zip64endrec = struct.pack(structEndArchive64, stringEndArchive64,
                                       44, 45, 45, 0, 0, count, count, pos2 - pos1, pos1)
@@ -418,10 +676,13 @@ class ZipStream:
                                       stringEndArchive64Locator, 0, pos2, 1)
             data.append( self.update_data_ptr(zip64locrec))
 
-            # XXX Why is `pos3` computed next?  It's never referenced.
-            pos3 = self.data_ptr
+            # the values not fitting the classic record are set
+            # to 0xFFFF/0xFFFFFFFF and read from the Zip64 one
+            count16 = min(count, 0xFFFF)
             endrec = struct.pack(structEndArchive, stringEndArchive,
-                                 0, 0, count, count, pos2 - pos1, -1, 0)
+                                 0, 0, count16, count16,
+                                 pos2 - pos1 if pos2 - pos1 <= ZIP64_LIMIT else -1,
+                                 pos1 if pos1 <= ZIP64_LIMIT else -1, 0)
             data.append( self.update_data_ptr(endrec))
 
         else:
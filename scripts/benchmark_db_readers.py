@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Compare the read only transactions run serially on the single DB
+# thread, on a database with the rollback journal (as done before), with
+# the ones run on the pool of reader threads on a database in WAL mode,
+# while a stream of write transactions is committed.
+#
+# usage: python benchmark_db_readers.py [reads] [writes] [reader threads]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+globaleaks_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(globaleaks_path)
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, gatherResults
+from twisted.python.threadpool import ThreadPool
+
+from globaleaks.settings import GLSetting, transact, transact_ro
+from globaleaks.runner import start_thread_pools
+
+ROWS = 20000
+
+@transact
+def create_table(store):
+    store.execute("CREATE TABLE benchmark (id INTEGER PRIMARY KEY, value INTEGER, label VARCHAR)")
+    for i in xrange(ROWS):
+        store.execute("INSERT INTO benchmark (value, label) VALUES (?, ?)", (i % 97, u"label %d" % i))
+
+@transact
+def write(store, i):
+    store.execute("UPDATE benchmark SET value = value + 1 WHERE id = ?", (i % ROWS + 1,))
+
+@transact_ro
+def read(store):
+    return store.execute("SELECT label, SUM(value) FROM benchmark GROUP BY value % 10").get_all()
+
+def setup_database(working_path, options):
+    GLSetting.working_path = working_path
+    GLSetting.db_sqlite_options = options
+    GLSetting.eval_paths()
+    os.makedirs(GLSetting.gldb_path)
+
+@inlineCallbacks
+def measure(reads, writes):
+    latencies = []
+
+    def timed_read():
+        start = time.time()
+        d = read()
+        d.addCallback(lambda result: latencies.append(time.time() - start))
+        return d
+
+    start = time.time()
+    deferreds = []
+    for i in xrange(max(reads, writes)):
+        if i < writes:
+            deferreds.append(write(i))
+        if i < reads:
+            deferreds.append(timed_read())
+
+    yield gatherResults(deferreds)
+    elapsed = time.time() - start
+
+    latencies.sort()
+    print "%d reads and %d writes in %.2fs: %.0f reads/s, median read latency %.1fms, 95%% %.1fms" % \
+        (reads, writes, elapsed, reads / elapsed,
+         latencies[len(latencies) / 2] * 1000,
+         latencies[int(len(latencies) * 0.95)] * 1000)
+
+@inlineCallbacks
+def main():
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    writes = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else GLSetting.db_reader_thread_pool_size
+
+    wal_options = GLSetting.db_sqlite_options
+    pool = transact_ro.tp
+    working_paths = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+
+    try:
+        print "serialized, rollback journal:",
+        setup_database(working_paths[0], {'foreign_keys': 'ON'})
+        transact_ro.tp = transact.tp
+        yield create_table()
+        yield measure(reads, writes)
+
+        print "%d readers, WAL:" % readers,
+        setup_database(working_paths[1], wal_options)
+        transact_ro.tp = ThreadPool(0, readers)
+        transact_ro.tp.start()
+        yield create_table()
+        yield measure(reads, writes)
+        transact_ro.tp.stop()
+    finally:
+        transact_ro.tp = pool
+        for working_path in working_paths:
+            shutil.rmtree(working_path)
+        reactor.stop()
+
+if __name__ == '__main__':
+    start_thread_pools()
+    reactor.callWhenRunning(main)
+    reactor.run()
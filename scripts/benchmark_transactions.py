@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# Compare the overhead of the transactions opening a new store (as done
+# before) with the ones reusing the store kept by their thread: the first
+# pay on every transaction the connection setup, the pragmas and a cold
+# statement cache.
+#
+# usage: python benchmark_transactions.py [transactions]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+globaleaks_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(globaleaks_path)
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.settings import GLSetting, transact, transact_ro
+from globaleaks.runner import start_thread_pools
+
+ROWS = 1000
+
+@transact
+def create_table(store):
+    store.execute("CREATE TABLE benchmark (id INTEGER PRIMARY KEY, value INTEGER)")
+    for i in xrange(ROWS):
+        store.execute("INSERT INTO benchmark (value) VALUES (?)", (i,))
+
+@transact
+def write(store, i):
+    store.execute("UPDATE benchmark SET value = value + 1 WHERE id = ?", (i % ROWS + 1,))
+
+@transact_ro
+def read(store, i):
+    return store.execute("SELECT value FROM benchmark WHERE id = ?", (i % ROWS + 1,)).get_one()
+
+@inlineCallbacks
+def measure(label, transaction, count, reopen):
+    start = time.time()
+    for i in xrange(count):
+        if reopen:
+            transact.reset_stores()
+        yield transaction(i)
+    elapsed = time.time() - start
+
+    print "%-40s %d in %.2fs: %.0f/s, %.3fms per transaction" % \
+        (label, count, elapsed, count / elapsed, elapsed * 1000 / count)
+
+@inlineCallbacks
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    working_path = tempfile.mkdtemp()
+
+    try:
+        GLSetting.working_path = working_path
+        GLSetting.eval_paths()
+        os.makedirs(GLSetting.gldb_path)
+        yield create_table()
+
+        for label, transaction in [('read only', read), ('write', write)]:
+            yield measure("%s, new store:" % label, transaction, count, True)
+            yield measure("%s, store of the thread:" % label, transaction, count, False)
+    finally:
+        shutil.rmtree(working_path)
+        reactor.stop()
+
+if __name__ == '__main__':
+    start_thread_pools()
+    reactor.callWhenRunning(main)
+    reactor.run()
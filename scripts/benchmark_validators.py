@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# Compare the validation of the REST messages walking the templates of
+# globaleaks/rest/requests.py (as done before the compiled validators)
+# with the validators compiled by globaleaks.rest.validation.
+#
+# usage: python benchmark_validators.py [iterations]
+
+import os
+import re
+import sys
+import time
+import collections
+
+globaleaks_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(globaleaks_path)
+
+from globaleaks.rest import requests
+from globaleaks.rest.validation import template_validator
+from globaleaks.utils.utility import log
+from globaleaks.third_party.rstr import xeger
+
+# the failures are not expected, and the logs would only add noise
+log.err = lambda msg: None
+
+
+def legacy_validate_type(value, gl_type):
+    if callable(gl_type):
+        if value is None:
+            return True
+        if gl_type == int:
+            try:
+                int(value)
+                return True
+            except Exception:
+                return False
+        if gl_type == bool:
+            if value == u'true' or value == u'false':
+                return True
+        return isinstance(value, gl_type)
+    elif isinstance(gl_type, collections.Mapping):
+        return legacy_validate_jmessage(value, gl_type)
+    elif isinstance(gl_type, str):
+        if isinstance(value, (str, unicode)):
+            return bool(re.match(gl_type, value))
+        return False
+    elif isinstance(gl_type, collections.Iterable):
+        if len(value) == 0:
+            return True
+        return all(legacy_validate_type(x, gl_type[0]) for x in value)
+
+def legacy_validate_jmessage(jmessage, message_template):
+    if isinstance(message_template, dict):
+        valid_jmessage = {}
+        for key in message_template.keys():
+            if key not in jmessage:
+                raise Exception('missing %s' % key)
+            valid_jmessage[key] = jmessage[key]
+
+        jmessage = valid_jmessage
+
+        for key, value in message_template.iteritems():
+            if not legacy_validate_type(jmessage[key], value):
+                raise Exception("integrity check 1, fail in %s" % key)
+
+        for key, value in jmessage.iteritems():
+            if not legacy_validate_type(value, message_template[key]):
+                raise Exception("integrity check 2, fail in %s" % key)
+
+        return True
+
+    elif isinstance(message_template, list):
+        return all(legacy_validate_type(x, message_template[0]) for x in jmessage)
+
+
+def sample_message(gl_type):
+    """
+    Build a message matching a template, with lists of three elements.
+    """
+    if gl_type == int:
+        return 42
+    elif gl_type == float:
+        return 4.2
+    elif gl_type == bool:
+        return True
+    elif gl_type == unicode:
+        return u'antani'
+    elif callable(gl_type):
+        return gl_type()
+    elif isinstance(gl_type, collections.Mapping):
+        return dict((key, sample_message(value)) for key, value in gl_type.iteritems())
+    elif isinstance(gl_type, str):
+        # xeger can produce a newline for '.', that the regexp does not match
+        while True:
+            sample = unicode(xeger(gl_type))
+            if re.match(gl_type, sample):
+                return sample
+    else:
+        return [sample_message(gl_type[0]) for x in range(3)]
+
+def measure(validate, message, template, iterations):
+    start = time.time()
+    for x in xrange(iterations):
+        validate(message, template)
+    return time.time() - start
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    templates = [(name, template) for name, template in sorted(vars(requests).iteritems())
+                 if not name.startswith('_') and isinstance(template, dict)]
+
+    compiled = lambda message, template: template_validator(template)(message)
+
+    legacy_total = compiled_total = 0
+    print "%-30s %12s %12s %8s" % ("template", "legacy (us)", "compiled (us)", "speedup")
+
+    for name, template in templates:
+        message = sample_message(template)
+
+        assert legacy_validate_jmessage(message, template)
+        assert compiled(message, template)
+
+        legacy = measure(legacy_validate_jmessage, message, template, iterations)
+        fast = measure(compiled, message, template, iterations)
+
+        legacy_total += legacy
+        compiled_total += fast
+
+        print "%-30s %12.1f %12.1f %7.1fx" % (name,
+                                             legacy * 1e6 / iterations,
+                                             fast * 1e6 / iterations,
+                                             legacy / fast)
+
+    print "%-30s %12.1f %12.1f %7.1fx" % ("total",
+                                         legacy_total * 1e6 / iterations,
+                                         compiled_total * 1e6 / iterations,
+                                         legacy_total / compiled_total)
+
+if __name__ == '__main__':
+    main()
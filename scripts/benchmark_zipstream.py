@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Compare the throughput of the serial and of the parallel deflate
+# compression of ZipStream on a multi-file tip.
+#
+# usage: python benchmark_zipstream.py [files number] [file size in MB] [workers]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import zipfile
+import StringIO
+
+globaleaks_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(globaleaks_path)
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue, Deferred
+
+from globaleaks.utils import zipstream
+from globaleaks.utils.zipstream import ZipStream, ZIP_DEFLATED
+from globaleaks.runner import start_thread_pools
+
+def create_files(directory, files_number, file_size):
+    files = []
+    # random text on a small alphabet, to have a realistic compression ratio
+    alphabet = "etaoin shrdlu\n"
+    table = ''.join(alphabet[i % len(alphabet)] for i in range(256))
+
+    for i in range(files_number):
+        path = os.path.join(directory, "file%d" % i)
+        with open(path, 'wb') as f:
+            written = 0
+            while written < file_size:
+                block = os.urandom(1024 * 1024).translate(table)
+                f.write(block)
+                written += len(block)
+
+        files.append({'path': path, 'name': "file%d.txt" % i})
+
+    return files
+
+@inlineCallbacks
+def benchmark(files, workers):
+    start = time.time()
+    archive_size = 0
+    output = StringIO.StringIO()
+
+    # the parallel compression yields the blocks still being deflated as
+    # Deferreds, waited as done by GLStreamProducer
+    for data in ZipStream(files, ZIP_DEFLATED, workers).chunks():
+        if isinstance(data, Deferred):
+            data = yield data
+        archive_size += len(data)
+        output.write(data)
+
+    elapsed = time.time() - start
+
+    assert zipfile.ZipFile(output, 'r').testzip() is None
+
+    returnValue((elapsed, archive_size))
+
+@inlineCallbacks
+def main():
+    files_number = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    file_size = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    directory = tempfile.mkdtemp()
+    zipstream.compression_pool.adjustPoolsize(maxthreads=workers)
+
+    try:
+        files = create_files(directory, files_number, file_size * 1024 * 1024)
+        total_mb = files_number * file_size
+
+        print "Compressing %d files of %dMB" % (files_number, file_size)
+
+        for w in [1, workers]:
+            elapsed, archive_size = yield benchmark(files, w)
+            print "%d worker(s): %.2fs, %.2f MB/s, archive of %d bytes" % \
+                  (w, elapsed, total_mb / elapsed, archive_size)
+    finally:
+        shutil.rmtree(directory)
+        reactor.stop()
+
+if __name__ == '__main__':
+    start_thread_pools()
+    reactor.callWhenRunning(main)
+    reactor.run()